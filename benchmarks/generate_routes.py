@@ -0,0 +1,338 @@
+import os
+import sys
+import copy
+import random
+import hashlib
+import zipfile
+import argparse
+from collections import namedtuple
+from openpyxl import Workbook
+from openpyxl.styles.fills import PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.writer.write_only import WriteOnlyCell
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import route_compare as rc
+from sheet_reader import SheetReader
+
+'''
+Synthetic route workbook generator
+
+Writes a workbook laid out like the Flow Report export the macro runs on: a Home sheet and the
+RTE, SM and MM sheets, each with the 'Flow Report' title, the 'Full Oper Num' header and one row per
+operation plus its user data set rows. The routes are built from one production (MM) route:
+    SM is MM as staged, RTE is SM with the submitted changes applied
+The knobs set how many operations differ and how: changed inside the scope of change (orange),
+changed outside it (blue) or already in production (neutralized by MM), inserted, removed and
+red-flagged for removal. The same settings and seed always produce the same workbook.
+'''
+
+'''
+@GeneratorSettings: knobs of a generated workbook, fractions are of the number of operations
+    @operations: operations in the production route
+    @diff_density: operations changed between RTE and SM
+    @in_scope: share of the changed operations highlighted as part of change in RTE
+    @neutralized: share of the out of scope changes that MM neutralizes (SM matches production)
+    @inserted: operations only in RTE
+    @removed: operations only in SM
+    @red_removals: RTE operations with the red removal fill
+    @multi_row: operations with extra user data set rows
+    @max_uds_rows: most extra user data set rows one operation gets
+    @seed: random seed
+'''
+GeneratorSettings = namedtuple('GeneratorSettings', ['operations', 'diff_density', 'in_scope', 'neutralized', 'inserted',
+                                                     'removed', 'red_removals', 'multi_row', 'max_uds_rows', 'seed'])
+DEFAULT_SETTINGS = GeneratorSettings(operations=1000, diff_density=0.05, in_scope=0.5, neutralized=0.5, inserted=0.01,
+                                     removed=0.01, red_removals=0.005, multi_row=0.3, max_uds_rows=4, seed=1)
+
+ROUTE_ID = 'BENCH.ROUTE.01'
+PRODUCT_ID = 'BENCH-PRODUCT'
+
+CHANGE_FILL = PatternFill(patternType='solid', fgColor='FFFFFF00')
+RED_FILL = PatternFill(patternType='solid', fgColor=rc.RED)
+
+#Column indexes in rc.OUTPUT_HEADERS
+UDS_COLUMNS = (10, 11, 12, 13)
+NUMBER_COLUMNS = (27, 28, 29)
+
+DEPARTMENTS = ['DIFF', 'ETCH', 'LITH', 'CMP', 'IMP', 'MET', 'WET', 'METRO']
+PD_TYPES = ['Process', 'Measurement', 'Dummy']
+CARRIER_CATEGORIES = ['FEOL', 'MOL', 'BEOL']
+
+class GeneratedOperation():
+
+    '''
+    one operation of a generated route
+    @rows: list of row value lists, rc.NUM_OUTPUT_COLS values each
+    @changed: (row, column) cells that get the change fill
+    @red: every cell gets the red removal fill
+    '''
+    def __init__(self, rows):
+        self.rows = rows
+        self.changed = set()
+        self.red = False
+
+'''
+returns the operation number of the index-th production operation, 'XXXX.XXXX' with room between neighbours
+@param inserted: number of the operation inserted right after it instead
+'''
+def make_operation_no(index, inserted=False):
+    return '%d.%04d' % (1000 + index // 10, (index % 10) * 1000 + (500 if inserted else 0))
+
+'''
+builds one operation's rows with realistic looking values
+@param rng: random.Random
+@param index: operation index, keeps values unique per operation
+@param operation_no: operation number written in 'Full Oper Num'
+@param uds_rows: number of extra user data set rows
+'''
+def make_operation(rng, index, operation_no, uds_rows):
+    department = rng.choice(DEPARTMENTS)
+    module = index // 25
+    first_row = [
+        'Comment %d' % index if rng.random() < 0.1 else None,
+        operation_no,
+        'MOD%04d' % module,
+        'Module %d %s' % (module, department),
+        'PD.%06d.01' % index,
+        'L%02d' % rng.randrange(40) if department == 'LITH' else None,
+        rng.choice(PD_TYPES),
+        '%s_%06d' % (department, index),
+        '%s step %d' % (department, index),
+        department,
+        'SPC_CHART',
+        'CH%05d' % rng.randrange(100000),
+        'OP_FLAG',
+        rng.choice(['Y', 'N']),
+        rng.choice(['Y', 'N']),
+        rng.choice(CARRIER_CATEGORIES),
+        'Equipment',
+        '%s_EQ_GROUP_%02d' % (department, rng.randrange(20)),
+        'LR.%06d' % index,
+        '%s recipe %d' % (department, index),
+        'PRE1_%s' % department if rng.random() < 0.3 else None,
+        'PRE2_%s' % department if rng.random() < 0.1 else None,
+        'POST_%s' % department if rng.random() < 0.3 else None,
+        '%s%03d' % (department, rng.randrange(200)),
+        'RCP_%06d' % index,
+        'Recipe %d' % index,
+        'ST%02d' % (module % 60),
+        round(rng.uniform(1, 120), 2),
+        round(rng.uniform(0, 60), 2),
+        rng.randrange(5, 200),
+    ]
+    rows = [first_row]
+    for uds_row in range(uds_rows):
+        row = [None] * rc.NUM_OUTPUT_COLS
+        row[UDS_COLUMNS[0]] = 'PD_UDS_%d' % uds_row
+        row[UDS_COLUMNS[1]] = 'PV%d_%d' % (index, uds_row)
+        row[UDS_COLUMNS[2]] = 'OP_UDS_%d' % uds_row
+        row[UDS_COLUMNS[3]] = 'OV%d_%d' % (index, uds_row)
+        rows.append(row)
+    return rows
+
+'''
+returns a changed copy of a cell value, numbers stay numbers
+'''
+def change_value(value, column):
+    if column in NUMBER_COLUMNS:
+        return (value or 0) + 1
+    return (value or '') + '_CHG'
+
+'''
+builds the RTE, SM and MM routes for the settings
+@return: (rte, sm, mm) lists of (operation number, GeneratedOperation) in sheet order
+'''
+def build_routes(settings):
+    rng = random.Random(settings.seed)
+    count = settings.operations
+
+    mm = []
+    for index in range(count):
+        uds_rows = rng.randint(1, settings.max_uds_rows) if rng.random() < settings.multi_row else 0
+        operation_no = make_operation_no(index)
+        mm.append((operation_no, GeneratedOperation(make_operation(rng, index, operation_no, uds_rows))))
+    sm = copy.deepcopy(mm)
+    rte = copy.deepcopy(sm)
+
+    #Each production operation gets at most one role so the counts don't overlap
+    roles = list(range(count))
+    rng.shuffle(roles)
+    removed = set(roles[:int(count * settings.removed)])
+    roles = roles[len(removed):]
+    red = set(roles[:int(count * settings.red_removals)])
+    roles = roles[len(red):]
+    changed = roles[:int(count * settings.diff_density)]
+
+    for index in changed:
+        operation = rte[index][1]
+        row = rng.randrange(len(operation.rows))
+        #Some changes add a user data set row instead of editing a value
+        if row > 0 and rng.random() < 0.2:
+            operation.rows.insert(row, list(operation.rows[row]))
+            operation.rows[row][UDS_COLUMNS[3]] = change_value(operation.rows[row][UDS_COLUMNS[3]], UDS_COLUMNS[3])
+            column = UDS_COLUMNS[3]
+        else:
+            columns = UDS_COLUMNS if row > 0 else [column for column in range(2, rc.NUM_OUTPUT_COLS)]
+            column = rng.choice(columns)
+            operation.rows[row][column] = change_value(operation.rows[row][column], column)
+
+        if rng.random() < settings.in_scope:
+            operation.changed.add((row, column))
+        elif rng.random() >= settings.neutralized:
+            #Production differs from SM too, so MM can't neutralize the change
+            mm_operation = mm[index][1]
+            mm_operation.rows[0][8] = change_value(mm_operation.rows[0][8], 8)
+
+    for index in red:
+        rte[index][1].red = True
+
+    #New RTE operations are highlighted in full, they are entirely part of change
+    inserted = {}
+    for position in rng.sample(range(count), int(count * settings.inserted)):
+        operation_no = make_operation_no(position, inserted=True)
+        operation = GeneratedOperation(make_operation(rng, count + position, operation_no, 0))
+        operation.changed = set((0, column) for column in range(1, rc.NUM_OUTPUT_COLS))
+        inserted[position] = (operation_no, operation)
+
+    submitted = []
+    for index, pair in enumerate(rte):
+        if index not in removed:
+            submitted.append(pair)
+        if index in inserted:
+            submitted.append(inserted[index])
+    return submitted, sm, mm
+
+'''
+writes one route sheet in the Flow Report layout
+@param workbook: write-only openpyxl Workbook
+@param sheetname: rc.RTE_SHEET, rc.SM_SHEET or rc.MM_SHEET
+@param label: validation string of the sheet's 'Flow Report' title
+@param operations: list of (operation number, GeneratedOperation)
+@return: number of rows written
+'''
+def write_route_sheet(workbook, sheetname, label, operations):
+    sheet = workbook.create_sheet(sheetname)
+    sheet.append(['Flow Report (' + label + '): ' + ROUTE_ID + ', ' + PRODUCT_ID])
+    sheet.append(['Generated by benchmarks/generate_routes.py'])
+    sheet.append([])
+    sheet.append([])
+    sheet.append(rc.OUTPUT_HEADERS)
+    sheet.append(['Operation Level'] + [None] * (rc.NUM_OUTPUT_COLS - 1))
+    rows = 6
+
+    for operation_no, operation in operations:
+        rows += len(operation.rows)
+        for row_index, row in enumerate(operation.rows):
+            if operation.red or operation.changed:
+                cells = []
+                for column, value in enumerate(row):
+                    if value != None and (operation.red or (row_index, column) in operation.changed):
+                        cell = WriteOnlyCell(sheet, value=value)
+                        cell.fill = RED_FILL if operation.red else CHANGE_FILL
+                        cells.append(cell)
+                    else:
+                        cells.append(value)
+                sheet.append(cells)
+            else:
+                sheet.append(row)
+    return rows
+
+'''
+adds the <dimension> element Excel writes to every sheet, openpyxl's write-only mode leaves it out
+    and openpyxl's read-only worksheet needs it to know the sheet's size
+@param path: saved workbook, rewritten in place
+@param sizes: sheet name -> (rows, columns)
+'''
+def add_dimensions(path, sizes):
+    reader = SheetReader(path)
+    parts = {reader.sheet_parts[sheetname]: size for sheetname, size in sizes.items()}
+    reader.close()
+
+    temp_path = path + '.dimensions'
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = source.read(info.filename)
+            if info.filename in parts:
+                rows, columns = parts[info.filename]
+                dimension = ('<dimension ref="A1:%s%d" />' % (get_column_letter(columns), rows)).encode('utf-8')
+                position = data.find(b'<sheetViews')
+                if position < 0:
+                    position = data.find(b'<sheetData')
+                data = data[:position] + dimension + data[position:]
+            target.writestr(info, data)
+    os.replace(temp_path, path)
+
+'''
+writes the generated routes to a workbook
+@param path: .xlsx file to write
+@param settings: GeneratorSettings
+'''
+def write_workbook(path, settings):
+    rte, sm, mm = build_routes(settings)
+    workbook = Workbook(write_only=True)
+    home = workbook.create_sheet(rc.HOME_SHEET)
+    home.append(['Synthetic route workbook'])
+    home.append([str(dict(settings._asdict()))])
+    sizes = {rc.HOME_SHEET: (2, 1)}
+    for sheetname, label, operations in [(rc.RTE_SHEET, rc.RTE_VALIDATION, rte), (rc.SM_SHEET, rc.SM_VALIDATION, sm), (rc.MM_SHEET, rc.MM_VALIDATION, mm)]:
+        sizes[sheetname] = (write_route_sheet(workbook, sheetname, label, operations), rc.NUM_OUTPUT_COLS)
+    workbook.save(path)
+    add_dimensions(path, sizes)
+
+'''
+returns the file name of a generated workbook, unique per settings
+'''
+def workbook_name(settings):
+    digest = hashlib.sha1(repr(tuple(settings)).encode('utf-8')).hexdigest()[:10]
+    return 'routes_%dops_%s.xlsx' % (settings.operations, digest)
+
+'''
+returns the path of the workbook for the settings, generating it if it isn't in the directory yet
+@param settings: GeneratorSettings
+@param directory: folder holding generated workbooks, created if missing
+'''
+def generate(settings, directory):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, workbook_name(settings))
+    if not os.path.exists(path):
+        temp_path = path + '.tmp'
+        write_workbook(temp_path, settings)
+        os.replace(temp_path, path)
+    return path
+
+'''
+adds one command line option per generator knob, defaults from DEFAULT_SETTINGS
+'''
+def add_settings_arguments(parser):
+    for field in GeneratorSettings._fields:
+        if field == 'operations':
+            continue
+        default = getattr(DEFAULT_SETTINGS, field)
+        parser.add_argument('--' + field.replace('_', '-'), type=type(default), default=default,
+                            help='default %(default)s')
+
+'''
+builds GeneratorSettings from parsed arguments
+'''
+def settings_from_arguments(args, operations):
+    return DEFAULT_SETTINGS._replace(operations=operations,
+                                     **{field: getattr(args, field) for field in GeneratorSettings._fields if field != 'operations'})
+
+'''
+command line entry point, writes one workbook per requested size
+'''
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write synthetic RTE/SM/MM route workbooks.')
+    parser.add_argument('operations', type=int, nargs='+', help='number of operations, one workbook per value')
+    parser.add_argument('-o', '--output', default='.', help='directory for the workbooks')
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    for operations in args.operations:
+        print('[+]' + generate(settings_from_arguments(args, operations), args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import datetime as dt
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import route_compare as rc
+from metrics import METRICS, BYTES_WRITTEN
+import generate_routes as gen
+
+'''
+Route compare benchmark suite
+
+Generates (or reuses) synthetic route workbooks at each size and times the compare phase by phase:
+    load_route          parsing the RTE, SM and MM sheets
+    align_rows          aligning the rows of each differing operation pair (align_operation_rows)
+    compare_routes      aligning and comparing the routes, without the row alignment or rendering
+    render_difference   rendering the differing operations to the report
+    save                writing the report .xlsx
+Each run is appended to a JSON lines history file. A phase that got slower than the last run
+with the same size, knobs and loader options is reported as a regression.
+
+    python benchmarks/run_benchmarks.py                      1k, 10k and 100k operations
+    python benchmarks/run_benchmarks.py --sizes 1000 --repeat 5
+'''
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'route_compare_bench')
+HISTORY_FILE = 'history.jsonl'
+PHASES = ['load_route', 'align_rows', 'compare_routes', 'render_difference', 'save']
+#Phases that used to be timed as part of another phase, a run before the split isn't compared on either
+SPLIT_PHASES = {'align_rows': 'compare_routes'}
+#A phase this much slower than the previous run is a regression
+DEFAULT_THRESHOLD = 0.2
+
+'''
+returns the current git commit of the repository, '' outside a git checkout
+'''
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+'''
+runs one compare of a generated workbook, timing each phase from the spans route_compare records in METRICS
+    route_compare logs at its quiet default level, so the per operation messages cost nothing here
+@param workbook_path: generated workbook
+@param output_path: report file to write
+@param reader: rc.RAW_READER or rc.OPENPYXL_READER
+@param lazy_mm: load the MM sheet as a LazyRoute
+@return: (OrderedDict of phase -> seconds, dict of result counts)
+'''
+def run_once(workbook_path, output_path, reader, lazy_mm):
+    METRICS.reset()
+    rte_route, sm_route, mm_route = rc.load_routes_from_file(workbook_path, [rc.RTE_SHEET, rc.SM_SHEET, rc.MM_SHEET], reader=reader,
+                                                             lazy_sheets=[rc.MM_SHEET] if lazy_mm else ())
+    workbook = rc.init_write_only_output()
+    report = workbook[rc.OUTPUT_TAB]
+    rc.compare_routes(report, rte_route, sm_route, mm_route)
+    rc.save_report(workbook, output_path)
+
+    #Spans nest (align_rows and render_difference inside compare_routes), each benchmark phase is exclusive
+    #compare_routes sets the rows of every difference before rendering it, so align_rows is never inside render_difference
+    spans = METRICS.get_phase_times()
+    timings = OrderedDict([
+        ('load_route', spans.get('open_workbook', 0.0) + spans.get('load_route', 0.0)),
+        ('align_rows', spans.get('align_rows', 0.0)),
+        ('compare_routes', spans['compare_routes'] - spans.get('align_rows', 0.0) - spans.get('render_difference', 0.0)),
+        ('render_difference', spans.get('render_difference', 0.0)),
+        ('save', spans['format_output'] + spans['save']),
+    ])
+    results = {
+        'rte_operations': rte_route.get_num_operations(),
+        'sm_operations': sm_route.get_num_operations(),
+        'mm_operations': mm_route.get_num_operations(),
+        'orange_diffs': sum(report.orange_counts),
+        'blue_diffs': sum(report.blue_counts),
+        'report_bytes': METRICS.counters[BYTES_WRITTEN],
+    }
+    return timings, results
+
+'''
+benchmarks one workbook size, keeping the fastest time of each phase over the repeats
+@return: history record of the run
+'''
+def run_size(settings, directory, repeat, reader, lazy_mm):
+    workbook_path = gen.generate(settings, directory)
+    output_path = os.path.join(directory, 'report_%dops.xlsx' % settings.operations)
+
+    best = None
+    for attempt in range(repeat):
+        timings, results = run_once(workbook_path, output_path, reader, lazy_mm)
+        if best == None:
+            best = timings
+        else:
+            best = OrderedDict((phase, min(best[phase], timings[phase])) for phase in PHASES)
+
+    return OrderedDict([
+        ('time', dt.datetime.now().isoformat(timespec='seconds')),
+        ('commit', get_commit()),
+        ('operations', settings.operations),
+        ('settings', settings._asdict()),
+        ('reader', reader),
+        ('lazy_mm', lazy_mm),
+        ('repeat', repeat),
+        ('timings', OrderedDict((phase, round(best[phase], 4)) for phase in PHASES)),
+        ('results', results),
+    ])
+
+'''
+returns the last history record benchmarked under the same conditions as record, None if there is none
+'''
+def find_previous(history_path, record):
+    previous = None
+    if not os.path.exists(history_path):
+        return previous
+    with open(history_path) as history_file:
+        for line in history_file:
+            entry = json.loads(line)
+            if all(entry.get(field) == record[field] for field in ('settings', 'reader', 'lazy_mm')):
+                previous = entry
+    return previous
+
+'''
+prints a record's phase timings next to the previous run's
+@return: list of phases that regressed by more than threshold
+'''
+def print_record(record, previous, threshold):
+    print('[+]%d operations (%s reader%s): %d orange, %d blue, report %d bytes' % (
+        record['operations'], record['reader'], ', lazy MM' if record['lazy_mm'] else '',
+        record['results']['orange_diffs'], record['results']['blue_diffs'], record['results']['report_bytes']))
+    regressions = []
+    #A phase split out since the previous run leaves the phase it came from not comparable
+    split = [SPLIT_PHASES[phase] for phase in SPLIT_PHASES if previous != None and phase not in previous['timings']]
+    for phase in PHASES:
+        seconds = record['timings'][phase]
+        line = '\t%-18s %9.3fs' % (phase, seconds)
+        if phase in split:
+            line += '   (not compared, %s was part of it in %s)' % (
+                ', '.join(name for name in SPLIT_PHASES if SPLIT_PHASES[name] == phase), previous['commit'] or previous['time'])
+        elif previous != None and previous['timings'].get(phase):
+            change = seconds / previous['timings'][phase] - 1
+            line += '   %+6.1f%% vs %s' % (change * 100, previous['commit'] or previous['time'])
+            if change > threshold:
+                line += '   [X]REGRESSION'
+                regressions.append(phase)
+        print(line)
+    return regressions
+
+'''
+command line entry point
+@return: 1 if a phase regressed, 0 otherwise
+'''
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark route_compare phase by phase on generated route workbooks.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='operations per workbook (default %(default)s)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per size, the fastest time of each phase is kept')
+    parser.add_argument('--directory', default=DEFAULT_DIRECTORY, help='generated workbooks, reports and %s (default %%(default)s)' % HISTORY_FILE)
+    parser.add_argument('--reader', choices=rc.SHEET_READERS, default=rc.RAW_READER, help='sheet reader (default %(default)s)')
+    parser.add_argument('--lazy-mm', action='store_true', help='load the MM sheet as a lazy route')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='slowdown counted as a regression (default %(default)s)')
+    parser.add_argument('--no-history', action='store_true', help='don\'t record this run')
+    gen.add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    history_path = os.path.join(args.directory, HISTORY_FILE)
+    regressions = []
+    for operations in args.sizes:
+        settings = gen.settings_from_arguments(args, operations)
+        record = run_size(settings, args.directory, args.repeat, args.reader, args.lazy_mm)
+        previous = find_previous(history_path, record)
+        regressions += print_record(record, previous, args.threshold)
+        if not args.no_history:
+            with open(history_path, 'a') as history_file:
+                history_file.write(json.dumps(record) + '\n')
+
+    if regressions:
+        print('[X]Regressions in:', ', '.join(sorted(set(regressions))))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+from operator import ne
+from itertools import chain, repeat
+
+#NumPy is optional, without it (or for a handful of rows) the cells are compared one by one
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+'''
+Vectorized cell comparison
+
+The rows of the aligned operations of a batch are packed into one dense rows x columns boolean
+array, plus a vector of each row's fill flags. The cells themselves are still compared one by one
+(operator.ne mapped over the row tuples, which keeps Python's != so 10 and 10.0 are equal); NumPy
+only turns the results into the changed and orange (part of change) masks of every row in one pass.
+They're handed back as the same column bitmasks the cell-by-cell compare produces. On the benchmark
+workbooks this runs at about the speed of the plain loop, it saves the per-cell bit twiddling only.
+'''
+
+#Fewer aligned rows than this are compared cell by cell, packing them would cost more than it saves
+VECTOR_MIN_ROWS = 32
+#Bitmasks are built in int64, wider rows are compared cell by cell
+VECTOR_MAX_COLUMNS = 62
+#Values a one-sided row's cell can hold without being highlighted
+EMPTY_VALUES = ('', None)
+
+'''
+compares aligned rows, in one vectorized pass for batches of VECTOR_MIN_ROWS rows or more
+@param aligned: list of (rte values, sm values, flags), values are tuples, None for the missing side
+    flags are the fill flags of the RTE row (of the present side for a one-sided row), see OperationRow
+@return: (changed, orange) lists of column bitmasks, one per row
+    a column is changed if the values differ, or for a one-sided row if it isn't empty;
+    it's orange if it's changed and its flag bit (column + 1) is set
+'''
+def diff_cells(aligned):
+    if np != None and len(aligned) >= VECTOR_MIN_ROWS:
+        width = max(len(values) for row in aligned for values in row[:2] if values != None)
+        if width <= VECTOR_MAX_COLUMNS:
+            return diff_cells_vectorized(aligned, width)
+
+    changed_masks = []
+    orange_masks = []
+    for rte_values, sm_values, flags in aligned:
+        changed = 0
+        if rte_values != None and sm_values != None:
+            for column, (rte_value, sm_value) in enumerate(zip(rte_values, sm_values)):
+                if rte_value != sm_value:
+                    changed |= 1 << column
+        else:
+            for column, value in enumerate(rte_values if rte_values != None else sm_values):
+                if value != '' and value != None:
+                    changed |= 1 << column
+        changed_masks.append(changed)
+        orange_masks.append(changed & (flags >> 1))
+    return changed_masks, orange_masks
+
+'''
+yields iterables of width booleans per aligned row: True where a two-sided row's values differ,
+    True where a one-sided row's value is empty (diff_cells_vectorized inverts those)
+    cells past the end of the shorter row are False for a two-sided row, empty for a one-sided one
+'''
+def iter_cell_flags(aligned, width):
+    for rte_values, sm_values, flags in aligned:
+        if rte_values != None and sm_values != None:
+            yield map(ne, rte_values, sm_values)
+            if len(rte_values) != width or len(sm_values) != width:
+                yield repeat(False, width - min(len(rte_values), len(sm_values)))
+        else:
+            values = rte_values if rte_values != None else sm_values
+            yield map(EMPTY_VALUES.__contains__, values)
+            if len(values) != width:
+                yield repeat(True, width - len(values))
+
+'''
+diff_cells for a batch of rows, as one vectorized pass over the packed batch
+@param aligned: see diff_cells
+@param width: length of the longest row of the batch
+'''
+def diff_cells_vectorized(aligned, width):
+    cells = np.fromiter(chain.from_iterable(iter_cell_flags(aligned, width)), dtype=bool, count=len(aligned) * width).reshape(len(aligned), width)
+    one_sided = np.fromiter((row[0] == None or row[1] == None for row in aligned), dtype=bool, count=len(aligned))
+    changed = cells ^ one_sided[:, None]
+
+    flags = np.fromiter((row[2] for row in aligned), dtype=np.int64, count=len(aligned))
+    orange = changed & ((flags[:, None] >> np.arange(1, width + 1)) & 1 == 1)
+
+    bits = np.left_shift(1, np.arange(width, dtype=np.int64))
+    return (changed.astype(np.int64) @ bits).tolist(), (orange.astype(np.int64) @ bits).tolist()
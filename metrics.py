@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from collections import OrderedDict, namedtuple
+
+'''
+Compare instrumentation
+
+Spans time each phase of a compare (parse, align, compare, render, format, save) and counters
+tally the hot-path work done inside them. Everything is collected by the process-wide METRICS
+object; worker processes send theirs back with to_dict and the parent folds them in with merge.
+The results are written as JSON (phase totals, counters and every span) or as a Chrome trace,
+which chrome://tracing and https://ui.perfetto.dev open as a timeline.
+'''
+
+#Counters kept by route_compare
+OPERATIONS_PARSED = 'operations_parsed'
+OPERATIONS_FLAGGED = 'operations_flagged'
+EQUALITY_CHECKS = 'equality_checks'
+MM_NEUTRALIZATIONS = 'mm_neutralizations'
+CELLS_CREATED = 'cells_created'
+BYTES_WRITTEN = 'bytes_written'
+BLOCKS_REUSED = 'blocks_reused'
+
+#Short labels of the counters in the one-line summary
+SUMMARY_LABELS = OrderedDict([
+    (OPERATIONS_PARSED, 'ops parsed'),
+    (OPERATIONS_FLAGGED, 'flagged'),
+    (EQUALITY_CHECKS, 'eq checks'),
+    (MM_NEUTRALIZATIONS, 'MM neutralized'),
+    (CELLS_CREATED, 'cells'),
+    (BLOCKS_REUSED, 'blocks reused'),
+    (BYTES_WRITTEN, 'bytes written'),
+])
+
+'''
+@Span: one timed phase
+    start is wall-clock seconds since the epoch so spans from different processes line up,
+    duration is measured with perf_counter; args are extra details shown in the trace (e.g. the sheet)
+'''
+Span = namedtuple('Span', ['name', 'start', 'duration', 'pid', 'tid', 'args'])
+
+class Metrics():
+
+    '''
+    @spans: list of finished Spans in the order they ended
+    @counters: counter name -> total
+    '''
+    def __init__(self):
+        self.spans = []
+        self.counters = OrderedDict()
+
+    '''
+    forgets every span and counter, called at the start of each compare
+    '''
+    def reset(self):
+        self.spans = []
+        self.counters = OrderedDict()
+
+    '''
+    times the with block as a span, the span is recorded even if the block raises
+    @param name: phase name
+    @param args: extra details kept with the span
+    '''
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        start = time.time()
+        counter_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append(Span(name, start, time.perf_counter() - counter_start, os.getpid(), threading.get_ident(), args))
+
+    '''
+    adds to a counter
+    @param name: counter name
+    @param amount: value to add
+    '''
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    '''
+    returns the total seconds spent in each phase, in the order the phases first ended
+        nested phases are counted in their own total and in their parent's
+    '''
+    def get_phase_times(self):
+        totals = OrderedDict()
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return totals
+
+    '''
+    returns the metrics as plain JSON-serializable data
+    '''
+    def to_dict(self):
+        return OrderedDict([
+            ('phases', OrderedDict((name, round(seconds, 6)) for name, seconds in self.get_phase_times().items())),
+            ('counters', OrderedDict(self.counters)),
+            ('spans', [span._asdict() for span in self.spans]),
+        ])
+
+    '''
+    adds the spans and counters of another process's to_dict output to this one
+    @param data: dict from Metrics.to_dict
+    '''
+    def merge(self, data):
+        for span in data['spans']:
+            self.spans.append(Span(**span))
+        for name, amount in data['counters'].items():
+            self.count(name, amount)
+
+    '''
+    builds the one-line summary: phase totals followed by the non-zero counters
+    '''
+    def get_summary(self):
+        phases = ', '.join('%s %.2fs' % (name, seconds) for name, seconds in self.get_phase_times().items())
+        counters = ', '.join('%d %s' % (self.counters[name], label) for name, label in SUMMARY_LABELS.items() if self.counters.get(name))
+        return ' | '.join(part for part in (phases, counters) if part)
+
+    '''
+    writes to_dict as a JSON file
+    @param path: file to write
+    '''
+    def write_json(self, path):
+        with open(path, 'w') as json_file:
+            json.dump(self.to_dict(), json_file, indent=2)
+
+    '''
+    writes the spans as a Chrome trace event file, counters are added as a final counter event
+    @param path: file to write
+    '''
+    def write_chrome_trace(self, path):
+        events = []
+        for span in self.spans:
+            events.append({
+                'name': span.name,
+                'cat': 'route_compare',
+                'ph': 'X',
+                'ts': int(span.start * 1000000),
+                'dur': int(span.duration * 1000000),
+                'pid': span.pid,
+                'tid': span.tid,
+                'args': span.args,
+            })
+
+        if self.counters and self.spans:
+            last = max(self.spans, key=lambda span: span.start + span.duration)
+            events.append({
+                'name': 'counters',
+                'ph': 'C',
+                'ts': int((last.start + last.duration) * 1000000),
+                'pid': os.getpid(),
+                'args': dict(self.counters),
+            })
+
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+#Collector used by route_compare
+METRICS = Metrics()
@@ -0,0 +1,192 @@
+import os
+import stat
+import pickle
+import hashlib
+import tempfile
+from sheet_reader import SheetReader
+
+'''
+On-disk cache of parsed routes
+
+Parsed Route objects are pickled to one file per (sheet content hash, sheet name, parser version).
+A sheet that hasn't changed since the last run is loaded back from its pickle instead of being
+re-read cell by cell, even if other sheets of the workbook were edited. Other per-route data
+(e.g. rendered diff blocks) is stored under name keys. The cache is capped by total size;
+the least recently used entries are evicted.
+
+Loading a pickle can run code, so entries are only read from a directory no one else can write to:
+it's created private to the user, and a directory owned by someone else or writable by other users
+leaves the cache disabled.
+'''
+
+CACHE_EXTENSION = '.route'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+'''
+returns the per-user folder the macro keeps its cache in
+    %LOCALAPPDATA% on Windows, $XDG_CACHE_HOME or ~/.cache elsewhere
+@param name: subfolder for the application
+'''
+def get_user_cache_dir(name):
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, name)
+
+'''
+returns true if only the current user can add files to the directory: it's a real directory (not a link)
+    owned by the user and neither group nor world writable
+    Windows has no owner or mode bits to check here, the per-user profile folder's permissions keep others out
+'''
+def is_private_directory(directory):
+    try:
+        info = os.lstat(directory)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(info.st_mode):
+        return False
+    if not hasattr(os, 'getuid'):
+        return True
+    return info.st_uid == os.getuid() and info.st_mode & (stat.S_IWGRP | stat.S_IWOTH) == 0
+
+'''
+memo of content hashes already computed by this process
+    (Key, Value)    ->    ((path, size, mtime, sheet name), hex digest)
+'''
+_sheet_hashes = {}
+
+'''
+returns the content hash of a sheet as a hex string, see SheetReader.get_sheet_digest
+@param path: workbook holding the sheet
+@param sheetname: sheet to hash
+'''
+def hash_sheet(path, sheetname):
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime, sheetname)
+    if memo_key not in _sheet_hashes:
+        reader = SheetReader(path)
+        try:
+            _sheet_hashes[memo_key] = reader.get_sheet_digest(sheetname)
+        finally:
+            reader.close()
+    return _sheet_hashes[memo_key]
+
+class RouteCache():
+
+    '''
+    @directory: folder holding the cached routes, created private to the user if missing
+    @max_bytes: size cap of the folder, least recently used entries are removed past it
+    @trusted: the folder passed is_private_directory, an untrusted cache never reads or writes entries
+    '''
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.exists(directory):
+            os.makedirs(directory, mode=0o700)
+        self.trusted = is_private_directory(directory)
+
+    '''
+    builds the cache key for a sheet of a workbook, from the sheet's content hash
+    @param workbook_path: workbook the sheet is read from
+    @param sheetname: sheet holding the route
+    @param version: parser version, bump it whenever the parsed Route layout changes
+    @param variant: anything else the parse depends on (e.g. loader options), part of the key as text
+    @return: hex string key
+    '''
+    def make_key(self, workbook_path, sheetname, version, variant=''):
+        return self.make_name_key(hash_sheet(workbook_path, sheetname), sheetname, version, variant)
+
+    '''
+    builds a cache key from names alone, for entries that aren't tied to a workbook's content
+    @param names: strings (or anything with a str form) identifying the entry
+    @return: hex string key
+    '''
+    def make_name_key(self, *names):
+        key = '\n'.join(str(name) for name in names)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    '''
+    returns the file path of a key's entry
+    '''
+    def get_path(self, key):
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    '''
+    returns the cached value for key, marking the entry as recently used
+        unreadable entries (partial writes, pickles of an older layout) are dropped and count as a miss,
+        an untrusted cache always misses
+    @param key: key from make_key
+    @param default: returned on a miss
+    '''
+    def get(self, key, default=None):
+        if not self.trusted:
+            return default
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                value = pickle.load(cache_file)
+        except FileNotFoundError:
+            return default
+        except Exception:
+            self.remove(path)
+            return default
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    '''
+    stores a value under key, then evicts old entries if the cache is over its size cap
+        the pickle is written to a temporary file first so readers never see a partial entry,
+        an untrusted cache stores nothing
+    @param key: key from make_key
+    @param value: picklable value, normally a Route (or False for an invalid sheet)
+    '''
+    def put(self, key, value):
+        if not self.trusted:
+            return
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as cache_file:
+                pickle.dump(value, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.get_path(key))
+        except Exception:
+            self.remove(temp_path)
+            raise
+        self.evict()
+
+    '''
+    removes least recently used entries until the cache fits in max_bytes
+    '''
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    '''
+    deletes a file, ignoring one that another process already removed
+    '''
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,14 +1,42 @@
 import os
-import xlwings as xw
+import sys
+import csv
+import json
+import time
+import math
+import hashlib
+import logging
+import argparse
+import tempfile
+import multiprocessing
 import datetime as dt
 import openpyxl as oxl
 from openpyxl import Workbook
-from collections import OrderedDict
+from functools import partial
+from operator import itemgetter
+from collections import OrderedDict, namedtuple
+from logging.handlers import MemoryHandler
+from queue import Empty
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from openpyxl.styles import Font
 from openpyxl.styles.fills import PatternFill
 from openpyxl.styles.borders import Border, Side
 from openpyxl.styles.alignment import Alignment
-from openpyxl.writer.write_only import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from openpyxl.cell.read_only import EMPTY_CELL, ReadOnlyCell
+from openpyxl.writer.write_only import WriteOnlyCell, WriteOnlyWorksheet
+from route_cache import RouteCache, get_user_cache_dir
+from spill_store import OperationStore
+from status_sink import XlwingsSink, MemorySink, get_bounds
+from sheet_reader import SheetReader, ROW_RED, STYLE_CHANGE, STYLE_RED
+from cell_diff import diff_cells
+from metrics import METRICS, OPERATIONS_PARSED, OPERATIONS_FLAGGED, EQUALITY_CHECKS, MM_NEUTRALIZATIONS, CELLS_CREATED, BYTES_WRITTEN, BLOCKS_REUSED
+
+#xlwings is only needed when running as the Excel macro, the library and CLI work without it
+try:
+    import xlwings as xw
+except ImportError:
+    xw = None
 
 '''
 Program Constants
@@ -30,12 +58,78 @@ MM_VALIDATION = 'Production MM'
 OPERATION_START = 'Full Oper Num'
 
 SAVE_ROOT_PATH = ''
+
+#Bump whenever Route/Operation or the parsing rules change, so cached routes from older builds are ignored
+PARSER_VERSION = 3
+ROUTE_CACHE_MB = 512
+#The macro keeps its route cache here, so re-runs after an edit only re-parse and re-render what changed
+#it's per user, cached pickles are only loaded from a folder no one else can write to (see RouteCache)
+MACRO_CACHE_DIR = get_user_cache_dir('route_compare')
+#Name under which a route's rendered diff blocks are cached
+DIFF_BLOCKS_NAME = 'Diff Blocks'
+#Returned by RouteCache.get on a miss, routes themselves can be False (invalid) or None (optional and empty)
+NOT_CACHED = 'Not Cached'
+
+#Report formats: the styled workbook, or the bare diff records as CSV or JSON Lines
+XLSX_FORMAT = 'xlsx'
+CSV_FORMAT = 'csv'
+JSONL_FORMAT = 'jsonl'
+REPORT_FORMATS = (XLSX_FORMAT, CSV_FORMAT, JSONL_FORMAT)
+REPORT_EXTENSIONS = {XLSX_FORMAT: '.xlsx', CSV_FORMAT: '.csv', JSONL_FORMAT: '.jsonl'}
+DIFF_RECORD_HEADER = ['Operation', 'Row', 'Column', 'RTE Value', 'SM Value', 'Diff']
+
+#Sheet readers: the raw streaming reader from sheet_reader.py, or openpyxl's read-only worksheet
+RAW_READER = 'raw'
+OPENPYXL_READER = 'openpyxl'
+SHEET_READERS = (RAW_READER, OPENPYXL_READER)
+
+#Batch mode: workbooks picked up from the input directory, report naming and the summary file
+BATCH_EXTENSIONS = ('.xlsm', '.xlsx')
+BATCH_REPORT_NAME = '_RTE-SM-Compare'
+BATCH_REPORT_SUFFIX = BATCH_REPORT_NAME + '.xlsx'
+BATCH_SUMMARY_FILE = 'batch_summary.csv'
+BATCH_SUMMARY_HEADER = ['Workbook', 'Route ID', 'Product ID', 'RTE Operations', 'SM Operations', 'MM Operations',
+                        'Orange Diffs', 'Blue Diffs', 'Elapsed (s)', 'Status', 'Report']
+#One-vs-many mode: a target is 'workbook' or 'workbook::sheet' (SM_SHEET by default), reports are named like
+#batch reports plus the sheet when it isn't SM_SHEET, and listed in TARGETS_SUMMARY_FILE (BATCH_SUMMARY_HEADER columns)
+TARGET_SEPARATOR = '::'
+TARGETS_SUMMARY_FILE = 'targets_summary.csv'
+#Logging: quiet by default, per operation messages are DEBUG; the optional log file is written
+#in batches of LOG_BUFFER_RECORDS (or right away for an ERROR)
+LOG_NAME = 'route_compare'
+DEFAULT_LOG_LEVEL = logging.WARNING
+LOG_BUFFER_RECORDS = 1000
+#Log level for each -v given on the command line
+VERBOSITY_LEVELS = [DEFAULT_LOG_LEVEL, logging.INFO, logging.DEBUG]
+CONSOLE_LOG_FORMAT = '%(message)s'
+FILE_LOG_FORMAT = '%(asctime)s %(process)d %(levelname)s %(message)s'
+
+#Home sheet cell that receives the one-line metrics summary of the last macro run
+HOME_METRICS_CELL = 'A14'
+#Home sheet status cells (written in bulk by the status sink) and the block holding the macro's inputs
+HOME_STATUS_RANGE = 'A3:A14'
+HOME_INPUT_RANGE = 'A1:I17'
+#compare_routes reports progress every this many operations
+PROGRESS_OPERATIONS = 500
+#Differences whose rows are compared together in one vectorized pass, see prepare_diffs
+DIFF_BATCH_OPERATIONS = 256
+#Pipelined compare: sheets are parsed in their own processes and streamed to the compare in batches of
+#PIPELINE_BATCH_OPERATIONS operations, each sheet's queue holds at most PIPELINE_QUEUE_DEPTH batches
+PIPELINE_BATCH_OPERATIONS = 250
+PIPELINE_QUEUE_DEPTH = 8
+#Seconds between checks that a parsing process is still alive while waiting on its queue
+PIPELINE_POLL_SECONDS = 1.0
+#Messages a parsing process sends
+BATCH_MESSAGE = 'Batch'
+END_MESSAGE = 'End'
+ERROR_MESSAGE = 'Error'
 HEADER_BUFFER = 3
 NUM_OUTPUT_COLS = 30
 COL_A = 0
 COL_B = 1
 
 RED = 'FFFF0000'
+NO_FILL_HEX = '00000000'
 RED_RGB = (255,0,0)
 RTE_HEX = 'FFF0F0F0'
 SM_HEX = 'FFFFFF99'
@@ -50,29 +144,158 @@ SM_FILL = PatternFill(patternType='solid', fgColor=SM_HEX)
 ORANGE_DIFF_FILL = PatternFill(patternType='solid', fgColor=ORANGE_DIFF_HEX)
 BLUE_DIFF_FILL = PatternFill(patternType='solid', fgColor=BLUE_DIFF_HEX)
 
+#Fills of rendered cells, cached diff blocks store a fill by its position here
+BLOCK_FILLS = (None, RTE_FILL, SM_FILL, ORANGE_DIFF_FILL, BLUE_DIFF_FILL)
+BLOCK_FILL_CODES = {id(fill): code for code, fill in enumerate(BLOCK_FILLS)}
+
 HEADER_FONT = Font(name='Calibri', bold=True, size=14)
 
+#Summary rows at the top of the compare tab: column names, orange and blue totals
+LABEL_FILL = PatternFill(patternType='solid', fgColor='FFC0C0C0')
+ORANGE_COUNT_FILL = PatternFill(patternType='solid', fgColor='FFFABF8F')
+BLUE_COUNT_FILL = PatternFill(patternType='solid', fgColor='FF92CDDC')
+LABEL_FONT = Font(name='Consolas', bold=True, size=14)
+COUNT_FONT = Font(name='Consolas', bold=True, size=10)
+LABEL_ROW_HEIGHT = 55
+OUTPUT_COL_WIDTH = 15
+OUTPUT_ZOOM = 70
+
+OUTPUT_HEADERS = [
+    'Comments',
+    'Full Oper Num',
+    'Module',
+    'Module Description',
+    'Process Def',
+    'Photo Layer',
+    'PD Type',
+    'PD Name',
+    'PD Description',
+    'Department',
+    'PD User Data Sets - Name',
+    'PD User Data Sets - Value',
+    'Operation User Data Sets - Name',
+    'Operation User Data Sets - Value',
+    'Mondatory',
+    "Carrier Category",
+    "LR Context Type",
+    "LR Context",
+    "Logical Recipe",
+    "LR Description",
+    "Resolved Pre1 Script",
+    "Resolved Pre2 Script",
+    'Resolved Post Script',
+    'Equipment',
+    'Equipment Recipe',
+    'Recipe Description',
+    'Stage ID',
+    'Proc (min)',
+    'Wait (min)',
+    'WPH'
+]
+
+#Output header -> 0 based column, for counting highlighted cells per column
+OUTPUT_COLUMNS = {header: column for column, header in enumerate(OUTPUT_HEADERS)}
+
 ALL_BORDER = Border(left=Side(style='thin'),
                     right=Side(style='thin'),
                     top=Side(style='thin'),
                     bottom=Side(style='thin'))
 
 CENTER_ALIGN = Alignment(horizontal='center')
+WRAP_CENTER_ALIGN = Alignment(horizontal='center', wrap_text=True)
 
 BLUE = 'Blue'
 ORANGE = 'Orange'
 
+#Marks the start of an operation block in ReportWorksheet.body
+OPERATION_HEADER_ROW = 'Operation Header'
 
+#Operation alignment kinds
+MATCHED = 'Matched'
+RTE_ONLY = 'RTE Only'
+SM_ONLY = 'SM Only'
 
-#pass in cell, return .value as string with no leading/trailing whitespace
-def stringify(cell):
-    return str(cell.value).strip()
+#Kinds of OperationDiff, besides RTE_ONLY and SM_ONLY: CHANGED is a change inside the RTE's scope of change,
+#CHANGED_OUT_OF_SCOPE one outside of it that MM doesn't neutralize
+EQUAL = 'Equal'
+CHANGED = 'Changed'
+CHANGED_OUT_OF_SCOPE = 'Changed Out Of Scope'
+NEUTRALIZED = 'Neutralized'
+#Kinds that are written to a report
+DIFFERENCE_KINDS = (CHANGED, CHANGED_OUT_OF_SCOPE, RTE_ONLY, SM_ONLY)
+
+#Operation numbers are XXXX.XXXX, keys keep the four decimal places as integer digits
+OPERATION_KEY_SCALE = 10000
+#A float operation number this close to a whole key is Excel noise and rounds to it
+OPERATION_KEY_TOLERANCE = 1e-3
 
 '''
-returns True if the openpyxl cell has a value, False otherwise
+@AlignedPair: one step of the RTE/SM alignment
+    kind is MATCHED, RTE_ONLY or SM_ONLY; rte/sm hold the Operation (None for the missing side)
 '''
-def has_value(cell):
-    return cell.value != '' and cell.value != None
+AlignedPair = namedtuple('AlignedPair', ['kind', 'key', 'rte', 'sm'])
+
+'''
+@RowDiff: one aligned row of a changed, RTE-only or SM-only operation
+    rte/sm hold the OperationRow (None for the missing side); changed is a bitmask of the columns
+    whose values differ (every non-empty column of a one-sided row), orange the part of change subset of it
+'''
+RowDiff = namedtuple('RowDiff', ['rte', 'sm', 'changed', 'orange'])
+
+class OperationDiff():
+    
+    '''
+    one record of the stream diff_routes yields, renderers decide which kinds they write
+    @kind: EQUAL, CHANGED, CHANGED_OUT_OF_SCOPE, NEUTRALIZED, RTE_ONLY or SM_ONLY
+    @key: key of the operation number, see operation_key
+    @rte/@sm: the compared Operations, None for the missing side
+    @mm: MM operation a NEUTRALIZED difference matched, None otherwise
+    @rows: RowDiffs of the operation, aligned on the first get_rows call unless prepare_diffs set them in a batch
+        only renderers ask for them, so equal, neutralized and cached differences never pay for the alignment
+    '''
+    __slots__ = ('kind', 'key', 'rte', 'sm', 'mm', 'rows')
+    
+    def __init__(self, kind, key, rte, sm, mm=None):
+        self.kind = kind
+        self.key = key
+        self.rte = rte
+        self.sm = sm
+        self.mm = mm
+        self.rows = None
+    
+    '''
+    returns true for the kinds that show up in a report, DIFFERENCE_KINDS
+    '''
+    def is_difference(self):
+        return self.kind in DIFFERENCE_KINDS
+    
+    '''
+    returns the operation number, from the RTE side when both are present
+    '''
+    def get_operation_no(self):
+        return str(self.rte if self.rte != None else self.sm)
+    
+    '''
+    returns the RowDiffs of the operation, aligning its rows the first time
+    '''
+    def get_rows(self):
+        if self.rows == None:
+            self.rows = diff_operation_rows(self.rte, self.sm)
+        return self.rows
+
+LOGGER = logging.getLogger(LOG_NAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+#pass in cell value, return it as string with no leading/trailing whitespace
+def stringify(value):
+    return str(value).strip()
+
+'''
+returns True if the cell value is not empty, False otherwise
+'''
+def has_value(value):
+    return value != '' and value != None
 
 '''
 given a report_id, extract the route ID
@@ -103,44 +326,278 @@ def get_product_id(report_id):
         return 'ErrorReadingProduct'
 
 '''
-saves output_worksheet to the generated path & filename
+sets up the route_compare logger: console output at the given level, plus an optional buffered log file
+    messages are formatted only if a handler will emit them, so quiet runs skip the per operation text
+@param level: logging level, DEFAULT_LOG_LEVEL keeps the console to warnings and errors
+@param log_file: path of a log file to append to, records are buffered and written LOG_BUFFER_RECORDS at a time
+'''
+def configure_logging(level=DEFAULT_LOG_LEVEL, log_file=None):
+    for handler in list(LOGGER.handlers):
+        LOGGER.removeHandler(handler)
+        handler.close()
+    LOGGER.setLevel(level)
+    LOGGER.propagate = False
+    
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter(CONSOLE_LOG_FORMAT))
+    LOGGER.addHandler(console)
+    
+    if log_file != None:
+        file_handler = logging.FileHandler(log_file, delay=True)
+        file_handler.setFormatter(logging.Formatter(FILE_LOG_FORMAT))
+        LOGGER.addHandler(MemoryHandler(LOG_BUFFER_RECORDS, flushLevel=logging.ERROR, target=file_handler))
+
+'''
+writes out buffered log records
+    called before a process pool starts, so forked workers don't inherit (and repeat) the parent's
+    buffer, and at the end of each pool task, since workers exit without running logging's shutdown
+'''
+def flush_logs():
+    for handler in LOGGER.handlers:
+        handler.flush()
+
+'''
+saves the output workbook to the given path
+    the report is fully formatted as it streams out, so it is written exactly once
+@param workbook: output workbook from init_write_only_output
+@param file_name: path of the .xlsx file to write
 '''
-def save_output():
-    file_name = generate_filename(rte_route)
-    output_workbook.save(file_name)
-    format_output(file_name)
-    xw.Book(file_name)
+def save_report(workbook, file_name):
+    with METRICS.span('format_output'):
+        workbook[OUTPUT_TAB].write_rows()
+    with METRICS.span('save'):
+        workbook.save(file_name)
+    METRICS.count(BYTES_WRITTEN, os.path.getsize(file_name))
 
 '''
 initializes the WriteOnlyWorkbook that is used for output
 creates approproate sheets for output and user post processing verification
+    column widths, the label row height and zoom have to be set before the first row is written
+@param options: names of the extra verification sheets to add
 '''
-def init_write_only_output():
+def init_write_only_output(options=()):
     workbook = Workbook(write_only=True)
-    workbook.create_sheet(OUTPUT_TAB)
-    for option in get_output_options():
+    workbook._add_sheet(ReportWorksheet(parent=workbook, title=OUTPUT_TAB))
+    for option in options:
         workbook.create_sheet(option)
 
     for sheet in workbook.sheetnames:
         workbook[sheet].sheet_properties.tabColor = YELLOW_HEX
     
-    for i in range(HEADER_BUFFER):
-        workbook[OUTPUT_TAB].append([''])
+    sheet = workbook[OUTPUT_TAB]
+    for column in range(1, NUM_OUTPUT_COLS * 2 + 1):
+        sheet.column_dimensions[get_column_letter(column)].width = OUTPUT_COL_WIDTH
+    sheet.row_dimensions[1].height = LABEL_ROW_HEIGHT
+    sheet.sheet_view.zoomScale = OUTPUT_ZOOM
     
     return workbook
 
+class ReportWorksheet(WriteOnlyWorksheet):
+    
+    '''
+    write-only worksheet for the compare tab
+        the HEADER_BUFFER summary rows at the top hold per column orange/blue totals that are only
+        known once the compare is done, so body rows are buffered as compact (value, fill) pairs
+        while the totals are counted, then everything is streamed out in order by write_rows
+    @body: buffered rows, each a list of (value, fill) pairs or OPERATION_HEADER_ROW
+    @orange_counts/blue_counts: number of highlighted cells per output column (RTE and SM cells together)
+    @merged_ranges: cell ranges to merge, openpyxl's streaming writer doesn't write merges itself
+    '''
+    def __init__(self, parent, title):
+        super(ReportWorksheet, self).__init__(parent, title)
+        self.body = []
+        self.orange_counts = [0] * NUM_OUTPUT_COLS
+        self.blue_counts = [0] * NUM_OUTPUT_COLS
+        self.merged_ranges = []
+    
+    '''
+    buffers a rendered row and adds its highlighted cells to the column totals
+    @param row: list of (value, fill) pairs from create_cell, or OPERATION_HEADER_ROW
+        every pair is a cell made by create_cell, so they are counted here rather than per call
+    '''
+    def add_row(self, row):
+        if row is not OPERATION_HEADER_ROW:
+            METRICS.count(CELLS_CREATED, len(row))
+            for index, (value, fill) in enumerate(row):
+                if fill is ORANGE_DIFF_FILL:
+                    self.orange_counts[index // 2] += 1
+                elif fill is BLUE_DIFF_FILL:
+                    self.blue_counts[index // 2] += 1
+        self.body.append(row)
+    
+    '''
+    renders a record of the diff stream to the sheet, the entry point compare_routes uses for every report
+        equal and neutralized operations aren't part of the report and are skipped before any rendering
+    @param diff: OperationDiff from diff_routes
+    '''
+    def write_diff(self, diff):
+        if diff.is_difference():
+            render_difference(self, diff)
+    
+    '''
+    writes the summary rows followed by the buffered body rows
+        cells are created as each row is written, so only one row of openpyxl cells exists at a time
+    '''
+    def write_rows(self):
+        for row in self.summary_rows():
+            self.append(row)
+        
+        operation_header = write_header(self)
+        for row in self.body:
+            if row is OPERATION_HEADER_ROW:
+                self.append(operation_header)
+            else:
+                self.append([self.make_cell(value, fill) for value, fill in row])
+        self.body = []
+    
+    '''
+    creates a styled WriteOnlyCell for this sheet
+    '''
+    def make_cell(self, value, fill=None, font=None, alignment=None, border=None):
+        cell = WriteOnlyCell(ws=self, value=value)
+        if fill != None:
+            cell.fill = fill
+        if font != None:
+            cell.font = font
+        if alignment != None:
+            cell.alignment = alignment
+        if border != None:
+            cell.border = border
+        return cell
+    
+    '''
+    builds the three summary rows (column name, orange total, blue total)
+        each output column spans an RTE and an SM column, the pair is merged on every summary row
+    @return: list of three rows of WriteOnlyCells
+    '''
+    def summary_rows(self):
+        label_row = []
+        orange_row = []
+        blue_row = []
+        for index, header in enumerate(OUTPUT_HEADERS):
+            label_row.append(self.make_cell(header, LABEL_FILL, LABEL_FONT, WRAP_CENTER_ALIGN, ALL_BORDER))
+            orange_row.append(self.make_cell('Orange: ' + str(self.orange_counts[index]), ORANGE_COUNT_FILL, COUNT_FONT, WRAP_CENTER_ALIGN, ALL_BORDER))
+            blue_row.append(self.make_cell('Blue: ' + str(self.blue_counts[index]), BLUE_COUNT_FILL, COUNT_FONT, WRAP_CENTER_ALIGN, ALL_BORDER))
+            for summary_row in (label_row, orange_row, blue_row):
+                summary_row.append(self.make_cell(None, border=ALL_BORDER))
+            
+            first_column = get_column_letter(index * 2 + 1)
+            second_column = get_column_letter(index * 2 + 2)
+            for row in range(1, HEADER_BUFFER + 1):
+                self.merged_ranges.append(first_column + str(row) + ':' + second_column + str(row))
+        return [label_row, orange_row, blue_row]
+    
+    '''
+    returns the sheet xml with the merged ranges spliced in right after sheetData
+        openpyxl 2.4 (pinned in requirements.txt) saves a streaming sheet through this method and never writes its merges
+    '''
+    def _write(self):
+        xml = super(ReportWorksheet, self)._write()
+        if self.merged_ranges:
+            merges = '<mergeCells count="%d">%s</mergeCells>' % (len(self.merged_ranges),
+                                                                  ''.join('<mergeCell ref="%s"/>' % cell_range for cell_range in self.merged_ranges))
+            xml = xml.replace('</sheetData>', '</sheetData>' + merges, 1)
+        return xml
+
+'''
+@DiffRecord: one highlighted cell of a difference, the flat form the CSV and JSON Lines reports hold
+    operation is the operation number, row the 1 based row within the aligned operation,
+    column the OUTPUT_HEADERS name, diff ORANGE (part of change) or BLUE; the missing side of an
+    extra row or operation has '' as its value
+'''
+DiffRecord = namedtuple('DiffRecord', ['operation', 'row', 'column', 'rte_value', 'sm_value', 'diff'])
+
+class DiffWriter():
+    
+    '''
+    streams differences as DiffRecords instead of a styled sheet, base of the CSV and JSON Lines writers
+        nothing is buffered and no cell objects or styles are created
+    @path: file the records are written to
+    @orange_counts/blue_counts: number of highlighted cells per output column, same totals as ReportWorksheet
+    @records: number of records written
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.orange_counts = [0] * NUM_OUTPUT_COLS
+        self.blue_counts = [0] * NUM_OUTPUT_COLS
+        self.records = 0
+    
+    '''
+    writes the records of one operation difference, see ReportWorksheet.write_diff
+    @param diff: OperationDiff from diff_routes
+    '''
+    def write_diff(self, diff):
+        if not diff.is_difference():
+            return
+        for record in get_difference_records(diff):
+            column = OUTPUT_COLUMNS.get(record.column)
+            if column != None:
+                counts = self.orange_counts if record.diff == ORANGE else self.blue_counts
+                counts[column] += has_value(record.rte_value) + has_value(record.sm_value)
+            self.write_record(record)
+            self.records += 1
+    
+    '''
+    writes a single record, implemented by each format
+    '''
+    def write_record(self, record):
+        raise NotImplementedError
+    
+    '''
+    closes the output file
+    '''
+    def close(self):
+        self.file.close()
+        METRICS.count(BYTES_WRITTEN, os.path.getsize(self.path))
+
+class CsvDiffWriter(DiffWriter):
+    
+    '''
+    DiffRecords as CSV, one header row of DIFF_RECORD_HEADER then one row per record
+    '''
+    def __init__(self, path):
+        super(CsvDiffWriter, self).__init__(path)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(DIFF_RECORD_HEADER)
+    
+    def write_record(self, record):
+        self.writer.writerow(['' if value == None else value for value in record])
+
+class JsonLinesDiffWriter(DiffWriter):
+    
+    '''
+    DiffRecords as JSON Lines, one object per line keyed by the DiffRecord field names
+        dates and other values JSON has no type for are written as strings
+    '''
+    def write_record(self, record):
+        self.file.write(json.dumps(record._asdict(), default=str))
+        self.file.write('\n')
+
+'''
+opens the diff writer of a text report format
+@param path: report file to write
+@param output_format: CSV_FORMAT or JSONL_FORMAT
+@return: DiffWriter, to be closed once the compare is done
+'''
+def open_diff_writer(path, output_format):
+    if output_format == CSV_FORMAT:
+        return CsvDiffWriter(path)
+    return JsonLinesDiffWriter(path)
+
 '''
 given a route, create a filename. 
     [SAVE_ROOT_PATH]/
         [ROUTE_ID]_RTE-SM-Compare_[YEAR-MONTH-DATE] [HOUR-MINUTE-SECOND]_[WINDOWS_ID]
 creates user directory if not already existing
 @param route: route to create filename for
+@param label: prefix for the filename, read from the home sheet
 '''
-def generate_filename(route):
+def generate_filename(route, label):
     uid = os.getlogin()
     save_path = SAVE_ROOT_PATH + uid
     timestamp = str(dt.datetime.now())[:-7].replace(":", "-")
-    file_name = save_path + '/' + homesheet.range('E17').value + '_' + route.get_route_id() + '_RTE-SM-Compare_' + timestamp + '_' + uid + '.xlsx'
+    file_name = save_path + '/' + label + '_' + route.get_route_id() + '_RTE-SM-Compare_' + timestamp + '_' + uid + '.xlsx'
     
     if not os.path.exists(save_path):
         os.mkdir(save_path)
@@ -148,262 +605,754 @@ def generate_filename(route):
     return file_name
 
 '''
-creates a WriteOnlyCell and returns it to the caller
+creates an output cell and returns it to the caller
+    cells are (value, fill) pairs, ReportWorksheet turns them into WriteOnlyCells when the report is written
 @param value: value for cell
 @param route_type: fills a color based on route_type [RTE, SM]
 @param diff: fills a color based on diff type [ORANGE, BLUE]
 '''
 def create_cell(value, route_type, diff=None):
-    cell = WriteOnlyCell(ws=output_worksheet, value=value)
+    fill = None
+    highlight = value != '' and value != None
     if route_type == 'RTE':
-        if diff == ORANGE and has_value(cell):
-            cell.fill = ORANGE_DIFF_FILL
-        elif diff == BLUE and has_value(cell):
-            cell.fill = BLUE_DIFF_FILL
+        if diff == ORANGE and highlight:
+            fill = ORANGE_DIFF_FILL
+        elif diff == BLUE and highlight:
+            fill = BLUE_DIFF_FILL
         else:
-            cell.fill = RTE_FILL
+            fill = RTE_FILL
     elif route_type == 'SM':
-        if diff == ORANGE and has_value(cell):
-            cell.fill = ORANGE_DIFF_FILL
-        elif diff == BLUE and has_value(cell):
-            cell.fill = BLUE_DIFF_FILL
+        if diff == ORANGE and highlight:
+            fill = ORANGE_DIFF_FILL
+        elif diff == BLUE and highlight:
+            fill = BLUE_DIFF_FILL
         else:
-            cell.fill = SM_FILL
-    return cell
+            fill = SM_FILL
+    return (value, fill)
 
-def part_of_change(cell):
-    try:
-        if cell.fill.fgColor.rgb != '00000000':
-            return True
-    except AttributeError:
-        return False
-    return False
+'''
+returns the STYLE_* flags of an openpyxl fill
+    any foreground colour but NO_FILL_HEX is part of change (a theme or indexed colour too), RED is also the removal fill;
+    a fill without a foreground colour (none, gradient) is neither
+'''
+def get_fill_flags(fill):
+    fg_color = getattr(fill, 'fgColor', None)
+    if fg_color == None or fg_color.rgb == NO_FILL_HEX:
+        return 0
+    if fg_color.rgb == RED:
+        return STYLE_CHANGE | STYLE_RED
+    return STYLE_CHANGE
+
+'''
+builds the cell style index -> STYLE_* flags table of an openpyxl workbook, the counterpart of the raw reader's
+    a workbook has a few dozen cell styles at most, so the fills are read once per style instead of once per cell
+    the table is built from openpyxl internals (the workbook's style and fill lists, a cell's style id),
+    an openpyxl without them gets None and OperationRow.from_cells reads each cell's fill instead
+@param workbook: read-only openpyxl workbook
+@return: list of flags indexed by a cell's style id, None if this openpyxl doesn't have the internals
+'''
+def get_style_flags(workbook):
+    cell_styles = getattr(workbook, '_cell_styles', None)
+    fills = getattr(workbook, '_fills', None)
+    if cell_styles == None or fills == None or not hasattr(ReadOnlyCell, '_style_id'):
+        return None
+    return [get_fill_flags(fills[style.fillId]) if style.fillId < len(fills) else 0
+            for style in cell_styles]
 
 '''
-given a route_type and operation, render the extra operation to the output_worksheet
+given a route_type and operation, render the extra operation to the report
+@param report: ReportWorksheet to render to
 @param route_type: responsible for determining type of output
 @param operation: operation to output
 '''
-def render_extra_operation(route_type, operation):
+def render_extra_operation(report, route_type, operation):
     if type(operation) != Operation:
-        print('[X] render_extra_operation recieved bad operation.')
+        LOGGER.error('[X] render_extra_operation recieved bad operation.')
         return False
     
-    write_header()
+    write_operation_header(report)
     
     if route_type == 'RTE':
         for row in operation.get_operation_as_output('RTE', extra=True, difftype=ORANGE):
-            output_worksheet.append(row)
-        print('\t[+]Output extra RTE operation:', operation)
+            report.add_row(row)
+        LOGGER.debug('\t[+]Output extra RTE operation: %s', operation)
     elif route_type == 'SM':
         for row in operation.get_operation_as_output('SM', extra=True, difftype=BLUE):
-            output_worksheet.append(row)
-        print('\t[+]Output extra SM operation', operation)
+            report.add_row(row)
+        LOGGER.debug('\t[+]Output extra SM operation %s', operation)
     else:
-        print('[X]render_extra_operation recieved bad route_type')
+        LOGGER.error('[X]render_extra_operation recieved bad route_type')
 
 '''
-compares the given routes. RTE and SM routes must be present at a minimum
-    if MM route is present, logic will account for the sheet automatically
-@return: openpyxl WriteOnlyWorksheet to be saved output containing the route differences  
+turns an operation number string into its canonical integer key
+    '1234.5' and '1234.5000' both become 12345000, so keys compare numerically without float()
+    the sign is kept apart from the digits, '-1.5' becomes -15000 and sorts below '-1'
+    numbers that aren't XXXX.XXXX (e.g. '10A', '1.00005' or an empty cell) keep their text as the key,
+    they still match the same text in the other route but the route is aligned by lookup, see keys_sorted
+@param operation_no: operation number as returned by Operation.fix_operation_no
+@return: int key of the operation number, the operation number itself if it isn't one
 '''
+def operation_key(operation_no):
+    text = str(operation_no).strip()
+    sign = 1
+    if text.startswith('-'):
+        sign = -1
+        text = text[1:]
+    whole, _, fraction = text.partition('.')
+    fraction = fraction.rstrip('0')
+    if whole.isdecimal() and len(fraction) <= 4 and (fraction == '' or fraction.isdecimal()):
+        return sign * (int(whole) * OPERATION_KEY_SCALE + int(fraction.ljust(4, '0')))
+    
+    #Float noise from Excel (e.g. 1000.0999999999) or scientific notation (fix_operation_no turns '1e3' into '1e3.0000')
+    try:
+        scaled = sign * float(text if fraction else whole) * OPERATION_KEY_SCALE
+    except ValueError:
+        return str(operation_no)
+    if math.isfinite(scaled) and abs(scaled - round(scaled)) < OPERATION_KEY_TOLERANCE:
+        return int(round(scaled))
+    return str(operation_no)
 
-def compare_routes(rte_route, sm_route, mm_route=None):
+'''
+returns true if the (key, operation number) list is in strictly increasing key order
+    a list holding a text key (see operation_key) is never sorted
+'''
+def keys_sorted(keys):
+    if not all(type(key) is int for key, _ in keys):
+        return False
+    return all(keys[index][0] < keys[index + 1][0] for index in range(len(keys) - 1))
+
+'''
+aligns the operations of two routes by operation number
+    sorted routes (the normal case) are aligned with a single O(n+m) merge-join,
+    routes out of operation number order fall back to a dict-join that keeps RTE order
+@param rte_route: RTE (submitted) route
+@param sm_route: SM (staged) route
+@return: list of AlignedPairs in output order
+'''
+def align_routes(rte_route, sm_route):
+    rte_keys = rte_route.get_operation_keys()
+    sm_keys = sm_route.get_operation_keys()
     
-    #Operation numbers stored as list
-    rte_operation_nums = rte_route.get_operation_nums()
-    sm_operation_nums = sm_route.get_operation_nums()
+    if keys_sorted(rte_keys) and keys_sorted(sm_keys):
+        return merge_join(rte_route, rte_keys, sm_route, sm_keys)
+    LOGGER.warning('[X]Route operations are not in order or not numeric, aligning by lookup.')
+    return dict_join(rte_route, rte_keys, sm_route, sm_keys)
+
+'''
+merge-join of two key lists that are both in increasing order
+'''
+def merge_join(rte_route, rte_keys, sm_route, sm_keys):
+    aligned = []
+    rte_cursor = 0
+    sm_cursor = 0
     
+    while rte_cursor < len(rte_keys) and sm_cursor < len(sm_keys):
+        rte_key, rte_op_num_str = rte_keys[rte_cursor]
+        sm_key, sm_op_num_str = sm_keys[sm_cursor]
+        
+        if rte_key == sm_key:
+            aligned.append(AlignedPair(MATCHED, rte_key, rte_route.operations[rte_op_num_str], sm_route.operations[sm_op_num_str]))
+            rte_cursor += 1
+            sm_cursor += 1
+        #The SM is ahead of the RTE, the RTE has an extra operation
+        elif rte_key < sm_key:
+            aligned.append(AlignedPair(RTE_ONLY, rte_key, rte_route.operations[rte_op_num_str], None))
+            rte_cursor += 1
+        #The RTE is ahead of the SM, the SM has an extra operation
+        else:
+            aligned.append(AlignedPair(SM_ONLY, sm_key, None, sm_route.operations[sm_op_num_str]))
+            sm_cursor += 1
     
+    #Whichever route has operations left over has extra trailing operations
+    for rte_key, rte_op_num_str in rte_keys[rte_cursor:]:
+        aligned.append(AlignedPair(RTE_ONLY, rte_key, rte_route.operations[rte_op_num_str], None))
+    for sm_key, sm_op_num_str in sm_keys[sm_cursor:]:
+        aligned.append(AlignedPair(SM_ONLY, sm_key, None, sm_route.operations[sm_op_num_str]))
+    return aligned
+
+'''
+hash join of two key lists in any order
+    output follows RTE order, SM-only operations are emitted just before the
+    first matched SM operation that comes after them in the SM sheet
+    duplicated keys are paired in sheet order like merge_join, leftovers are RTE-only/SM-only
+'''
+def dict_join(rte_route, rte_keys, sm_route, sm_keys):
+    aligned = []
+    sm_positions = {}
+    for index, (sm_key, _) in enumerate(sm_keys):
+        sm_positions.setdefault(sm_key, []).append(index)
     
-    #Parallel cursors to account for each route potentially having extra (unique) operations
-    rte_cursor = 0
+    #Pair the n-th RTE operation of a key with the n-th SM operation of that key
+    rte_matches = []
+    matched_sm = set()
+    used = {}
+    for rte_key, _ in rte_keys:
+        positions = sm_positions.get(rte_key, [])
+        count = used.get(rte_key, 0)
+        if count < len(positions):
+            rte_matches.append(positions[count])
+            matched_sm.add(positions[count])
+            used[rte_key] = count + 1
+        else:
+            rte_matches.append(None)
     sm_cursor = 0
     
+    def flush_sm_only(until):
+        for index in range(sm_cursor, until):
+            if index not in matched_sm:
+                sm_key, sm_op_num_str = sm_keys[index]
+                aligned.append(AlignedPair(SM_ONLY, sm_key, None, sm_route.operations[sm_op_num_str]))
     
+    for (rte_key, rte_op_num_str), sm_index in zip(rte_keys, rte_matches):
+        if sm_index == None:
+            aligned.append(AlignedPair(RTE_ONLY, rte_key, rte_route.operations[rte_op_num_str], None))
+            continue
+        if sm_index >= sm_cursor:
+            flush_sm_only(sm_index)
+            sm_cursor = sm_index + 1
+        sm_op_num_str = sm_keys[sm_index][1]
+        aligned.append(AlignedPair(MATCHED, rte_key, rte_route.operations[rte_op_num_str], sm_route.operations[sm_op_num_str]))
     
-    #Loop will run until the cursor for each route is at the route's last operation
-    comparing = True
+    flush_sm_only(len(sm_keys))
+    return aligned
+
+'''
+raised by a pipelined compare when a route isn't in operation number order, streams can only be merge-joined
+'''
+class RouteOrderError(Exception):
+    pass
+
+class RouteCursor():
     
-    while comparing:
-        #print('RTE cursor:', rte_cursor, 'SM cursor:', sm_cursor)
-        '''
-        Handling extra operations in either the RTE or SM sheet
-        If an SM sheet is present, check against sheet to see if can be neutralized
-        '''
-        
-        rte_op_num_str = rte_operation_nums[rte_cursor]
-        sm_op_num_str = sm_operation_nums[sm_cursor]
-        
-        
-        #If the current operation numbers do not equal each other, either the RTE or SM has an extra operation
-        if rte_operation_nums[rte_cursor] != sm_operation_nums[sm_cursor]:
-            print('[X]Operation misalign. RTE: ', rte_operation_nums[rte_cursor], 'SM:', sm_operation_nums[sm_cursor])
-            
-            #Store our operation numbers as floats for number comparisons
-            
-            
-            rte_op_num = float(rte_operation_nums[rte_cursor])
-            sm_op_num = float(sm_operation_nums[sm_cursor])
-            
-            #If the RTE contains an operation that is not in the SM 
-            #AND the SM contains and operation that is not in the RTE
-            #Consider a complete mismatch senario where both operations are considered extra
-            #Ignore cursors
-            if rte_route.has_operation(sm_op_num_str) == False and sm_route.has_operation(rte_op_num_str) == False:
-                #print('Complete mismatch!')
-                print('\t[X]Extra RTE operation', rte_op_num_str)
-                render_difference(rte_route.operations[rte_op_num_str], None)
-                print('\t[X]Extra SM operation', sm_op_num_str)
-                render_difference(None, sm_route.operations[sm_op_num_str])
-            
-            
-            
-            #If the SM operation number is ahead of the RTE, the RTE has an extra operation
-            elif rte_op_num < sm_op_num:
-                #Increment the RTE cursor until the operation numbers are realigned
-                while rte_op_num < sm_op_num:
-                    print('\t[X]Extra RTE operation', rte_op_num_str)
-                    render_difference(rte_route.operations[rte_op_num_str], None)
-                    #render_difference(rte_route.operations[rte_op_num_str], None)
-                    rte_cursor += 1                    
-                    rte_op_num = float(rte_operation_nums[rte_cursor])
-                    
-                print('[+]Operations realigned. RTE: ', rte_operation_nums[rte_cursor], 'SM:', sm_operation_nums[sm_cursor])
-                #Now need to compare realigned operaions
-                
-                rte_op_num_str = rte_operation_nums[rte_cursor]
-                sm_op_num_str = sm_operation_nums[sm_cursor]
-                print('[+]Comparing RTE:', rte_route.operations[rte_op_num_str], 'SM:', sm_route.operations[sm_op_num_str])
-                if rte_route.operations[rte_op_num_str] != sm_route.operations[sm_op_num_str]:
-                #Operation diff
-                    if (rte_route.operations[rte_op_num_str].part_of_change == False and 
-                        mm_route != None and
-                        mm_route.has_operation(rte_op_num_str) and 
-                        sm_route.operations[rte_op_num_str] == mm_route.operations[rte_op_num_str]):
-                        print('\t[+]Operation difference neutralized by MM sheet.:')
-                    else:
-                        render_difference(rte_route.operations[rte_op_num_str], sm_route.operations[sm_op_num_str])
-                else:
-                    print('\t[+]Operations equal.:', rte_route.operations[rte_op_num_str], 'SM:', sm_route.operations[sm_op_num_str])
-                
-                
-            #If the RTE operation number is ahead of the SM spreadsheet, the SM sheet has an extra operation
-            elif rte_op_num > sm_op_num:
-                #Increment the SM cursor until the operation numbers are realigned
-                while rte_op_num > sm_op_num:
-                    print('\tExtra SM operation', sm_op_num_str)
-                    render_difference(None, sm_route.operations[sm_op_num_str])
-                    #render_difference(None, sm_route.operations[sm_op_num_str])
-                    sm_cursor += 1
-                    sm_op_num = float(sm_operation_nums[sm_cursor])
-                    
-                print('[+]Operations realigned. RTE: ', rte_operation_nums[rte_cursor], 'SM:', sm_operation_nums[sm_cursor])
-                #Now need to compare realigned operaions
-                
-                rte_op_num_str = rte_operation_nums[rte_cursor]
-                sm_op_num_str = sm_operation_nums[sm_cursor]
-                if rte_route.operations[rte_op_num_str] != sm_route.operations[sm_op_num_str]:
-                #Operation diff
-                    if (rte_route.operations[rte_op_num_str].part_of_change == False and 
-                        mm_route != None and
-                        mm_route.has_operation(rte_op_num_str) and 
-                        sm_route.operations[rte_op_num_str] == mm_route.operations[rte_op_num_str]):
-                        print('\t[+]Operation difference neutralized by MM sheet.:')
-                    else:
-                        render_difference(rte_route.operations[rte_op_num_str], sm_route.operations[sm_op_num_str])
-                else:
-                    print('\t[+]Operations equal.:', rte_route.operations[rte_op_num_str], 'SM:', sm_route.operations[sm_op_num_str])
+    '''
+    forward-only view of an operation stream in increasing operation number order
+    @operations: iterator of Operations, e.g. a RouteStream
+    @name: sheet the stream is read from, for errors
+    @operation: current operation, None once the stream is exhausted
+    @key: operation_key of the current operation
+    '''
+    def __init__(self, operations, name):
+        self.operations = iter(operations)
+        self.name = name
+        self.operation = None
+        self.key = None
+        self.advance()
+    
+    '''
+    moves to the next operation of the stream
+    @raise RouteOrderError: the next operation number isn't numeric or isn't greater than the current one
+    '''
+    def advance(self):
+        previous = self.key
+        self.operation = next(self.operations, None)
+        if self.operation == None:
+            return
+        self.key = operation_key(str(self.operation))
+        if type(self.key) is not int:
+            raise RouteOrderError(self.name + ' operation ' + str(self.operation) + ' is not numeric')
+        if previous != None and self.key <= previous:
+            raise RouteOrderError(self.name + ' operation ' + str(self.operation) + ' is out of order')
+    
+    '''
+    returns the operation with the given key, None if the stream doesn't have it
+        operations before the key are skipped, so keys have to be asked for in increasing order
+    @param key: int key from operation_key
+    '''
+    def find_operation(self, key):
+        while self.operation != None and self.key < key:
+            self.advance()
+        if self.operation != None and self.key == key:
+            return self.operation
+        return None
+    
+    '''
+    reads the rest of the stream, checking its order
+    '''
+    def drain(self):
+        while self.operation != None:
+            self.advance()
+
+class KeyCursor():
+    
+    '''
+    forward-only lookup into a loaded route whose operations are in increasing operation number order,
+        the in-memory counterpart of RouteCursor: a walk in key order never builds the route's key index
+    @route: route looked into
+    @keys: the route's (key, operation number) pairs
+    @index: position of the first key not passed yet
+    '''
+    def __init__(self, route):
+        self.route = route
+        self.keys = route.get_operation_keys()
+        self.index = 0
+    
+    '''
+    returns the operation with the given key, None if the route doesn't have it
+        keys have to be asked for in increasing order
+    @param key: int key from operation_key
+    '''
+    def find_operation(self, key):
+        while self.index < len(self.keys) and self.keys[self.index][0] < key:
+            self.index += 1
+        if self.index == len(self.keys) or self.keys[self.index][0] != key:
+            return None
+        operation = self.route.operations.get(self.keys[self.index][1])
+        #A lazy route's operation is parsed by find_operation if it wasn't already
+        return operation if operation != None else self.route.find_operation(key)
+
+'''
+merge-join of two operation streams, the streaming form of merge_join
+@param rte_cursor: RouteCursor over the RTE operations
+@param sm_cursor: RouteCursor over the SM operations
+@raise RouteOrderError: a stream isn't in increasing operation number order
+@return: generator of AlignedPairs in output order
+'''
+def stream_join(rte_cursor, sm_cursor):
+    while rte_cursor.operation != None and sm_cursor.operation != None:
+        if rte_cursor.key == sm_cursor.key:
+            pair = AlignedPair(MATCHED, rte_cursor.key, rte_cursor.operation, sm_cursor.operation)
+            rte_cursor.advance()
+            sm_cursor.advance()
+        #The SM is ahead of the RTE, the RTE has an extra operation
+        elif rte_cursor.key < sm_cursor.key:
+            pair = AlignedPair(RTE_ONLY, rte_cursor.key, rte_cursor.operation, None)
+            rte_cursor.advance()
+        #The RTE is ahead of the SM, the SM has an extra operation
+        else:
+            pair = AlignedPair(SM_ONLY, sm_cursor.key, None, sm_cursor.operation)
+            sm_cursor.advance()
+        yield pair
+    
+    #Whichever stream has operations left over has extra trailing operations
+    while rte_cursor.operation != None:
+        yield AlignedPair(RTE_ONLY, rte_cursor.key, rte_cursor.operation, None)
+        rte_cursor.advance()
+    while sm_cursor.operation != None:
+        yield AlignedPair(SM_ONLY, sm_cursor.key, None, sm_cursor.operation)
+        sm_cursor.advance()
+
+'''
+compares the given routes and writes every difference to the report. RTE and SM routes must be present at a minimum
+    if MM route is present, logic will account for the sheet automatically
+@param report: ReportWorksheet or DiffWriter the differences are written to
+@param blocks: optional DiffBlocks, differences already rendered by the last run are copied from it (ReportWorksheet only)
+@param progress: optional callable(done, total), called every PROGRESS_OPERATIONS aligned operations
+'''
+
+def compare_routes(report, rte_route, sm_route, mm_route=None, blocks=None, progress=None):
+    write = partial(blocks.render, report) if blocks != None else report.write_diff
+    with METRICS.span('compare_routes'):
+        diffs = diff_routes(rte_route, sm_route, mm_route, progress)
+        #Cached blocks mostly skip the cell compare, so their rows are left to the blocks that get rendered
+        for diff in prepare_diffs(diffs) if blocks == None else diffs:
+            write(diff)
+
+'''
+passes diff records through, comparing the rows of the differences in batches of DIFF_BATCH_OPERATIONS
+    only the differences are held back until their batch is full and they keep their order; records that
+    aren't differences (which renderers skip) pass straight through, so equal operations are never kept for a batch
+    the routes are in memory anyway, the pipelined compare doesn't batch and compares each difference as it's rendered
+@param diffs: iterable of OperationDiffs
+@return: generator of the same OperationDiffs, the differences with their rows set
+'''
+def prepare_diffs(diffs):
+    differences = []
+    for diff in diffs:
+        if not diff.is_difference():
+            yield diff
+            continue
+        differences.append(diff)
+        if len(differences) == DIFF_BATCH_OPERATIONS:
+            set_diff_rows(differences)
+            for ready in differences:
+                yield ready
+            differences = []
+    set_diff_rows(differences)
+    for ready in differences:
+        yield ready
+
+'''
+sets the rows of several operation differences, their cells are compared in one batch
+@param diffs: OperationDiffs of one of the DIFFERENCE_KINDS, the ones whose rows are already set are left alone
+'''
+def set_diff_rows(diffs):
+    diffs = [diff for diff in diffs if diff.rows == None]
+    if diffs:
+        for diff, rows in zip(diffs, diff_operations_rows([(diff.rte, diff.sm) for diff in diffs])):
+            diff.rows = rows
+
+'''
+compares the given routes operation by operation, without rendering anything
+@param rte_route: RTE (submitted) route
+@param sm_route: SM (staged) route
+@param mm_route: optional MM (production) route, SM operations equal to it neutralize differences outside the scope of change
+@param progress: optional callable(done, total), called every PROGRESS_OPERATIONS aligned operations
+@return: generator of OperationDiffs in report order, one per aligned operation
+'''
+def diff_routes(rte_route, sm_route, mm_route=None, progress=None):
+    
+    with METRICS.span('align_routes'):
+        pairs = align_routes(rte_route, sm_route)
+    
+    #Every RTE/SM pair is compared exactly once, here; the loop below only reuses the result
+    equal = [pair.kind == MATCHED and pair.rte == pair.sm for pair in pairs]
+    
+    #A lazy MM route parses every operation the loop below can ask for in a single pass over its sheet
+    if isinstance(mm_route, LazyRoute):
+        mm_route.load_operations([pair.key for pair, pair_equal in zip(pairs, equal)
+                                  if pair.kind == MATCHED and not pair_equal and pair.rte.part_of_change == False])
+    
+    #Sorted routes walk MM along with the aligned pairs instead of looking each operation up
+    mm_lookup = mm_route
+    if (mm_route != None and keys_sorted(mm_route.get_operation_keys())
+            and keys_sorted(rte_route.get_operation_keys()) and keys_sorted(sm_route.get_operation_keys())):
+        mm_lookup = KeyCursor(mm_route)
+    
+    #Checked once, the loop only builds per operation messages when they will be shown
+    debug = LOGGER.isEnabledFor(logging.DEBUG)
+    for index, pair in enumerate(pairs):
+        if progress != None and index % PROGRESS_OPERATIONS == 0:
+            progress(index, len(pairs))
+        yield classify_pair(pair, equal[index], mm_lookup, debug)
+
+'''
+classifies one aligned pair of operations, comparing the RTE and SM operations first
+@param pair: AlignedPair from align_routes or stream_join
+@param mm_route: MM route (or RouteCursor) to neutralize with, None without an MM sheet
+@param debug: log the comparison of the pair
+@return: OperationDiff
+'''
+def diff_pair(pair, mm_route=None, debug=False):
+    return classify_pair(pair, pair.kind == MATCHED and pair.rte == pair.sm, mm_route, debug)
+
+'''
+classifies one aligned pair of operations whose RTE/SM comparison is known,
+    checking a difference outside the scope of change against MM; SM and MM are compared at most once
+@param pair: AlignedPair from align_routes or stream_join
+@param equal: the pair is MATCHED and its operations are equal
+@param mm_route: MM route, KeyCursor or RouteCursor to neutralize with, None without an MM sheet
+@param debug: log the comparison of the pair
+@return: OperationDiff
+'''
+def classify_pair(pair, equal, mm_route=None, debug=False):
+    
+    #Extra operations in either the RTE or SM sheet
+    if pair.kind == RTE_ONLY:
+        if debug:
+            LOGGER.debug('\t[X]Extra RTE operation %s', pair.rte)
+        return OperationDiff(RTE_ONLY, pair.key, pair.rte, None)
+    elif pair.kind == SM_ONLY:
+        if debug:
+            LOGGER.debug('\t[X]Extra SM operation %s', pair.sm)
+        return OperationDiff(SM_ONLY, pair.key, None, pair.sm)
+    
+    #Operation numbers are equal, proceed to normal operation comparison
+    if debug:
+        LOGGER.debug('[+]Comparing RTE: %s SM: %s', pair.rte, pair.sm)
+    if equal:
+        if debug:
+            LOGGER.debug('\t[+]Operations equal.: %s SM: %s', pair.rte, pair.sm)
+        return OperationDiff(EQUAL, pair.key, pair.rte, pair.sm)
+    if pair.rte.part_of_change:
+        return OperationDiff(CHANGED, pair.key, pair.rte, pair.sm)
     
-            #Safe check - if control falls here means that somehow the operation numbers are not less than/ greater than eachother AND not equal to eachother...
+    #Operation diff outside the scope of change, if an MM sheet is present check against it to see if it can be neutralized
+    #(a lazy MM route parses just these operations)
+    mm_operation = mm_route.find_operation(pair.key) if mm_route != None else None
+    if (mm_operation != None and
+            pair.sm == mm_operation):
+        if debug:
+            LOGGER.debug('\t[+]Operation difference neutralized by MM sheet.:')
+        METRICS.count(MM_NEUTRALIZATIONS)
+        return OperationDiff(NEUTRALIZED, pair.key, pair.rte, pair.sm, mm_operation)
+    return OperationDiff(CHANGED_OUT_OF_SCOPE, pair.key, pair.rte, pair.sm)
+
+'''
+shortest edit script between two lists of row fingerprints (Myers' O(ND) diff)
+    the work done grows with the number of inserted/deleted rows, not the operation size
+@param rte_rows: fingerprints of the RTE operation's rows
+@param sm_rows: fingerprints of the SM operation's rows
+@return: list of (tag, rte_index, sm_index) steps in order, tag is 'equal', 'delete' (RTE-only row)
+    or 'insert' (SM-only row); the index of the side a step doesn't touch is None
+'''
+def diff_rows(rte_rows, sm_rows):
+    n = len(rte_rows)
+    m = len(sm_rows)
+    
+    #Forward pass: furthest reaching x on each diagonal k, one snapshot per edit distance d
+    furthest = {1: 0}
+    trace = []
+    for d in range(n + m + 1):
+        trace.append(dict(furthest))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and furthest[k - 1] < furthest[k + 1]):
+                x = furthest[k + 1]
             else:
-                print('[X]You should not be here, check operation alignment loop.')
-        #Operation numbers are equal, proceed to normal operation comparison
+                x = furthest[k - 1] + 1
+            y = x - k
+            while x < n and y < m and rte_rows[x] == sm_rows[y]:
+                x += 1
+                y += 1
+            furthest[k] = x
+            if x >= n and y >= m:
+                break
         else:
-            print('[+]Comparing RTE:', rte_route.operations[rte_op_num_str], 'SM:', sm_route.operations[sm_op_num_str])
-            #print('[+]Operation numbers equal. RTE:', rte_operation_nums[rte_cursor], 'SM:', sm_operation_nums[sm_cursor])
-            if rte_route.operations[rte_op_num_str] != sm_route.operations[sm_op_num_str]:
-                #Operation diff
-                if (rte_route.operations[rte_op_num_str].part_of_change == False and 
-                        mm_route != None and
-                        mm_route.has_operation(rte_op_num_str) and 
-                        sm_route.operations[rte_op_num_str] == mm_route.operations[rte_op_num_str]):
-                        print('\t[+]Operation difference neutralized by MM sheet.:')
-                else:
-                    render_difference(rte_route.operations[rte_op_num_str], sm_route.operations[sm_op_num_str])
+            continue
+        break
+    
+    #Backtrack from (n, m) through the snapshots to recover the edit steps
+    steps = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        snapshot = trace[d]
+        k = x - y
+        if k == -d or (k != d and snapshot[k - 1] < snapshot[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = snapshot[prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            steps.append(('equal', x, y))
+        if d > 0:
+            if x == prev_x:
+                steps.append(('insert', None, prev_y))
             else:
-                print('\t[+]Operations equal.:', rte_route.operations[rte_op_num_str], 'SM:', sm_route.operations[sm_op_num_str])
-        #Increment our loop control variables
-        rte_cursor += 1
-        sm_cursor += 1
-        
+                steps.append(('delete', prev_x, None))
+        x, y = prev_x, prev_y
+    steps.reverse()
+    return steps
+
+'''
+counts the non-empty cells two rows have in common, used to pair up changed rows
+'''
+def row_similarity(rte_fingerprint, sm_fingerprint):
+    return sum(1 for rte_value, sm_value in zip(rte_fingerprint, sm_fingerprint) if rte_value == sm_value and rte_value != '')
+
+'''
+aligns the rows of two operations so inserted and deleted rows are detected as such
+    rows with equal fingerprints are matched by diff_rows; inside each changed block,
+    deleted RTE rows are paired with the most similar SM row still ahead of them so that
+    an edited row renders as one row of cell differences instead of a delete and an insert
+@param rte_operation: RTE operation, None for an extra SM operation
+@param sm_operation: SM operation, None for an extra RTE operation
+@return: list of (rte_row, sm_row) OperationRow pairs, None for a row missing on that side
+'''
+def align_operation_rows(rte_operation, sm_operation):
+    rte_rows = rte_operation.rows if rte_operation != None else []
+    sm_rows = sm_operation.rows if sm_operation != None else []
+    rte_fingerprints = rte_operation.get_row_fingerprints() if rte_operation != None else []
+    sm_fingerprints = sm_operation.get_row_fingerprints() if sm_operation != None else []
+    
+    aligned = []
+    deleted = []
+    inserted = []
+    
+    def flush_block():
+        sm_cursor = 0
+        for rte_index in deleted:
+            best_index = None
+            best_score = 0
+            for sm_position in range(sm_cursor, len(inserted)):
+                score = row_similarity(rte_fingerprints[rte_index], sm_fingerprints[inserted[sm_position]])
+                if score > best_score:
+                    best_index = sm_position
+                    best_score = score
+            if best_index == None:
+                aligned.append((rte_rows[rte_index], None))
+                continue
+            for sm_position in range(sm_cursor, best_index):
+                aligned.append((None, sm_rows[inserted[sm_position]]))
+            aligned.append((rte_rows[rte_index], sm_rows[inserted[best_index]]))
+            sm_cursor = best_index + 1
+        for sm_position in range(sm_cursor, len(inserted)):
+            aligned.append((None, sm_rows[inserted[sm_position]]))
+        del deleted[:]
+        del inserted[:]
+    
+    for tag, rte_index, sm_index in diff_rows(rte_fingerprints, sm_fingerprints):
+        if tag == 'equal':
+            flush_block()
+            aligned.append((rte_rows[rte_index], sm_rows[sm_index]))
+        elif tag == 'delete':
+            deleted.append(rte_index)
+        else:
+            inserted.append(sm_index)
+    flush_block()
+    return aligned
+
+'''
+compares the aligned rows of two operations cell by cell
+@param rte_operation: RTE operation, None for an extra SM operation
+@param sm_operation: SM operation, None for an extra RTE operation
+@return: list of RowDiffs in output order
+'''
+def diff_operation_rows(rte_operation, sm_operation):
+    return diff_operations_rows([(rte_operation, sm_operation)])[0]
+
+'''
+aligns the rows of several pairs of operations and compares all of their cells at once, see cell_diff
+@param operation_pairs: list of (RTE operation, SM operation), None for the missing side
+@return: list of RowDiffs in output order for each pair
+'''
+def diff_operations_rows(operation_pairs):
+    with METRICS.span('align_rows', operations=len(operation_pairs)):
+        aligned_pairs = [align_operation_rows(rte_operation, sm_operation) for rte_operation, sm_operation in operation_pairs]
+    
+    #Part of change comes from the RTE row, or from the only row of a one-sided row
+    changed, orange = diff_cells([(rte_row.values if rte_row != None else None,
+                                   sm_row.values if sm_row != None else None,
+                                   rte_row.flags if rte_row != None else sm_row.flags)
+                                  for aligned in aligned_pairs for rte_row, sm_row in aligned])
+    
+    operations_rows = []
+    start = 0
+    for aligned in aligned_pairs:
+        operations_rows.append([RowDiff(rte_row, sm_row, changed[start + index], orange[start + index])
+                                for index, (rte_row, sm_row) in enumerate(aligned)])
+        start += len(aligned)
+    return operations_rows
+
+'''
+renders a RowDiff as a report row, changed cells are orange if part of change, blue otherwise
+    the missing side of a one-sided row is rendered as empty cells
+'''
+def render_row_diff(row_diff):
+    temp_row = []
+    changed = row_diff.changed
+    orange = row_diff.orange
+    if row_diff.rte != None and row_diff.sm != None:
+        pairs = zip(row_diff.rte.values, row_diff.sm.values)
+    elif row_diff.rte != None:
+        pairs = ((value, '') for value in row_diff.rte.values)
+    else:
+        pairs = (('', value) for value in row_diff.sm.values)
+    for column, (rte_value, sm_value) in enumerate(pairs):
+        if changed >> column & 1:
+            diff = ORANGE if orange >> column & 1 else BLUE
+            temp_row.append(create_cell(rte_value, 'RTE', diff))
+            temp_row.append(create_cell(sm_value, 'SM', diff))
+        else:
+            temp_row.append(create_cell(rte_value, 'RTE'))
+            temp_row.append(create_cell(sm_value, 'SM'))
+    return temp_row
+
+'''
+yields the DiffRecords of an operation difference, one per cell render_difference highlights
+@param diff: OperationDiff of one of the DIFFERENCE_KINDS
+@return: generator of DiffRecords
+'''
+def get_difference_records(diff):
+    operation_no = diff.get_operation_no()
+    for row_number, row_diff in enumerate(diff.get_rows(), 1):
+        rte_values = row_diff.rte.values if row_diff.rte != None else None
+        sm_values = row_diff.sm.values if row_diff.sm != None else None
+        for column in range(len(rte_values if rte_values != None else sm_values)):
+            if row_diff.changed >> column & 1:
+                yield DiffRecord(operation_no, row_number, get_output_header(column),
+                                 rte_values[column] if rte_values != None else '',
+                                 sm_values[column] if sm_values != None else '',
+                                 ORANGE if row_diff.orange >> column & 1 else BLUE)
+
+'''
+returns the OUTPUT_HEADERS name of a 0 based column, 'Column N' past the known headers
+'''
+def get_output_header(column):
+    if column < len(OUTPUT_HEADERS):
+        return OUTPUT_HEADERS[column]
+    return 'Column ' + str(column + 1)
+
+'''
+renders an operation difference to the report
+    rows are aligned first, so an inserted or deleted row only highlights itself
+@param report: ReportWorksheet to render to
+@param diff: OperationDiff of one of the DIFFERENCE_KINDS
+'''
+def render_difference(report, diff):
+    LOGGER.debug('\t[+]Writing operation difference.')
+    
+    with METRICS.span('render_difference'):
+        write_operation_header(report)
+        for row_diff in diff.get_rows():
+            report.add_row(render_row_diff(row_diff))
+
+'''
+names the SM and MM sheets an RTE route is compared against, for DiffBlocks.from_cache
+@param sources: (workbook path, sheet) pairs of the SM and MM routes, None for a missing route
+@return: str
+'''
+def get_blocks_target(*sources):
+    return '|'.join(os.path.abspath(source[0]) + '::' + source[1] if source != None else '' for source in sources)
+
+class DiffBlocks():
+    
+    '''
+    rendered operation differences kept from one compare of a route to the next
+        a block is reused only if both of its operations still have the same render digest,
+        the rendered rows depend on nothing else, so re-runs only render the operations that changed
+    @previous: (RTE operation number, SM operation number) -> ((RTE digest, SM digest), rows) from the last run,
+        rows are lists of (value, BLOCK_FILLS index) pairs, None for an operation header
+    @current: the same for the blocks rendered by this run
+    @key: cache key the blocks are stored under, see from_cache
+    '''
+    def __init__(self, previous=None, key=None):
+        self.previous = previous if previous != None else {}
+        self.current = {}
+        self.key = key
+    
+    '''
+    loads the blocks cached by the last compare of a route against the same target
+    @param cache: RouteCache
+    @param route: RTE route being compared, its route and product ID name the entry
+    @param target: what the route is compared against, see get_blocks_target;
+        compares of one route against different SM/MM sheets keep their own entries
+    @return: DiffBlocks, empty if nothing is cached yet
+    '''
+    @classmethod
+    def from_cache(cls, cache, route, target):
+        key = cache.make_name_key(DIFF_BLOCKS_NAME, route.get_route_id(), route.get_product_id(), target, PARSER_VERSION)
+        return cls(cache.get(key), key)
+    
+    '''
+    stores this run's blocks for the next compare, blocks that weren't rendered this time are dropped
+    @param cache: RouteCache the blocks were loaded from
+    '''
+    def save(self, cache):
+        cache.put(self.key, self.current)
+    
+    '''
+    writes a diff record like ReportWorksheet.write_diff, copying the block from the last run if neither operation changed
+        a copied block never aligns or compares the operation's rows
+    @param report: ReportWorksheet to render to
+    @param diff: OperationDiff from diff_routes
+    '''
+    def render(self, report, diff):
+        if not diff.is_difference():
+            return
+        rte_operation = diff.rte
+        sm_operation = diff.sm
+        key = (str(rte_operation) if rte_operation != None else None,
+               str(sm_operation) if sm_operation != None else None)
+        digests = (rte_operation.get_render_digest() if rte_operation != None else None,
+                   sm_operation.get_render_digest() if sm_operation != None else None)
         
-        #If the RTE or SM cursors are at the end of the routes, we are done comparing
-        if rte_cursor == rte_route.get_num_operations() or sm_cursor == sm_route.get_num_operations():
-            comparing = False
-    
-    #If either route is not equal to its cursor, it has extra trailing operations. 
-    #For example, RTE-SM match for operations 1-10, but SM has operations 11-15, where RTE only has 1-10
-    #Can assume these operations are equal
-    while rte_cursor != rte_route.get_num_operations():
-        rte_op_num_str = rte_operation_nums[rte_cursor]
-        print('[X]Extra RTE operation', rte_op_num_str)
-        render_difference(rte_route.operations[rte_op_num_str], None)
-        rte_cursor += 1   
-    while sm_cursor != sm_route.get_num_operations():
-        sm_op_num_str = sm_operation_nums[sm_cursor]
-        print('[X]Extra SM operation', sm_op_num_str)
-        render_difference(None, sm_route.operations[sm_op_num_str])
-        sm_cursor += 1 
-
-def render_difference(rte_operation, sm_operation):
-    print('\t[+]Writing operation difference.')
-    
-    write_header()
-    row_counter = 0
-    if type(rte_operation) == Operation and type(sm_operation) == Operation:
-        for rte_row, sm_row in zip(rte_operation.rows, sm_operation.rows):
-            temp_row = []
-            for rte_cell, sm_cell in zip(rte_row, sm_row):
-                if rte_cell.value != sm_cell.value and part_of_change(rte_cell):
-                    temp_row.append(create_cell(rte_cell.value, 'RTE', ORANGE))
-                    temp_row.append(create_cell(sm_cell.value, 'SM', ORANGE))
-                elif rte_cell.value != sm_cell.value and not part_of_change(rte_cell):
-                    temp_row.append(create_cell(rte_cell.value, 'RTE', BLUE))
-                    temp_row.append(create_cell(sm_cell.value, 'SM', BLUE))
+        block = self.previous.get(key)
+        if block != None and block[0] == digests:
+            for row in block[1]:
+                if row == None:
+                    report.add_row(OPERATION_HEADER_ROW)
                 else:
-                    temp_row.append(create_cell(rte_cell.value, 'RTE'))
-                    temp_row.append(create_cell(sm_cell.value, 'SM'))
-            row_counter += 1
-            output_worksheet.append(temp_row)
-    
-    #print('Row Counter:', row_counter, 'RTE Rows', len(rte_operation.rows), 'SM Rows', len(sm_operation.rows))
-    #Extra RTE line
-    while rte_operation != None and len(rte_operation.rows) > row_counter:
-        temp_row = []
-        row = [cell for cell in rte_operation.rows[row_counter]]
-        for cell in row:
-            if part_of_change(cell):
-                temp_row.append(create_cell(cell.value, 'RTE', ORANGE))
-                temp_row.append(create_cell('', 'SM'))
-            else:
-                temp_row.append(create_cell(cell.value, 'RTE', BLUE))
-                temp_row.append(create_cell('', 'SM'))
-        output_worksheet.append(temp_row)
-        row_counter += 1
-                
-    while sm_operation != None and len(sm_operation.rows) > row_counter:
-        temp_row = []
-        row = [cell for cell in sm_operation.rows[row_counter]]
-        for cell in row:
-            if part_of_change(cell):
-                temp_row.append(create_cell(cell.value, 'RTE', ORANGE))
-                temp_row.append(create_cell('', 'SM'))
-            else:
-                temp_row.append(create_cell(cell.value, 'RTE', BLUE))
-                temp_row.append(create_cell('', 'SM'))
-        output_worksheet.append(temp_row)        
-        row_counter += 1
+                    report.add_row([(value, BLOCK_FILLS[code]) for value, code in row])
+            METRICS.count(BLOCKS_REUSED)
+        else:
+            start = len(report.body)
+            render_difference(report, diff)
+            block = (digests, [None if row is OPERATION_HEADER_ROW
+                               else [(value, BLOCK_FILL_CODES[id(fill)]) for value, fill in row]
+                               for row in report.body[start:]])
+        self.current[key] = block
 
 '''
 @OrderedDict: Used as main data structure to store operations in the form
@@ -414,10 +1363,14 @@ def render_difference(rte_operation, sm_operation):
 @Route: Stores all operations for a given route.
 '''
 
-def get_output_options():
+'''
+returns the verification tabs ticked on the home sheet
+@param sink: StatusSink of the Home sheet
+'''
+def get_output_options(sink):
 
-    labels = xw.Range('H2:H9').value
-    flags = xw.Range('I2:I9').value
+    labels = sink.read('H2:H9')
+    flags = sink.read('I2:I9')
     return [label for label, flag in zip(labels, flags) if flag]
 
 
@@ -433,6 +1386,8 @@ class Route():
         self.route_id = None
         self.product_id = None
         self.route_type = None
+        self.operation_keys = None
+        self.key_index = None
         
     '''
     @return: returns the route id if not None, else 'NoSetRouteID' as error message
@@ -449,7 +1404,10 @@ class Route():
         assuming operations are in sequential order
     '''
     def add_operation(self, operation):
+        operation.compute_digest()
         self.operations[str(operation)] = operation
+        self.operation_keys = None
+        self.key_index = None
         
     '''
     returns the route's operations to the caller
@@ -493,6 +1451,34 @@ class Route():
     def get_operation_nums(self):
         return list(self.operations.keys())
     
+    '''
+    returns the route's operations as (key, operation number) pairs in sheet order
+        keys are computed once and cached until another operation is added
+    @return: list of (int key, operation number str) tuples
+    '''
+    def get_operation_keys(self):
+        if self.operation_keys == None:
+            self.operation_keys = [(operation_key(operation_no), operation_no) for operation_no in self.operations]
+        return self.operation_keys
+    
+    '''
+    returns the operation with the given key, None if the route doesn't have it
+    @param key: key from operation_key
+    '''
+    def find_operation(self, key):
+        if self.key_index == None:
+            self.key_index = {key: self.operations[operation_no] for key, operation_no in self.get_operation_keys()}
+        return self.key_index.get(key)
+    
+    '''
+    builds the operation keys and the key index up front, a route compared against several others
+        (or copied to several worker processes) then builds them only once
+    '''
+    def build_index(self):
+        self.get_operation_keys()
+        #Looking up a key no operation has builds the index without parsing anything
+        self.find_operation(-1)
+    
     '''
     returns the last operation of the route to the caller
     @return: returns the last operation to the caller
@@ -523,8 +1509,362 @@ class Route():
     def get_product_id(self):
         return self.product_id
     
+class LazyRoute(Route):
+    
+    '''
+    route indexed by operation number only, each operation is parsed from the sheet the first time it's needed
+        used for the MM baseline, which compare_routes only consults for the few operations RTE and SM disagree on
+    @workbook_path: workbook the operations are read from
+    @sheetname: sheet holding the route
+    @column_map: ColumnMap of the sheet, applied to the rows of each operation parsed
+    @row_ranges: operation number -> (first, last) 0 based row indexes of the operation, in sheet order
+    @operations: the operations parsed so far
+    '''
+    def __init__(self, workbook_path, sheetname, column_map=None):
+        Route.__init__(self)
+        self.workbook_path = workbook_path
+        self.sheetname = sheetname
+        self.column_map = column_map
+        self.row_ranges = OrderedDict()
+    
+    '''
+    records where an operation's rows are, a repeated operation number replaces the earlier one
+    @param operation_no: operation number as returned by Operation.fix_operation_no
+    @param first: 0 based index of the operation's first row
+    @param last: 0 based index of the operation's last row
+    '''
+    def add_row_range(self, operation_no, first, last):
+        self.row_ranges[operation_no] = (first, last)
+        self.operation_keys = None
+        self.key_index = None
+    
+    '''
+    drops an indexed operation, if a repeated operation number hasn't replaced it since
+    @param operation_no: operation number given to add_row_range
+    @param first: 0 based index of the operation's first row
+    '''
+    def remove_row_range(self, operation_no, first):
+        if self.row_ranges.get(operation_no, (None,))[0] == first:
+            del self.row_ranges[operation_no]
+            self.operation_keys = None
+            self.key_index = None
+    
+    '''
+    returns every operation in sheet order, parsing the ones not loaded yet
+    '''
+    def get_operations(self):
+        self.load_operations([key for key, operation_no in self.get_operation_keys()])
+        return OrderedDict((operation_no, self.operations[operation_no]) for operation_no in self.row_ranges)
+    
+    '''
+    returns the number of indexed operations, none have to be parsed
+    '''
+    def get_num_operations(self):
+        return len(self.row_ranges)
+    
+    '''
+    returns the indexed operation numbers in sheet order
+    '''
+    def get_operation_nums(self):
+        return list(self.row_ranges.keys())
+    
+    '''
+    returns the route's operations as (key, operation number) pairs in sheet order, from the index
+    '''
+    def get_operation_keys(self):
+        if self.operation_keys == None:
+            self.operation_keys = [(operation_key(operation_no), operation_no) for operation_no in self.row_ranges]
+        return self.operation_keys
+    
+    '''
+    returns the last operation of the route, parsing it if needed
+    '''
+    def get_last_operation(self):
+        key, operation_no = self.get_operation_keys()[-1]
+        return self.find_operation(key)
+    
+    '''
+    returns true if the route has the given operation number, false otherwise
+    '''
+    def has_operation(self, operation):
+        return operation in self.row_ranges
+    
+    '''
+    returns the operation with the given key, parsing it on first use; None if the route doesn't have it
+    @param key: key from operation_key
+    '''
+    def find_operation(self, key):
+        if self.key_index == None:
+            self.key_index = {key: operation_no for key, operation_no in self.get_operation_keys()}
+        operation_no = self.key_index.get(key)
+        if operation_no == None:
+            return None
+        if operation_no not in self.operations:
+            self.load_operations([key])
+        return self.operations[operation_no]
+    
+    '''
+    parses the operations with the given keys in one pass over the sheet,
+        only their rows are converted and reading stops after the last of them
+    @param keys: keys from operation_key, unknown and already loaded keys are skipped
+    '''
+    def load_operations(self, keys):
+        if self.key_index == None:
+            self.key_index = {key: operation_no for key, operation_no in self.get_operation_keys()}
+        operation_nos = set(self.key_index[key] for key in keys if key in self.key_index) - set(self.operations)
+        if not operation_nos:
+            return
+        
+        ranges = sorted(self.row_ranges[operation_no] for operation_no in operation_nos)
+        wanted = set()
+        for first, last in ranges:
+            wanted.update(range(first, last + 1))
+        
+        with METRICS.span('load_operations', sheet=self.sheetname, operations=len(ranges)):
+            reader = SheetReader(self.workbook_path)
+            try:
+                rows = reader.read_row_ranges(self.sheetname, ranges)
+                
+                #Sheets the reader can't seek in are streamed up to the last row needed
+                if rows == None:
+                    rows = {}
+                    for index, row in enumerate(reader.iter_rows(self.sheetname, wanted=wanted)):
+                        if index > ranges[-1][1]:
+                            break
+                        if index in wanted:
+                            rows[index] = row
+            finally:
+                reader.close()
+            
+            for first, last in ranges:
+                operation = Operation()
+                for index in range(first, last + 1):
+                    if index in rows:
+                        operation.add_row(self.column_map.apply(OperationRow(*rows[index])))
+                self.operations[str(operation)] = operation
+                operation.compute_digest()
+        METRICS.count(OPERATIONS_PARSED, len(ranges))
+
+class SpilledRoute(Route):
+    
+    '''
+    route whose operation rows are spilled to an OperationStore on disk, for routes too big to hold in memory
+        operations maps operation numbers to SpilledOperations, which keep just the number, digest and scope flags
+    @store: OperationStore holding the rows, deleted by close
+    '''
+    def __init__(self):
+        Route.__init__(self)
+        self.store = OperationStore()
+    
+    '''
+    writes the operation's rows to the store and indexes it by operation number
+    @param operation: Operation parsed from the sheet, not kept
+    '''
+    def add_operation(self, operation):
+        operation.compute_digest()
+        self.operations[str(operation)] = SpilledOperation(operation, self.store)
+        self.operation_keys = None
+        self.key_index = None
+    
+    '''
+    deletes the store, the route's IDs and operation count stay available
+    '''
+    def close(self):
+        self.store.remove()
+
+class StreamedRoute(Route):
+    
+    '''
+    route of a pipelined compare: its operations went straight from the parsing process to the compare
+        and aren't kept, only the route's IDs and operation count are
+    @num_operations: number of operations streamed
+    '''
+    def __init__(self):
+        Route.__init__(self)
+        self.num_operations = 0
+    
+    '''
+    returns the number of operations streamed
+    '''
+    def get_num_operations(self):
+        return self.num_operations
+
+class OperationRow():
+    
+    '''
+    compact, openpyxl-free copy of one spreadsheet row
+    @values: tuple of the row's cell values
+    @flags: bitmask of the row's fills
+        ROW_RED is set if any cell carries the red removal fill,
+        bit (n + 1) is set if column n is highlighted as part of change
+    '''
+    __slots__ = ('values', 'flags')
+    
+    def __init__(self, values, flags=0):
+        self.values = values
+        self.flags = flags
+    
+    '''
+    converts a row of openpyxl cells, reading each cell's value once and its fill from the style table
+    @param row: row from openpyxl ReadOnlyWorksheet
+    @param style_flags: table from get_style_flags of the cells' workbook, None reads each cell's fill
+    @return: OperationRow holding the row's values and fill flags
+    '''
+    @classmethod
+    def from_cells(cls, row, style_flags):
+        values = []
+        flags = 0
+        for column, cell in enumerate(row):
+            values.append(cell.value)
+            #Padding cells have no style
+            if cell is EMPTY_CELL:
+                continue
+            if style_flags == None:
+                style = get_fill_flags(cell.fill)
+            else:
+                style = style_flags[cell._style_id] if cell._style_id < len(style_flags) else 0
+            if style & STYLE_CHANGE:
+                flags |= 1 << (column + 1)
+                if style & STYLE_RED:
+                    flags |= ROW_RED
+        return cls(tuple(values), flags)
+    
+    '''
+    returns true if every cell in the row is None or ''
+    '''
+    def is_blank(self):
+        return all(value == None or value == '' for value in self.values)
+    
+    '''
+    returns true if any cell in the row has the red removal fill
+    '''
+    def is_red(self):
+        return self.flags & ROW_RED != 0
+    
+    '''
+    returns true if any cell in the row is highlighted as part of change
+    '''
+    def has_change(self):
+        return self.flags & ~ROW_RED != 0
+    
+    '''
+    returns true if the cell in the given column is highlighted as part of change
+    @param column: 0 based column index
+    '''
+    def part_of_change(self, column):
+        return self.flags >> (column + 1) & 1 == 1
+    
+'''
+returns a header name in the form column maps match on: lower case, runs of whitespace as one space
+'''
+def normalize_header(value):
+    return ' '.join(stringify(value).split()).lower() if value != None else ''
+
+'''
+returns true if the row is a route sheet's column header row, the one holding 'Full Oper Num'
+'''
+def is_header_row(values):
+    return any(stringify(value) == OPERATION_START for value in values if value != None)
+
+class ColumnMap():
+    
+    '''
+    maps a route sheet's columns onto the OUTPUT_HEADERS layout by the names in its 'Full Oper Num' header row,
+        so sheets with reordered or extra columns compare like any other
+        a column whose name isn't in the header row is read from its usual position if the header there isn't
+        another known name (older sheets label some columns differently), otherwise it comes out None like
+        projected out columns (without their change fill); other columns OUTPUT_HEADERS doesn't name are left out
+    @sources: 0 based sheet column of each OUTPUT_HEADERS column, None if missing or projected out
+    @header_row: 0 based index of the header row the map was read from
+    @identity: the sheet has the OUTPUT_HEADERS layout and nothing is projected out, rows are kept as read
+    @getter: itemgetter picking the sources out of a row's values, a missing source picks the None appended to them
+    @change_columns: (column, source) pairs of the mapped columns, for moving the change fill flags
+    @width: number of values a row needs for every source to be in it
+    @unknown: header names OUTPUT_HEADERS doesn't have whose columns are left out
+    '''
+    def __init__(self, sources, header_row):
+        self.sources = sources
+        self.header_row = header_row
+        self.identity = all(source == column for column, source in enumerate(sources))
+        self.getter = itemgetter(*[source if source != None else -1 for source in sources])
+        self.change_columns = [(column, source) for column, source in enumerate(sources) if source != None]
+        self.width = max([source + 1 for source in sources if source != None] or [0])
+        self.unknown = []
+    
+    '''
+    builds the map of a sheet from its header row
+    @param values: values of the header row
+    @param header_row: 0 based index of the header row
+    @param ignored_columns: OUTPUT_HEADERS names projected out of the compare, 'Full Oper Num' is always kept
+    @return: ColumnMap
+    '''
+    @classmethod
+    def from_header(cls, values, header_row, ignored_columns=()):
+        names = [normalize_header(value) for value in values]
+        known = set(normalize_header(name) for name in OUTPUT_HEADERS)
+        positions = {}
+        for column, name in enumerate(names):
+            positions.setdefault(name, column)
+        ignored = set(normalize_header(name) for name in ignored_columns) - {normalize_header(OPERATION_START)}
+        
+        sources = []
+        for column, name in enumerate(OUTPUT_HEADERS):
+            name = normalize_header(name)
+            if name in ignored:
+                sources.append(None)
+            elif name in positions:
+                sources.append(positions[name])
+            elif column < len(names) and names[column] not in known:
+                sources.append(column)
+            else:
+                sources.append(None)
+        
+        column_map = cls(sources, header_row)
+        column_map.unknown = [stringify(values[column]) for column, name in enumerate(names)
+                              if name and name not in known and column not in sources]
+        return column_map
+    
+    '''
+    returns the sheet column holding the operation numbers
+    '''
+    def get_operation_column(self):
+        return self.sources[COL_B]
+    
+    '''
+    returns the sheet columns the map doesn't read, None if it reads them all
+    @param max_column: number of columns of the sheet
+    '''
+    def get_skipped_columns(self, max_column):
+        skipped = set(range(max_column)) - set(self.sources)
+        return skipped if skipped else None
+    
+    '''
+    returns the row in OUTPUT_HEADERS layout, the red removal flag is kept whatever column it came from
+    @param row: OperationRow as read from the sheet
+    @return: OperationRow of len(OUTPUT_HEADERS) values
+    '''
+    def apply(self, row):
+        if self.identity and len(row.values) == len(self.sources):
+            return row
+        values = row.values
+        if len(values) < self.width:
+            values += (None,) * (self.width - len(values))
+        values = self.getter(values + (None,))
+        flags = row.flags & ROW_RED
+        if row.flags > ROW_RED:
+            for column, source in self.change_columns:
+                if row.flags >> (source + 1) & 1:
+                    flags |= 1 << (column + 1)
+        return OperationRow(values, flags)
+
 class Operation():
     
+    '''
+    @rows: list of OperationRows; no openpyxl objects are kept once a row is added
+    @digest: content fingerprint of the rows, computed once the operation is loaded
+    '''
+    __slots__ = ('rows', 'flagged_for_removal', 'part_of_change', 'digest')
+    
     '''
     constructor
     '''
@@ -532,6 +1872,7 @@ class Operation():
         self.rows = []
         self.flagged_for_removal = False
         self.part_of_change = False
+        self.digest = None
         
     '''
     returns the current operation's full operation number 
@@ -539,29 +1880,28 @@ class Operation():
     @return: operation's operation number
     '''
     def __str__(self):
-        return self.fix_operation_no(self.rows[0][1].value)
+        return self.fix_operation_no(self.rows[0].values[COL_B])
     
     def __eq__(self, other_op):
         
-        if type(other_op) != Operation:
+        if not isinstance(other_op, Operation):
             return False
+        METRICS.count(EQUALITY_CHECKS)
         
-        #Get operation as 2D array
-        operation_as_list = self.get_operation_as_list()
-        other_operation_as_list = other_op.get_operation_as_list()
-        
-        #Assume not the same if lengths are different 
-        if len(operation_as_list) != len(other_operation_as_list):
-            print('\t[X]Operation difference due to length.')
+        #Digests cover every cell but the comment, so different digests mean different operations;
+        #equal digests are confirmed row by row, a digest collision can't make two operations equal
+        if self.get_digest() == other_op.get_digest():
+            if self.get_row_fingerprints() == other_op.get_row_fingerprints():
+                return True
+            LOGGER.debug('\t[X]Operation difference despite equal digests.')
             return False
         
-        #Operations are same length, zip is basically parallel comparison
-        for row, other_row in zip(operation_as_list, other_operation_as_list):
-            if row != other_row:
-                print('\t[X]Operation difference due to value.')
-                return False
-            
-        return True
+        #Assume not the same if lengths are different 
+        if len(self.rows) != len(other_op.rows):
+            LOGGER.debug('\t[X]Operation difference due to length.')
+        else:
+            LOGGER.debug('\t[X]Operation difference due to value.')
+        return False
     
     '''
     returns true if the current operation has no rows
@@ -572,24 +1912,55 @@ class Operation():
     
     '''
     adds a row to the operation,
-        detects for None value types (rather than ''),
-        ensures the row is now all empty cells
-    @param row: row from openpyxl ReadOnlyWorksheet
+        ensures the row is not all empty cells
+    @param operation_row: OperationRow, from OperationRow.from_cells or the raw sheet reader
     '''
-    def add_row(self, row):
-        if not all(cell.value == None or cell.value == '' for cell in row):
-            if any(cell.value == None for cell in row):
-                pass
-                #print('Detected None cell value.')
-            try:
-                if any(cell.fill.fgColor.rgb == RED for cell in row):
-                    self.flagged_for_removal = True
-                elif any(part_of_change(cell) == True for cell in row):
-                    self.part_of_change = True
-            except AttributeError:
-                #When cells have fill type 'None' program crashes due to 'None' not having a value 'RGB'
-                pass
-            self.rows.append([cell for cell in row])
+    def add_row(self, operation_row):
+        if not operation_row.is_blank():
+            if operation_row.is_red():
+                self.flagged_for_removal = True
+            elif operation_row.has_change():
+                self.part_of_change = True
+            self.rows.append(operation_row)
+            self.digest = None
+    
+    '''
+    digests the operation's row fingerprints, same cleaning rules as get_operation_as_list
+    '''
+    def compute_digest(self):
+        cleaned = self.get_row_fingerprints()
+        self.digest = hashlib.blake2b(repr(cleaned).encode('utf-8'), digest_size=16).digest()
+    
+    '''
+    returns one cleaned value tuple per row, the rows compare equal exactly when their fingerprints do
+        None and '' are the same, the comment cell [0,0] is ignored
+        and booleans and whole floats become ints, so True, 1 and 1.0 compare equal (as they do with ==)
+        while '1' and 1 don't; equal values then always have the same repr, which compute_digest relies on
+    @return: list of tuples, one per row
+    '''
+    def get_row_fingerprints(self):
+        return [tuple('' if value == None or (row_count == 0 and cell_count == 0)
+                      else int(value) if type(value) == bool or (type(value) == float and value.is_integer())
+                      else value
+                      for cell_count, value in enumerate(row.values))
+                for row_count, row in enumerate(self.rows)]
+    
+    '''
+    returns the operation's content digest, computing it if the operation changed since
+    @return: 16 byte digest of the operation's values
+    '''
+    def get_digest(self):
+        if self.digest == None:
+            self.compute_digest()
+        return self.digest
+    
+    '''
+    digests the operation's raw values and fill flags, everything render_difference reads from it
+        unlike get_digest, comments and the exact value types count
+    @return: 16 byte digest
+    '''
+    def get_render_digest(self):
+        return hashlib.blake2b(repr([(row.values, row.flags) for row in self.rows]).encode('utf-8'), digest_size=16).digest()
             
     '''
     prints the operation to the console
@@ -597,7 +1968,7 @@ class Operation():
     '''
     def print_operation(self, log=None):
         for row in self.rows:
-            print([cell.value for cell in row], file=log)
+            print(list(row.values), file=log)
     
     '''
     logs the operation to the given file
@@ -616,7 +1987,8 @@ class Operation():
         note that 100.XXXX and 10.XXXX are legal operation numbers
     @param operation_no: incoming cell value from where the operation number was encountered
     '''
-    def fix_operation_no(self, operation_no):
+    @staticmethod
+    def fix_operation_no(operation_no):
         operation_no = str(operation_no)
         
         if '.' not in operation_no:
@@ -631,14 +2003,14 @@ class Operation():
     @return: returns the operation's operation number to caller as float
     '''
     def get_operation_no(self):
-        return float(self.fix_operation_no(self.rows[0][1].value))
+        return float(self.fix_operation_no(self.rows[0].values[COL_B]))
     
     '''
     returns the operation number to the caller as a string
     @return: returns a str representation of the operations operation number
     '''
     def get_operation_no_str(self):
-        return self.fix_operation_no(self.rows[0][1].value)
+        return self.fix_operation_no(self.rows[0].values[COL_B])
     
     '''
     returns an array of openpyxl WriteOnlyCells that can than be outputted to the diff worksheet
@@ -659,15 +2031,15 @@ class Operation():
         for row in self.rows:
             #temp is a temporary list that will act as a spreadsheet 'row'
             temp = []
-            for cell in row:
+            for value in row.values:
                 
                 if route_type == 'RTE':
                     #If the current RTE cell is an extra operation, highlight it as a difference
                     if(extra):
-                        temp.append(create_cell(cell.value, 'RTE', diff=difftype))
+                        temp.append(create_cell(value, 'RTE', diff=difftype))
                     #The current RTE cell does not need any highlighting
                     else:
-                        temp.append(create_cell(cell.value, 'RTE'))
+                        temp.append(create_cell(value, 'RTE'))
                         
                     #Add blank SM cell (placeholder)
                     temp.append(create_cell('', 'SM'))
@@ -678,10 +2050,10 @@ class Operation():
                     
                     #If the current SM cell is an extra operation, highlight it as a difference
                     if(extra):
-                        temp.append(create_cell(cell.value, 'SM', diff=difftype))
+                        temp.append(create_cell(value, 'SM', diff=difftype))
                     #Current SM cell does not need any highlighting
                     else:
-                        temp.append(create_cell(cell.value, 'SM'))
+                        temp.append(create_cell(value, 'SM'))
             #append the 'row'
             returned.append(temp)
         return returned
@@ -699,156 +2071,74 @@ class Operation():
     '''
     
     def get_operation_as_list(self):
-        return [['' if cell_count == 0 and row_count == 0 else cell.value if cell.value != None else '' for cell_count, cell in enumerate(row)] for row_count, row in enumerate(self.rows)]
+        return [['' if cell_count == 0 and row_count == 0 else value if value != None else '' for cell_count, value in enumerate(row.values)] for row_count, row in enumerate(self.rows)]
     '''
     list comprehension equivalent to:
     returned = []
     for row in self.rows:
         temp = []
-        for cell in row:
-            if cell.value != None:
-                temp.append(cell.value)
+        for value in row.values:
+            if value != None:
+                temp.append(value)
             else:
                 temp.append('')
     return returned
     <3 python
     '''
 
-def format_output(filepath):
-    
-    book = oxl.load_workbook(filepath)
-    
-    
-    sheet = book['RTE-SM Compare'] 
-    
-    sheet.row_dimensions[1].height = 55
-    
-    
-    header_list = [
-        'Comments',
-        'Full Oper Num',
-        'Module',
-        'Module Description',
-        'Process Def',
-        'Photo Layer',
-        'PD Type',
-        'PD Name',
-        'PD Description',
-        'Department',
-        'PD User Data Sets - Name',
-        'PD User Data Sets - Value',
-        'Operation User Data Sets - Name',
-        'Operation User Data Sets - Value',
-        'Mondatory',
-        "Carrier Category",
-        "LR Context Type",
-        "LR Context",
-        "Logical Recipe",
-        "LR Description",
-        "Resolved Pre1 Script",
-        "Resolved Pre2 Script",
-        'Resolved Post Script',
-        'Equipment',
-        'Equipment Recipe',
-        'Recipe Description',
-        'Stage ID',
-        'Proc (min)',
-        'Wait (min)',
-        'WPH'
-    ]
-    for col in range(1,61,2):
-        #merge necessary cells
-        sheet.merge_cells(start_row=1, end_row=1, start_column=col, end_column=col+1)
-        sheet.merge_cells(start_row=2, end_row=2, start_column=col, end_column=col+1)
-        sheet.merge_cells(start_row=3, end_row=3, start_column=col, end_column=col+1)
-        
-        #assign values, center align
-        sheet.cell(row=1, column=col, value=header_list[int((col-1)/2)]).alignment = oxl.styles.alignment.Alignment(horizontal='center', wrap_text=True)
-        sheet.cell(row=2, column=col, value="Orange: ##").alignment = oxl.styles.alignment.Alignment(horizontal='center', wrap_text=True)
-        sheet.cell(row=3, column=col, value="Blue: ##").alignment = oxl.styles.alignment.Alignment(horizontal='center', wrap_text=True)
-        
-        #cell coloring
-        sheet.cell(row=1, column=col).fill = oxl.styles.fills.PatternFill(patternType='solid', fgColor='FFC0C0C0')
-        sheet.cell(row=2, column=col).fill = oxl.styles.fills.PatternFill(patternType='solid', fgColor='FFFABF8F')
-        sheet.cell(row=3, column=col).fill = oxl.styles.fills.PatternFill(patternType='solid', fgColor='FF92CDDC')
-        
-        #column sizing
-        sheet.column_dimensions[oxl.utils.get_column_letter(col)].width = 15
-        sheet.column_dimensions[oxl.utils.get_column_letter(col+1)].width = 15
-        
-        #borders
-        sheet.cell(row=1, column=col).border = Border(left=Side(style='thin'),
-                                                      right=Side(style='thin'),
-                                                      top=Side(style='thin'),
-                                                      bottom=Side(style='thin'))
-        sheet.cell(row=1, column=col+1).border = Border(left=Side(style='thin'),
-                                                      right=Side(style='thin'),
-                                                      top=Side(style='thin'),
-                                                      bottom=Side(style='thin'))
-        sheet.cell(row=2, column=col).border = Border(left=Side(style='thin'),
-                                                      right=Side(style='thin'),
-                                                      top=Side(style='thin'),
-                                                      bottom=Side(style='thin'))
-        sheet.cell(row=2, column=col+1).border = Border(left=Side(style='thin'),
-                                                      right=Side(style='thin'),
-                                                      top=Side(style='thin'),
-                                                      bottom=Side(style='thin'))
-        sheet.cell(row=3, column=col).border = Border(left=Side(style='thin'),
-                                                      right=Side(style='thin'),
-                                                      top=Side(style='thin'),
-                                                      bottom=Side(style='thin'))
-        sheet.cell(row=3, column=col+1).border = Border(left=Side(style='thin'),
-                                                      right=Side(style='thin'),
-                                                      top=Side(style='thin'),
-                                                      bottom=Side(style='thin'))
-        
-        #font
-        sheet.cell(row=1, column=col).font = oxl.styles.fonts.Font(name='Consolas',
-                                                                  bold=True,
-                                                                  size=14)
-        sheet.cell(row=2, column=col).font = oxl.styles.fonts.Font(name='Consolas',
-                                                                  bold=True,
-                                                                  size=10)
-        sheet.cell(row=3, column=col).font = oxl.styles.fonts.Font(name='Consolas',
-                                                                  bold=True,
-                                                                  size=10)
-    blue = 0
-    orange = 0
-    #loop through each column in the sheet
-    for index, col in enumerate(sheet.columns):
-        
-        #loop through each cell in each column
-        for cell in col:
-            #detecting and counting orange color
-            #print(cell.fill.fgColor.rgb)
-            if (cell.fill.fgColor.rgb == ORANGE_DIFF_HEX):
-                orange += 1
-            #detecting and counting blue color
-            if(cell.fill.fgColor.rgb == BLUE_DIFF_HEX):
-                blue += 1
-            #orange counter located at row 2
-            #blue counter located at row 3
-        if index % 2 != 0:
-            currcol = oxl.utils.coordinate_from_string(prev.coordinate)[0]
-            orange_coord = currcol + '2'
-            blue_coord = currcol + '3'
-            sheet[orange_coord].value = "Orange: " + str(orange) 
-            sheet[blue_coord].value = "Blue: " + str(blue)
-            #print(orange_coord, blue_coord,sheet[orange_coord].value, sheet[blue_coord].value, sheet[blue_coord])
-            #reset counters
-            blue = 0
-            orange = 0
-        prev = cell
-        #print(currcol)
-    sheet.sheet_view.zoomScale = 70
-    book.save(filepath)
-
-'''
-writes the header to the openpyxl WriteOnly spreadsheet output_worksheet
-'''
-def write_header():
-    rte_header = WriteOnlyCell(ws=output_worksheet, value='RTE')
-    sm_header = WriteOnlyCell(ws=output_worksheet, value='SM')
+class SpilledOperation(Operation):
+    
+    '''
+    operation whose rows live in an OperationStore, they're read back whenever they're needed
+        equality only needs the digest, so only operations being rendered (or checked against MM) are read
+    @store: OperationStore holding the rows
+    @record_id: id of the rows in the store
+    @operation_no: operation number, kept so str() doesn't read the rows
+    '''
+    __slots__ = ('store', 'record_id', 'operation_no')
+    
+    def __init__(self, operation, store):
+        self.flagged_for_removal = operation.flagged_for_removal
+        self.part_of_change = operation.part_of_change
+        self.digest = operation.get_digest()
+        self.operation_no = str(operation)
+        self.store = store
+        self.record_id = store.add(operation.rows)
+    
+    def __str__(self):
+        return self.operation_no
+    
+    '''
+    the operation's OperationRows, read from the store
+    '''
+    @property
+    def rows(self):
+        return self.store.get(self.record_id)
+    
+    '''
+    pickles the index fields only, the rows stay in the store
+    '''
+    def __getstate__(self):
+        return (self.store, self.record_id, self.operation_no, self.digest, self.part_of_change, self.flagged_for_removal)
+    
+    def __setstate__(self, state):
+        self.store, self.record_id, self.operation_no, self.digest, self.part_of_change, self.flagged_for_removal = state
+
+'''
+queues an RTE/SM header row before the next operation block in the report
+@param report: ReportWorksheet to render to
+'''
+def write_operation_header(report):
+    report.add_row(OPERATION_HEADER_ROW)
+
+'''
+builds the RTE/SM header row used above each operation block
+@param worksheet: write-only worksheet the cells belong to
+@return: row of WriteOnlyCells
+'''
+def write_header(worksheet):
+    rte_header = WriteOnlyCell(ws=worksheet, value='RTE')
+    sm_header = WriteOnlyCell(ws=worksheet, value='SM')
     
     rte_header.fill = RTE_FILL
     sm_header.fill = SM_FILL
@@ -866,44 +2156,91 @@ def write_header():
     for header_cell in range(NUM_OUTPUT_COLS):
         temp.append(rte_header)
         temp.append(sm_header)
-    output_worksheet.append(temp)
+    return temp
 
 '''
 High-level program logic
 '''
-def load_route(sheetname):
+def load_route(sheetname, workbook, spill=False, ignored_columns=()):
     '''
-    @sheet: 
+    @rows: pulled from the read-only openpyxl workbook, every column is read and the projected out ones dropped
     '''
-    sheet = oxl_workbook[sheetname]
+    rows = iter_sheet_rows(sheetname, workbook, ignored_columns)
+    if rows == None:
+        return False
+    
+    return build_route(sheetname, rows, spill, ignored_columns)
 
-    if sheet.max_row <= 10 or sheet.max_column <= 10:
+'''
+loads a route sheet with the raw streaming reader, no openpyxl cells are built
+    and the values of the columns the column map doesn't read aren't decoded
+@param sheetname: sheet to load
+@param reader: SheetReader open on the workbook
+@param spill: build a SpilledRoute, see build_route
+@param ignored_columns: OUTPUT_HEADERS names projected out, see ColumnMap
+@return: route, or False if the sheet is invalid
+'''
+def read_route(sheetname, reader, spill=False, ignored_columns=()):
+    rows = iter_sheet_rows(sheetname, reader, ignored_columns)
+    if rows == None:
+        return False
+    
+    return build_route(sheetname, rows, spill, ignored_columns)
+
+'''
+builds a route from a sheet's rows, shared by both readers
+@param sheetname: sheet the rows come from, decides which validation string the report ID needs
+@param rows: iterable of OperationRows, one per spreadsheet row starting at row 1
+@param spill: build a SpilledRoute, its operation rows go to disk as they're parsed
+@param ignored_columns: OUTPUT_HEADERS names projected out, see ColumnMap
+@return: route, or False if the sheet is invalid
+'''
+def build_route(sheetname, rows, spill=False, ignored_columns=()):
+    header = {'report_id': ''}
+    route = SpilledRoute() if spill else Route()
+    for operation in iter_operations(rows, header, ignored_columns):
+        route.add_operation(operation)
+    
+    #The spilled rows of an invalid sheet are deleted right away
+    if finish_route(route, sheetname, header['report_id']) == False:
+        if spill:
+            route.close()
         return False
+    return route
+
+'''
+splits a sheet's rows into operations, the parsing rules build_route and stream_route share
+@param rows: iterable of OperationRows, one per spreadsheet row starting at row 1
+@param header: dict, its 'report_id' is set to the sheet's 'Flow Report' header when it's read
+@param ignored_columns: OUTPUT_HEADERS names projected out, see ColumnMap
+@return: generator of Operations in sheet order, their rows in OUTPUT_HEADERS layout; operations flagged for removal are left out
+'''
+def iter_operations(rows, header, ignored_columns=()):
     
     '''
-    @report_id:
     @start_reading:
     @start_index:
+    @column_map: ColumnMap read from the header row
     '''
-    report_id = ''
     start_reading = False
     start_index = -1
+    column_map = None
     
     '''
-    @loop:
     @operation:
-    @route:
     '''
     operation = Operation()
-    route = Route()
-    for index, row in enumerate(sheet.rows):
+    for index, row in enumerate(rows):
         
         #Get flow report header store in report_id
-        if 'Flow Report' in stringify(row[COL_A]):
-            report_id = stringify(row[COL_A])
+        if 'Flow Report' in stringify(row.values[COL_A]):
+            header['report_id'] = stringify(row.values[COL_A])
             
-        #If we encounter 'Full Oper Num', set the start index to two rows later
-        if stringify(row[COL_B]) == OPERATION_START:
+        #If we encounter 'Full Oper Num', map the columns by name and set the start index to two rows later
+        if column_map == None and is_header_row(row.values):
+            column_map = ColumnMap.from_header(row.values, index, ignored_columns)
+            if column_map.unknown:
+                LOGGER.info('Columns not in the report layout are left out: %s', ', '.join(column_map.unknown))
             start_index = index + 2
         
         #First row of operations, set flag to begin reading data
@@ -912,15 +2249,18 @@ def load_route(sheetname):
             
         #'Read data mode'
         if start_reading:
+            row = column_map.apply(row)
             
             #If the current operation list isn't empty (accounting for first loop iteration)
             #and the current cell contains an operation number
-            #store the operation in the route, clear out temp operation
-            if has_value(row[COL_B]) and not operation.is_empty():
+            #hand the operation on, clear out temp operation
+            if has_value(row.values[COL_B]) and not operation.is_empty():
                 if not operation.flagged_for_removal:
-                    route.add_operation(operation)
+                    METRICS.count(OPERATIONS_PARSED)
+                    yield operation
                 else:
-                    print('Operation flagged for removal. Ignoring operation:', operation)
+                    LOGGER.info('Operation flagged for removal. Ignoring operation: %s', operation)
+                    METRICS.count(OPERATIONS_FLAGGED)
                 operation = Operation()               
                 
             #If the current row is not all empty cells, add it to the current operation
@@ -928,8 +2268,124 @@ def load_route(sheetname):
                 
     #Last operation will still be stored but not added
     if not operation.is_empty():
-        route.add_operation(operation)
+        METRICS.count(OPERATIONS_PARSED)
+        yield operation
+
+'''
+indexes a route sheet for lazy loading: only the operation number column is read
+    and each operation is recorded as the range of rows it spans, following the same rules as build_route
+@param workbook_path: workbook the sheet is read from, kept so operations can be parsed later
+@param sheetname: sheet to index
+@param reader: SheetReader open on the workbook
+@param ignored_columns: OUTPUT_HEADERS names projected out, see ColumnMap
+@return: LazyRoute, or False if the sheet is invalid
+'''
+def index_route(workbook_path, sheetname, reader, ignored_columns=()):
+    max_row, max_column = reader.get_dimensions(sheetname)
+    if max_row <= 10 or max_column <= 10:
+        return False
+    
+    #Only the comment and operation number columns are read, wherever the header row puts the latter
+    column_map = read_column_map(sheetname, reader, ignored_columns)
+    operation_column = column_map.get_operation_column() if column_map != None else COL_B
+    
+    report_id = ''
+    start_reading = False
+    start_index = -1
+    
+    '''
+    @operation_no: operation being indexed, None before the first one
+    @first/@last: row range of the operation so far
+    @flagged: a non-blank row of the operation has the red removal fill
+    @red_rows: red rows of the operation whose read columns are blank, the rest of the row decides if they count
+    @unsure: (operation number, first row, red_rows) of the indexed operations only their red_rows can flag
+    '''
+    operation_no = None
+    first = last = None
+    flagged = False
+    red_rows = []
+    unsure = []
+    sources = set(column_map.sources) - {None} if column_map != None else set()
+    route = LazyRoute(workbook_path, sheetname, column_map)
+    for index, (values, flags) in enumerate(reader.iter_rows(sheetname, value_columns=max(COL_A, operation_column) + 1)):
+        
+        if 'Flow Report' in stringify(values[COL_A]):
+            report_id = stringify(values[COL_A])
+        
+        if column_map != None and index == column_map.header_row:
+            start_index = index + 2
+        
+        if index == start_index:
+            start_reading = True
+        
+        if start_reading:
+            
+            #A new operation number closes the current operation, flagged operations are left out like in build_route
+            if has_value(values[operation_column]):
+                if operation_no != None and not flagged:
+                    route.add_row_range(operation_no, first, last)
+                    if red_rows:
+                        unsure.append((operation_no, first, red_rows))
+                elif operation_no != None:
+                    METRICS.count(OPERATIONS_FLAGGED)
+                operation_no = Operation.fix_operation_no(values[operation_column])
+                first = index
+                flagged = False
+                red_rows = []
+            
+            #Blank rows are skipped by Operation.add_row, so their red fill doesn't flag the operation
+            if operation_no != None:
+                last = index
+                if flags & ROW_RED and not flagged:
+                    if any(has_value(values[source]) for source in sources if source < len(values)):
+                        flagged = True
+                    else:
+                        red_rows.append(index)
+    
+    #Last operation is added even if flagged, same as build_route
+    if operation_no != None:
+        route.add_row_range(operation_no, first, last)
+    
+    #Red rows blank in the read columns are read in full, an operation is dropped if one of them isn't blank
+    if unsure:
+        filled = get_filled_rows(reader, sheetname, column_map, [index for _, _, rows in unsure for index in rows])
+        for unsure_operation_no, unsure_first, rows in unsure:
+            if filled.intersection(rows):
+                route.remove_row_range(unsure_operation_no, unsure_first)
+                METRICS.count(OPERATIONS_FLAGGED)
+    
+    return finish_route(route, sheetname, report_id)
+
+'''
+returns which of the given rows hold a value in a column the route reads, the rows Operation.add_row doesn't skip
+@param reader: SheetReader open on the workbook
+@param sheetname: sheet the rows are on
+@param column_map: ColumnMap of the sheet
+@param indexes: sorted 0 based row indexes, each row stored in the sheet
+@return: set of the row indexes that aren't blank
+'''
+def get_filled_rows(reader, sheetname, column_map, indexes):
+    rows = reader.read_row_ranges(sheetname, [(index, index) for index in indexes])
+    
+    #Sheets the reader can't seek in are streamed up to the last row needed
+    if rows == None:
+        rows = {}
+        wanted = set(indexes)
+        for index, row in enumerate(reader.iter_rows(sheetname, wanted=wanted)):
+            if index > indexes[-1]:
+                break
+            if index in wanted:
+                rows[index] = row
+    return set(index for index in indexes if index in rows and not column_map.apply(OperationRow(*rows[index])).is_blank())
 
+'''
+validates a parsed route against its sheet's report ID and sets the route attributes
+@param route: Route or LazyRoute read from the sheet
+@param sheetname: sheet the route was read from
+@param report_id: 'Flow Report ...' header found on the sheet
+@return: route, or False if the report ID doesn't match the sheet
+'''
+def finish_route(route, sheetname, report_id):
     if sheetname == RTE_SHEET and RTE_VALIDATION not in report_id:
         return False
     elif sheetname == SM_SHEET and SM_VALIDATION not in report_id:
@@ -944,91 +2400,957 @@ def load_route(sheetname):
     
     return route
 
+'''
+opens the route cache kept in directory, logging when it's left disabled
+    a folder another user owns or can write to isn't trusted, see RouteCache
+@param directory: cache folder, created private to the user if missing
+@param max_bytes: size cap of the cache
+@return: RouteCache
+'''
+def open_route_cache(directory, max_bytes):
+    cache = RouteCache(directory, max_bytes)
+    if not cache.trusted:
+        LOGGER.warning('[X]Route cache %s is writable by other users or not owned by you, it is not used.', directory)
+    return cache
+
+'''
+loads several route sheets from one workbook on disk, opening the workbook at most once
+    with a cache, sheets of an unchanged workbook are unpickled instead of parsed,
+    and the workbook isn't opened at all when every sheet is cached
+@param workbook_path: path to the workbook holding the route sheets
+@param sheetnames: sheets to load
+@param cache: optional RouteCache
+@param optional_sheets: sheets that may be missing or empty, they load as None instead of False
+@param reader: RAW_READER or OPENPYXL_READER, both parse to the same routes
+@param lazy_sheets: sheets loaded as a LazyRoute index instead of parsed in full (always with the raw reader, never cached)
+@param spill: load the other sheets as SpilledRoutes (never cached), close them with close_routes when done
+@param ignored_columns: OUTPUT_HEADERS names projected out of the routes, see ColumnMap
+    cached separately from the routes loaded with every column
+@return: list of routes (False for invalid sheets) in the same order as sheetnames
+'''
+def load_routes_from_file(workbook_path, sheetnames, cache=None, optional_sheets=(), reader=RAW_READER, lazy_sheets=(), spill=False, ignored_columns=()):
+    routes = {}
+    keys = {}
+    if spill:
+        cache = None
+    if cache != None:
+        for sheetname in sheetnames:
+            if sheetname in lazy_sheets:
+                continue
+            keys[sheetname] = cache.make_key(workbook_path, sheetname, PARSER_VERSION, ','.join(sorted(ignored_columns)))
+            route = cache.get(keys[sheetname], NOT_CACHED)
+            if route is not NOT_CACHED:
+                routes[sheetname] = route
+    
+    missing = [sheetname for sheetname in sheetnames if sheetname not in routes]
+    if missing:
+        with METRICS.span('open_workbook', reader=reader):
+            if reader == OPENPYXL_READER:
+                workbook = oxl.load_workbook(workbook_path, read_only=True)
+            else:
+                workbook = SheetReader(workbook_path)
+        try:
+            for sheetname in missing:
+                with METRICS.span('load_route', sheet=sheetname, reader=reader, lazy=sheetname in lazy_sheets, spill=spill):
+                    if sheetname in optional_sheets and (sheetname not in workbook.sheetnames or not has_sheet_data(workbook, sheetname)):
+                        route = None
+                    elif sheetname in lazy_sheets:
+                        route = load_lazy_route(workbook_path, sheetname, ignored_columns)
+                    elif reader == OPENPYXL_READER:
+                        route = load_route(sheetname, workbook, spill, ignored_columns)
+                    else:
+                        route = read_route(sheetname, workbook, spill, ignored_columns)
+                routes[sheetname] = route
+                if cache != None and sheetname not in lazy_sheets:
+                    cache.put(keys[sheetname], route)
+        finally:
+            workbook.close()
+    
+    return [routes[sheetname] for sheetname in sheetnames]
 
-# 'main' function area
+'''
+indexes a route sheet for lazy loading with its own raw reader, see index_route
+@param workbook_path: path to the workbook holding the route sheet
+@param sheetname: sheet to index
+@param ignored_columns: OUTPUT_HEADERS names projected out of the routes, see ColumnMap
+@return: LazyRoute, or False if the sheet is invalid
+'''
+def load_lazy_route(workbook_path, sheetname, ignored_columns=()):
+    reader = SheetReader(workbook_path)
+    try:
+        return index_route(workbook_path, sheetname, reader, ignored_columns)
+    finally:
+        reader.close()
 
-#mainbook = xw.Book.caller()
+'''
+loads a single route sheet from a workbook on disk
+    each call opens its own read-only copy of the workbook, so pool workers never share a zip handle
+@param workbook_path: path to the workbook holding the route sheet
+@param sheetname: sheet to load
+@param cache: optional RouteCache
+@param reader: RAW_READER or OPENPYXL_READER
+@param lazy: index the sheet as a LazyRoute instead of parsing it in full
+@param spill: load the sheet as a SpilledRoute
+@param ignored_columns: OUTPUT_HEADERS names projected out of the routes, see ColumnMap
+@return: route, or False if the sheet is invalid
+'''
+def load_route_from_file(workbook_path, sheetname, cache=None, reader=RAW_READER, lazy=False, spill=False, ignored_columns=()):
+    return load_routes_from_file(workbook_path, [sheetname], cache, reader=reader, lazy_sheets=[sheetname] if lazy else (), spill=spill,
+                                 ignored_columns=ignored_columns)[0]
 
+'''
+loads the given route sheets concurrently, one worker process per sheet
+    wall-clock time is close to the slowest single sheet instead of the sum of all of them
+@param sources: list of (workbook path, sheet name) pairs, e.g. [(path, RTE_SHEET), (path, SM_SHEET)]
+@param cache: optional RouteCache shared by the workers
+@param reader: RAW_READER or OPENPYXL_READER
+@param lazy_sheets: sheets indexed as a LazyRoute instead of parsed in full
+@param spill: load the other sheets as SpilledRoutes, their stores are handed over to this process
+@param ignored_columns: OUTPUT_HEADERS names projected out of the routes, see ColumnMap
+@return: list of routes (False for invalid sheets) in the same order as sources
+'''
+def load_routes_parallel(sources, cache=None, reader=RAW_READER, lazy_sheets=(), spill=False, ignored_columns=()):
+    flush_logs()
+    with ProcessPoolExecutor(max_workers=len(sources)) as pool:
+        futures = [pool.submit(load_route_measured, workbook_path, sheetname, cache, reader, sheetname in lazy_sheets, spill, ignored_columns)
+                   for workbook_path, sheetname in sources]
+        routes = []
+        for future in futures:
+            route, worker_metrics = future.result()
+            METRICS.merge(worker_metrics)
+            routes.append(route)
+        return routes
 
-#********************************
-# Lines are to be enabled for Excel testing and deployment!
-#********************************
-mainbook = xw.Book.caller()
-oxl_workbook = oxl.load_workbook(mainbook.fullname, read_only=True)
+'''
+process pool entry point for load_routes_parallel
+    the worker's spans and counters are sent back with the route so the parent can merge them
+@return: (route, METRICS.to_dict() of the load)
+'''
+def load_route_measured(workbook_path, sheetname, cache=None, reader=RAW_READER, lazy=False, spill=False, ignored_columns=()):
+    METRICS.reset()
+    try:
+        route = load_route_from_file(workbook_path, sheetname, cache, reader, lazy, spill, ignored_columns)
+    finally:
+        flush_logs()
+    return route, METRICS.to_dict()
 
 '''
-mainbook = xw.Book(WORKBOOK_PATH)
-oxl_workbook = oxl.load_workbook(WORKBOOK_PATH, read_only=True)
+@CompareResult: routes that were compared and the report they produced
+    report is None when one of the routes was invalid (False)
 '''
-homesheet = mainbook.sheets[HOME_SHEET]
-homesheet.range('A13').value = mainbook.fullname
+CompareResult = namedtuple('CompareResult', ['rte_route', 'sm_route', 'mm_route', 'report'])
 
-if homesheet.range('I1').value:
-    mmsheet = True
-else:
-    mmsheet = False
+'''
+returns the rows of a route sheet as OperationRows, for either reader
+    the raw reader skips decoding the values of the columns the sheet's column map doesn't read
+@param sheetname: sheet to read
+@param workbook: SheetReader or read-only openpyxl workbook
+@param ignored_columns: OUTPUT_HEADERS names projected out, see ColumnMap
+@return: iterator of OperationRows as read from the sheet, None if the sheet is too small to hold a route
+'''
+def iter_sheet_rows(sheetname, workbook, ignored_columns=()):
+    if isinstance(workbook, SheetReader):
+        max_row, max_column = workbook.get_dimensions(sheetname)
+        if max_row <= 10 or max_column <= 10:
+            return None
+        column_map = read_column_map(sheetname, workbook, ignored_columns)
+        if column_map == None:
+            rows = workbook.iter_rows(sheetname)
+        else:
+            rows = workbook.iter_rows(sheetname, skipped=column_map.get_skipped_columns(max_column), skip_from=column_map.header_row + 1)
+        return (OperationRow(values, flags) for values, flags in rows)
+    
+    sheet = workbook[sheetname]
+    if sheet.max_row <= 10 or sheet.max_column <= 10:
+        return None
+    style_flags = get_style_flags(workbook)
+    return (OperationRow.from_cells(row, style_flags) for row in sheet.rows)
 
-#load routes
-homesheet.range('A3:A12').value = ''
-homesheet.range('A3:A12').color = HOME_BLUE_RGB
+'''
+reads a sheet's rows up to its 'Full Oper Num' header row and maps its columns
+@param sheetname: sheet to read
+@param reader: SheetReader open on the workbook
+@param ignored_columns: OUTPUT_HEADERS names projected out, see ColumnMap
+@return: ColumnMap, None if the sheet has no header row
+'''
+def read_column_map(sheetname, reader, ignored_columns=()):
+    for index, (values, flags) in enumerate(reader.iter_rows(sheetname)):
+        if is_header_row(values):
+            return ColumnMap.from_header(values, index, ignored_columns)
+    return None
 
+'''
+process entry point of a RouteStream: parses a route sheet and puts its operations on the queue in batches
+    put blocks while the queue is full, so the parse never runs more than the queue's depth ahead of the compare
+    the last message is (END_MESSAGE, (StreamedRoute or False, METRICS.to_dict())) or (ERROR_MESSAGE, exception)
+@param workbook_path: path to the workbook holding the route sheet
+@param sheetname: sheet to parse
+@param queue: bounded multiprocessing queue the RouteStream reads
+@param reader: RAW_READER or OPENPYXL_READER
+@param batch_operations: operations per message
+@param ignored_columns: OUTPUT_HEADERS names projected out of the routes, see ColumnMap
+'''
+def stream_route(workbook_path, sheetname, queue, reader=RAW_READER, batch_operations=PIPELINE_BATCH_OPERATIONS, ignored_columns=()):
+    METRICS.reset()
+    try:
+        header = {'report_id': ''}
+        route = StreamedRoute()
+        with METRICS.span('open_workbook', reader=reader):
+            if reader == OPENPYXL_READER:
+                workbook = oxl.load_workbook(workbook_path, read_only=True)
+            else:
+                workbook = SheetReader(workbook_path)
+        try:
+            with METRICS.span('load_route', sheet=sheetname, reader=reader, pipelined=True):
+                rows = iter_sheet_rows(sheetname, workbook, ignored_columns)
+                batch = []
+                for operation in iter_operations(rows if rows != None else (), header, ignored_columns):
+                    operation.compute_digest()
+                    batch.append(operation)
+                    if len(batch) == batch_operations:
+                        queue.put((BATCH_MESSAGE, batch))
+                        route.num_operations += len(batch)
+                        batch = []
+                if batch:
+                    queue.put((BATCH_MESSAGE, batch))
+                    route.num_operations += len(batch)
+        finally:
+            workbook.close()
+        
+        route = finish_route(route, sheetname, header['report_id']) if rows != None else False
+        flush_logs()
+        queue.put((END_MESSAGE, (route, METRICS.to_dict())))
+    except Exception as error:
+        LOGGER.exception('[X]Streaming %s from %s failed', sheetname, workbook_path)
+        flush_logs()
+        queue.put((ERROR_MESSAGE, error))
 
-homesheet.range('A3').value = 'Now loading routes.'
+class RouteStream():
+    
+    '''
+    a route sheet parsed by its own process, iterated as the route's Operations in sheet order
+        the process starts right away and parses up to PIPELINE_QUEUE_DEPTH batches ahead of the reader
+    @sheetname: sheet being streamed
+    @queue: bounded queue of (message, data) tuples from stream_route
+    @process: process running stream_route
+    @route: StreamedRoute, or False for an invalid sheet, once every operation was read; None before
+    '''
+    def __init__(self, workbook_path, sheetname, reader=RAW_READER, ignored_columns=()):
+        self.sheetname = sheetname
+        self.queue = multiprocessing.Queue(PIPELINE_QUEUE_DEPTH)
+        self.process = multiprocessing.Process(target=stream_route, args=(workbook_path, sheetname, self.queue, reader, PIPELINE_BATCH_OPERATIONS, ignored_columns),
+                                               daemon=True)
+        self.route = None
+        self.process.start()
+    
+    '''
+    yields the streamed operations, the worker's spans and counters are merged into METRICS at the end
+    @raise: the exception the worker failed with
+    '''
+    def __iter__(self):
+        while True:
+            message, data = self.receive()
+            if message == BATCH_MESSAGE:
+                for operation in data:
+                    yield operation
+            elif message == END_MESSAGE:
+                self.route, worker_metrics = data
+                METRICS.merge(worker_metrics)
+                return
+            else:
+                raise data
+    
+    '''
+    returns the next message of the worker, checking it's still alive while waiting
+    '''
+    def receive(self):
+        while True:
+            try:
+                return self.queue.get(timeout=PIPELINE_POLL_SECONDS)
+            except Empty:
+                if not self.process.is_alive() and self.queue.empty():
+                    raise RuntimeError('Streaming ' + self.sheetname + ' stopped with exit code ' + str(self.process.exitcode))
+    
+    '''
+    stops the worker if it's still running, e.g. after the compare failed
+    '''
+    def close(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
 
-rte_route = load_route(RTE_SHEET)
-homesheet.range('A4').value = 'Loaded RTE route.'
-homesheet.range('A9').value = str(rte_route)
+'''
+logs each invalid (False) route of a compare
+@param routes: loaded routes, in the same order as sources
+@param sources: (workbook path, sheet name) pair of each route
+@return: true if every route is valid
+'''
+def check_routes(routes, sources):
+    for route, (workbook_path, sheetname) in zip(routes, sources):
+        if route == False:
+            LOGGER.error('[X]INVALID SHEET: %s in %s', sheetname, workbook_path)
+    return not any(route == False for route in routes)
 
-sm_route = load_route(SM_SHEET)
-homesheet.range('A5').value = 'Loaded SM route.'
-homesheet.range('A10').value = str(sm_route)
+'''
+deletes the on-disk stores of the SpilledRoutes among routes, other routes are left alone
+'''
+def close_routes(routes):
+    for route in routes:
+        if isinstance(route, SpilledRoute):
+            route.close()
 
-if mmsheet:
-    mm_route = load_route(MM_SHEET)
-    homesheet.range('A6').value = 'Loaded MM route.'
-    homesheet.range('A11').value = str(mm_route)
-else:
-    mm_route = None
-    homesheet.range('A11').value = 'No MM metadata.'
-    sheet = oxl_workbook[MM_SHEET]
+'''
+pipelined compare: each sheet is parsed by its own process and streamed to the compare in batches
+    differences are compared and rendered while the sheets are still being parsed, and no more than the
+    queues' depth of operations is held in memory; for CSV_FORMAT/JSONL_FORMAT that bounds the whole compare,
+    an XLSX_FORMAT report still buffers its rendered body (see ReportWorksheet) until the summary rows are known
+    text reports are written to a temporary file next to output_path and renamed once complete,
+    so an error partway never leaves a truncated report behind
+    the routes have to be in operation number order, see stream_join
+@param sources: (workbook path, sheet name) pairs of the RTE and SM sheets, then optionally the MM sheet
+@param output_path: path of the report to write
+@param options: names of the extra verification sheets to add to the report
+@param reader: RAW_READER or OPENPYXL_READER
+@param output_format: one of REPORT_FORMATS
+@param ignored_columns: OUTPUT_HEADERS names projected out of the routes, see ColumnMap
+@raise RouteOrderError: a route isn't in operation number order, no report is saved then
+@return: CompareResult holding StreamedRoutes, report is None if a sheet was invalid
+'''
+def compare_workbooks_pipelined(sources, output_path, options=(), reader=RAW_READER, output_format=XLSX_FORMAT, ignored_columns=()):
+    flush_logs()
+    streams = [RouteStream(workbook_path, sheetname, reader, ignored_columns) for workbook_path, sheetname in sources]
+    temp_path = None
+    try:
+        if output_format != XLSX_FORMAT:
+            workbook = None
+            handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.partial')
+            os.close(handle)
+            report = open_diff_writer(temp_path, output_format)
+        else:
+            workbook = init_write_only_output(options)
+            report = workbook[OUTPUT_TAB]
+        
+        rte_cursor = RouteCursor(streams[0], sources[0][1])
+        sm_cursor = RouteCursor(streams[1], sources[1][1])
+        mm_cursor = RouteCursor(streams[2], sources[2][1]) if len(streams) > 2 else None
+        debug = LOGGER.isEnabledFor(logging.DEBUG)
+        try:
+            with METRICS.span('compare_routes', pipelined=True):
+                #Each difference is compared as it's rendered, batching would hold streamed operations back
+                for pair in stream_join(rte_cursor, sm_cursor):
+                    report.write_diff(diff_pair(pair, mm_cursor, debug))
+                #The rest of MM is read so its order and report ID get checked too
+                if mm_cursor != None:
+                    mm_cursor.drain()
+        finally:
+            if workbook == None:
+                report.close()
+    except BaseException:
+        if temp_path != None:
+            os.remove(temp_path)
+        raise
+    finally:
+        for stream in streams:
+            stream.close()
+    
+    routes = [stream.route for stream in streams] + [None] * (3 - len(streams))
+    rte_route, sm_route, mm_route = routes
+    if not check_routes(routes, sources):
+        if workbook == None:
+            os.remove(temp_path)
+        return CompareResult(rte_route, sm_route, mm_route, None)
+    
+    if workbook != None:
+        save_report(workbook, output_path)
+    else:
+        os.replace(temp_path, output_path)
+        report.path = output_path
+    return CompareResult(rte_route, sm_route, mm_route, report)
 
-    if sheet.max_row > 1 or sheet.max_column > 1:
-        homesheet.range('A6').value = 'WARNING: MM Data detected, but MM Sheet is not checked.'
-        homesheet.range('A6').color = ORANGE_WARNING_RGB
+'''
+headless compare: loads the RTE, SM and (optionally) MM sheets, compares them and saves the report
+@param rte_path: workbook holding RTE_SHEET
+@param sm_path: workbook holding SM_SHEET
+@param output_path: path of the .xlsx report to write
+@param mm_path: workbook holding MM_SHEET, None to compare without MM neutralization
+@param options: names of the extra verification sheets to add to the report
+@param parallel: load the sheets in a process pool, False loads them one after another
+@param cache: optional RouteCache, unchanged workbooks are loaded from it instead of parsed
+@param reader: RAW_READER or OPENPYXL_READER
+@param lazy_mm: index the MM sheet and parse only the operations the neutralization check asks for
+@param output_format: one of REPORT_FORMATS
+@param pipeline: stream the sheets into the compare as they're parsed, see compare_workbooks_pipelined
+    cache and lazy_mm don't apply then; routes out of operation number order fall back to the normal compare
+@param spill: keep the routes' operation rows on disk instead of in memory (cache doesn't apply then)
+    the spilled routes are closed before returning, their IDs and operation counts stay available
+@param ignored_columns: OUTPUT_HEADERS names left out of the compare, they show blank in the report
+@return: CompareResult, the run's spans and counters are left in METRICS
+'''
+def compare_workbooks(rte_path, sm_path, output_path, mm_path=None, options=(), parallel=True, cache=None, reader=RAW_READER, lazy_mm=False,
+                      output_format=XLSX_FORMAT, pipeline=False, spill=False, ignored_columns=()):
+    METRICS.reset()
+    sources = [(rte_path, RTE_SHEET), (sm_path, SM_SHEET)]
+    if mm_path != None:
+        sources.append((mm_path, MM_SHEET))
+    lazy_sheets = [MM_SHEET] if lazy_mm else []
+    
+    if pipeline:
+        try:
+            return compare_workbooks_pipelined(sources, output_path, options, reader, output_format, ignored_columns)
+        except RouteOrderError as error:
+            LOGGER.warning('[X]%s, comparing without the pipeline.', error)
+            METRICS.reset()
+    
+    if parallel:
+        routes = load_routes_parallel(sources, cache, reader, lazy_sheets, spill, ignored_columns)
     else:
-        homesheet.range('A6').value = 'No MM Sheet read.'
+        routes = [load_route_from_file(workbook_path, sheetname, cache, reader, sheetname in lazy_sheets, spill, ignored_columns) for workbook_path, sheetname in sources]
+    if mm_path == None:
+        routes.append(None)
+    rte_route, sm_route, mm_route = routes
+    
+    try:
+        if not check_routes(routes, sources):
+            return CompareResult(rte_route, sm_route, mm_route, None)
+        
+        report = write_compare_report(rte_route, sm_route, mm_route, output_path, options, cache, output_format, get_blocks_target(*sources[1:]))
+        return CompareResult(rte_route, sm_route, mm_route, report)
+    finally:
+        close_routes(routes)
+
+'''
+compares loaded routes and saves the report
+@param output_path: path of the .xlsx report to write
+@param options: names of the extra verification sheets to add to the report
+@param cache: optional RouteCache, differences rendered by the last compare of the route against the same target are reused from it
+@param output_format: XLSX_FORMAT, or CSV_FORMAT/JSONL_FORMAT for just the diff records (options are ignored then)
+@param target: what the RTE route is compared against, see get_blocks_target
+@return: the saved ReportWorksheet or DiffWriter, holding the orange/blue totals
+'''
+def write_compare_report(rte_route, sm_route, mm_route, output_path, options=(), cache=None, output_format=XLSX_FORMAT, target=''):
+    if output_format != XLSX_FORMAT:
+        writer = open_diff_writer(output_path, output_format)
+        try:
+            compare_routes(writer, rte_route, sm_route, mm_route)
+        finally:
+            writer.close()
+        return writer
+    
+    workbook = init_write_only_output(options)
+    report = workbook[OUTPUT_TAB]
+    blocks = DiffBlocks.from_cache(cache, rte_route, target) if cache != None else None
+    compare_routes(report, rte_route, sm_route, mm_route, blocks)
+    save_report(workbook, output_path)
+    if blocks != None:
+        blocks.save(cache)
+    return report
+
+'''
+@BatchEntry: one line of the batch summary, fields follow BATCH_SUMMARY_HEADER
+'''
+BatchEntry = namedtuple('BatchEntry', ['workbook', 'route_id', 'product_id', 'rte_operations', 'sm_operations', 'mm_operations',
+                                       'orange_diffs', 'blue_diffs', 'elapsed', 'status', 'report'])
+
+'''
+returns true if the sheet holds anything beyond an empty A1, same test the macro uses to warn about unchecked MM data
+@param workbook: openpyxl workbook or SheetReader
+@param sheetname: sheet to check
+'''
+def has_sheet_data(workbook, sheetname):
+    if isinstance(workbook, SheetReader):
+        return workbook.has_data(sheetname)
+    sheet = workbook[sheetname]
+    return sheet.max_row > 1 or sheet.max_column > 1
+
+'''
+lists the route workbooks in a directory, skipping Excel lock files and reports from earlier batch runs
+@param input_dir: directory to scan
+@return: sorted list of workbook paths
+'''
+def find_workbooks(input_dir):
+    workbooks = []
+    for name in sorted(os.listdir(input_dir)):
+        if (name.lower().endswith(BATCH_EXTENSIONS) and not name.startswith('~$')
+                and not name.endswith(BATCH_REPORT_SUFFIX)):
+            workbooks.append(os.path.join(input_dir, name))
+    return workbooks
+
+'''
+batch pool entry point: compares the RTE/SM/MM sheets of one workbook and saves its report
+    the MM sheet is used whenever it holds data; failures are recorded in the entry's status
+    instead of raised, so one bad workbook doesn't stop the batch
+@param workbook_path: workbook holding the route sheets
+@param output_dir: directory the report is written to
+@param options: names of the extra verification sheets to add to the report
+@param cache: optional RouteCache
+@param reader: RAW_READER or OPENPYXL_READER
+@param lazy_mm: index the MM sheet and parse only the operations the neutralization check asks for
+@param output_format: one of REPORT_FORMATS
+@param spill: keep the routes' operation rows on disk instead of in memory
+@param ignored_columns: OUTPUT_HEADERS names left out of the compare
+@return: BatchEntry for the summary
+'''
+def compare_batch_workbook(workbook_path, output_dir, options=(), cache=None, reader=RAW_READER, lazy_mm=False, output_format=XLSX_FORMAT, spill=False,
+                           ignored_columns=()):
+    METRICS.reset()
+    start = time.perf_counter()
+    name = os.path.basename(workbook_path)
+    report_path = os.path.join(output_dir, os.path.splitext(name)[0] + BATCH_REPORT_NAME + REPORT_EXTENSIONS[output_format])
+    rte_route = sm_route = mm_route = None
+    report = None
+    try:
+        rte_route, sm_route, mm_route = load_routes_from_file(workbook_path, [RTE_SHEET, SM_SHEET, MM_SHEET], cache, optional_sheets=[MM_SHEET], reader=reader,
+                                                              lazy_sheets=[MM_SHEET] if lazy_mm else (), spill=spill, ignored_columns=ignored_columns)
+        
+        if rte_route == False:
+            status = 'INVALID RTE SHEET'
+        elif sm_route == False:
+            status = 'INVALID SM SHEET'
+        elif mm_route == False:
+            status = 'INVALID MM SHEET'
+        else:
+            target = get_blocks_target((workbook_path, SM_SHEET), (workbook_path, MM_SHEET) if mm_route != None else None)
+            report = write_compare_report(rte_route, sm_route, mm_route, report_path, options, cache, output_format, target)
+            status = 'OK'
+    except Exception as error:
+        status = 'ERROR: ' + repr(error)
+        LOGGER.exception('[X]%s failed', name)
+    flush_logs()
+    close_routes((rte_route, sm_route, mm_route))
+    
+    routes = [route if route else None for route in (rte_route, sm_route, mm_route)]
+    return BatchEntry(name,
+                      routes[0].get_route_id() if routes[0] else '',
+                      routes[0].get_product_id() if routes[0] else '',
+                      *[route.get_num_operations() if route else '' for route in routes],
+                      sum(report.orange_counts) if report != None else '',
+                      sum(report.blue_counts) if report != None else '',
+                      round(time.perf_counter() - start, 3),
+                      status,
+                      report_path if report != None else '')
+
+'''
+compares every route workbook in a directory with a bounded process pool, one workbook per task
+    writes one report per workbook plus BATCH_SUMMARY_FILE to output_dir
+@param input_dir: directory of .xlsm/.xlsx workbooks, each holding RTE/SM(/MM) sheets
+@param output_dir: directory for the reports and the summary, created if missing
+@param workers: maximum number of worker processes, defaults to the number of cores
+@param options: names of the extra verification sheets to add to each report
+@param cache: optional RouteCache shared by the workers
+@param reader: RAW_READER or OPENPYXL_READER
+@param lazy_mm: index each MM sheet and parse only the operations the neutralization check asks for
+@param output_format: one of REPORT_FORMATS
+@param spill: keep the routes' operation rows on disk instead of in memory
+@param ignored_columns: OUTPUT_HEADERS names left out of the compare
+@return: list of BatchEntries in workbook name order
+'''
+def run_batch(input_dir, output_dir, workers=None, options=(), cache=None, reader=RAW_READER, lazy_mm=False, output_format=XLSX_FORMAT, spill=False,
+              ignored_columns=()):
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    workbooks = find_workbooks(input_dir)
+    entries = []
+    if workbooks:
+        flush_logs()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [pool.submit(compare_batch_workbook, workbook_path, output_dir, options, cache, reader, lazy_mm, output_format, spill, ignored_columns)
+                       for workbook_path in workbooks]
+            for future in as_completed(futures):
+                entry = future.result()
+                LOGGER.info('[+]%s: %s (%ss)', entry.workbook, entry.status, entry.elapsed)
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry.workbook)
+    
+    with open(os.path.join(output_dir, BATCH_SUMMARY_FILE), 'w', newline='') as summary_file:
+        writer = csv.writer(summary_file)
+        writer.writerow(BATCH_SUMMARY_HEADER)
+        writer.writerows(entries)
+    return entries
+
+'''
+splits a one-vs-many target into its workbook and sheet
+@param target: 'workbook' or 'workbook::sheet'
+@return: (workbook path, sheet name), the sheet is SM_SHEET if the target doesn't name one
+'''
+def parse_target(target):
+    workbook_path, separator, sheetname = target.rpartition(TARGET_SEPARATOR)
+    if not separator:
+        return target, SM_SHEET
+    return workbook_path, sheetname
+
+'''
+returns the report path of each target, targets whose names would clash get a number appended
+@param targets: list of (workbook path, sheet name)
+@param output_dir: directory of the reports
+@param output_format: one of REPORT_FORMATS
+'''
+def get_target_report_paths(targets, output_dir, output_format):
+    paths = []
+    used = set()
+    for workbook_path, sheetname in targets:
+        name = os.path.splitext(os.path.basename(workbook_path))[0]
+        if sheetname != SM_SHEET:
+            name += '_' + sheetname.replace(' ', '_')
+        unique_name = name
+        count = 1
+        while unique_name.lower() in used:
+            count += 1
+            unique_name = name + '_' + str(count)
+        used.add(unique_name.lower())
+        paths.append(os.path.join(output_dir, unique_name + BATCH_REPORT_NAME + REPORT_EXTENSIONS[output_format]))
+    return paths
+
+#(RTE route, MM route) every target of a one-vs-many compare is compared against, set in each worker by set_reference_routes
+REFERENCE_ROUTES = None
+
+'''
+process pool initializer of compare_targets, keeps the reference routes for the worker's compare_target calls
+    the routes are sent once per worker instead of once per target
+'''
+def set_reference_routes(rte_route, mm_route):
+    global REFERENCE_ROUTES
+    REFERENCE_ROUTES = (rte_route, mm_route)
 
+'''
+compare_targets pool entry point: loads one target sheet and compares REFERENCE_ROUTES against it
+    failures are recorded in the entry's status instead of raised, like compare_batch_workbook
+@param target: target as given, shown in the summary
+@param workbook_path: workbook holding the target sheet
+@param sheetname: target sheet, compared as the SM route
+@param report_path: report to write
+@param options: names of the extra verification sheets to add to the report
+@param cache: optional RouteCache, the rendered differences are cached per target sheet
+@param reader: RAW_READER or OPENPYXL_READER
+@param output_format: one of REPORT_FORMATS
+@param spill: keep the target's operation rows on disk instead of in memory
+@param ignored_columns: OUTPUT_HEADERS names left out of the compare
+@param mm_path: workbook the reference MM route was read from, None if there isn't one
+@return: BatchEntry for the summary
+'''
+def compare_target(target, workbook_path, sheetname, report_path, options=(), cache=None, reader=RAW_READER, output_format=XLSX_FORMAT, spill=False,
+                   ignored_columns=(), mm_path=None):
+    METRICS.reset()
+    start = time.perf_counter()
+    rte_route, mm_route = REFERENCE_ROUTES
+    sm_route = None
+    report = None
+    try:
+        sm_route = load_route_from_file(workbook_path, sheetname, cache, reader, spill=spill, ignored_columns=ignored_columns)
+        if sm_route == False:
+            status = 'INVALID SM SHEET'
+        else:
+            blocks_target = get_blocks_target((workbook_path, sheetname), (mm_path, MM_SHEET) if mm_path != None else None)
+            report = write_compare_report(rte_route, sm_route, mm_route, report_path, options, cache, output_format, blocks_target)
+            status = 'OK'
+    except Exception as error:
+        status = 'ERROR: ' + repr(error)
+        LOGGER.exception('[X]%s failed', target)
+    flush_logs()
+    close_routes((sm_route,))
+    
+    return BatchEntry(target,
+                      rte_route.get_route_id(),
+                      rte_route.get_product_id(),
+                      rte_route.get_num_operations(),
+                      sm_route.get_num_operations() if sm_route else '',
+                      mm_route.get_num_operations() if mm_route else '',
+                      sum(report.orange_counts) if report != None else '',
+                      sum(report.blue_counts) if report != None else '',
+                      round(time.perf_counter() - start, 3),
+                      status,
+                      report_path if report != None else '')
 
-if rte_route == False:
-    homesheet.range('A4').value = 'INVALID RTE SHEET'
-    homesheet.range('A4').color = RED_RGB
-if sm_route == False:
-    homesheet.range('A5').value = 'INVALID SM SHEET'
-    homesheet.range('A5').color = RED_RGB
-if mm_route == False:
-    homesheet.range('A6').value = 'INVALID MM SHEET'
-    homesheet.range('A6').color = RED_RGB
+'''
+one-vs-many compare: parses the RTE (and MM) sheets once and compares them against several SM sheets
+    the reference routes are indexed once and handed to a bounded process pool that compares the targets
+    in parallel, writing one report per target plus TARGETS_SUMMARY_FILE to output_dir
+@param rte_path: workbook holding RTE_SHEET
+@param targets: list of 'workbook' or 'workbook::sheet' targets, see parse_target
+@param output_dir: directory for the reports and the summary, created if missing
+@param mm_path: workbook holding MM_SHEET, None to compare without MM neutralization
+@param workers: maximum number of worker processes, defaults to the number of cores
+@param options: names of the extra verification sheets to add to each report
+@param cache: optional RouteCache shared by the workers
+@param reader: RAW_READER or OPENPYXL_READER
+@param lazy_mm: index the MM sheet and parse only the operations the neutralization check asks for
+@param output_format: one of REPORT_FORMATS
+@param spill: keep the routes' operation rows on disk instead of in memory
+@param ignored_columns: OUTPUT_HEADERS names left out of the compare
+@return: list of BatchEntries in target order
+'''
+def compare_targets(rte_path, targets, output_dir, mm_path=None, workers=None, options=(), cache=None, reader=RAW_READER, lazy_mm=False,
+                    output_format=XLSX_FORMAT, spill=False, ignored_columns=()):
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    sources = [(rte_path, RTE_SHEET)]
+    if mm_path != None:
+        sources.append((mm_path, MM_SHEET))
+    routes = load_routes_parallel(sources, cache, reader, [MM_SHEET] if lazy_mm else [], spill, ignored_columns)
+    if mm_path == None:
+        routes.append(None)
+    rte_route, mm_route = routes
+    
+    target_sheets = [parse_target(target) for target in targets]
+    report_paths = get_target_report_paths(target_sheets, output_dir, output_format)
+    try:
+        if not check_routes(routes, sources):
+            status = 'INVALID RTE SHEET' if rte_route == False else 'INVALID MM SHEET'
+            entries = [BatchEntry(target, '', '', '', '', '', '', '', 0.0, status, '') for target in targets]
+        else:
+            for route in (rte_route, mm_route):
+                if route != None:
+                    route.build_index()
+            flush_logs()
+            with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(targets)), initializer=set_reference_routes,
+                                     initargs=(rte_route, mm_route)) as pool:
+                futures = [pool.submit(compare_target, target, workbook_path, sheetname, report_path, options, cache, reader, output_format, spill, ignored_columns, mm_path)
+                           for target, (workbook_path, sheetname), report_path in zip(targets, target_sheets, report_paths)]
+                entries = []
+                for future in futures:
+                    entry = future.result()
+                    LOGGER.info('[+]%s: %s (%ss)', entry.workbook, entry.status, entry.elapsed)
+                    entries.append(entry)
+    finally:
+        close_routes(routes)
+    
+    with open(os.path.join(output_dir, TARGETS_SUMMARY_FILE), 'w', newline='') as summary_file:
+        writer = csv.writer(summary_file)
+        writer.writerow(BATCH_SUMMARY_HEADER)
+        writer.writerows(entries)
+    return entries
 
+'''
+runs the compare as the Excel macro, reporting progress on the calling workbook's Home sheet
+'''
+def run_macro():
+    mainbook = xw.Book.caller()
+    sink = XlwingsSink(mainbook.sheets[HOME_SHEET], xw.Book, HOME_STATUS_RANGE, HOME_INPUT_RANGE)
+    run_compare_flow(sink, mainbook.fullname)
 
+'''
+the macro's compare flow: loads the routes of the workbook, compares them and saves the report
+    inputs are read from and progress is written to a StatusSink of the Home sheet
+@param sink: XlwingsSink of the calling workbook, or a MemorySink to run headless
+@param workbook_path: workbook holding the route sheets
+@param file_name: report path, by default generate_filename names it after the route and the user
+@return: path of the saved report, None if the routes couldn't be compared
+'''
+def run_compare_flow(sink, workbook_path, file_name=None):
+    METRICS.reset()
+    
+    if sink.read('I1'):
+        mmsheet = True
+    else:
+        mmsheet = False
+    
+    #load routes
+    sink.set_value('A3:A12', '')
+    sink.set_color('A3:A12', HOME_BLUE_RGB)
+    sink.set_value('A13', workbook_path)
+    sink.set_value(HOME_METRICS_CELL, '')
+    
+    sink.set_value('A3', 'Now loading routes.')
+    sink.flush()
+    
+    #RTE, SM (and MM) sheets are parsed side by side, each in its own process
+    #sheets that haven't changed since the last run come from the cache instead
+    cache = open_route_cache(MACRO_CACHE_DIR, ROUTE_CACHE_MB * 1024 * 1024)
+    if mmsheet:
+        rte_route, sm_route, mm_route = load_routes_parallel([(workbook_path, RTE_SHEET), (workbook_path, SM_SHEET), (workbook_path, MM_SHEET)], cache)
+    else:
+        rte_route, sm_route = load_routes_parallel([(workbook_path, RTE_SHEET), (workbook_path, SM_SHEET)], cache)
+    
+    sink.set_value('A4', 'Loaded RTE route.')
+    sink.set_value('A9', str(rte_route))
+    
+    sink.set_value('A5', 'Loaded SM route.')
+    sink.set_value('A10', str(sm_route))
+    
+    if mmsheet:
+        sink.set_value('A6', 'Loaded MM route.')
+        sink.set_value('A11', str(mm_route))
+    else:
+        mm_route = None
+        sink.set_value('A11', 'No MM metadata.')
+        workbook = SheetReader(workbook_path)
+    
+        if has_sheet_data(workbook, MM_SHEET):
+            sink.set_value('A6', 'WARNING: MM Data detected, but MM Sheet is not checked.')
+            sink.set_color('A6', ORANGE_WARNING_RGB)
+        else:
+            sink.set_value('A6', 'No MM Sheet read.')
+        workbook.close()
+    
+    
+    if rte_route == False:
+        sink.set_value('A4', 'INVALID RTE SHEET')
+        sink.set_color('A4', RED_RGB)
+    if sm_route == False:
+        sink.set_value('A5', 'INVALID SM SHEET')
+        sink.set_color('A5', RED_RGB)
+    if mm_route == False:
+        sink.set_value('A6', 'INVALID MM SHEET')
+        sink.set_color('A6', RED_RGB)
+    
+    
+    #compare routes
+    if any (flag == False for flag in [rte_route, sm_route, mm_route]):
+        sink.set_value('A7', 'UNABLE TO COMPARE ROUTES.')
+        sink.set_color('A7', RED_RGB)
+        sink.set_value('A8', 'Please check above cells identify error.')
+        file_name = None
+    else:
+        #prep output
+        options = get_output_options(sink)
+        output_workbook = init_write_only_output(options)
+        sink.set_value('A7', 'Now comparing routes...')
+        sink.flush()
+        blocks = DiffBlocks.from_cache(cache, rte_route, get_blocks_target((workbook_path, SM_SHEET), (workbook_path, MM_SHEET) if mmsheet else None))
+        compare_routes(output_workbook[OUTPUT_TAB], rte_route, sm_route, mm_route, blocks,
+                       progress=lambda done, total: sink.progress('A7', 'Now comparing routes... ' + str(done) + '/' + str(total)))
+        sink.set_value('A7', 'Routes compared.')
+        sink.set_value('A8', 'Comparison completed. Now saving report...')
+        sink.flush()
+        LOGGER.debug('Output options: %s', options)
+        
+        #save output
+        if file_name == None:
+            file_name = generate_filename(rte_route, sink.read('E17'))
+        save_report(output_workbook, file_name)
+        blocks.save(cache)
+        sink.open_report(file_name)
+    
+    LOGGER.info('Complete.')
+    sink.set_value('A12', 'Complete.')
+    sink.set_value(HOME_METRICS_CELL, METRICS.get_summary())
+    sink.flush()
+    return file_name
 
+'''
+runs the macro flow headless: the Home sheet inputs are read from the workbook on disk
+    and the status cells are kept in a MemorySink
+@param workbook_path: macro workbook holding the Home and route sheets
+@param file_name: report path
+@return: (report path or None, MemorySink holding the final status cells)
+'''
+def run_headless_macro(workbook_path, file_name):
+    sink = MemorySink.from_workbook(workbook_path, HOME_SHEET, HOME_STATUS_RANGE, HOME_INPUT_RANGE)
+    return run_compare_flow(sink, workbook_path, file_name), sink
 
+'''
+command line entry point
+    Excel's RunFrozenPython starts the exe with --wb=<workbook> --from_xl=1, which runs the macro;
+    anything else is parsed as a headless 'compare', 'macro' or 'batch' command
+@param argv: command line arguments, defaults to sys.argv[1:]
+@return: process exit code
+'''
+def main(argv=None):
+    if argv == None:
+        argv = sys.argv[1:]
+    
+    if any(arg.startswith('--from_xl') for arg in argv):
+        configure_logging()
+        run_macro()
+        return 0
+    
+    parser = argparse.ArgumentParser(description='Compare the RTE and SM route sheets of Flow Report workbooks and write the RTE-SM difference report.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    
+    compare_parser = commands.add_parser('compare', help='compare one set of route sheets')
+    compare_parser.add_argument('rte', help='workbook holding the \'' + RTE_SHEET + '\' sheet')
+    compare_parser.add_argument('sm', help='workbook holding the \'' + SM_SHEET + '\' sheet')
+    compare_parser.add_argument('--mm', help='workbook holding the \'' + MM_SHEET + '\' sheet, differences already in production are neutralized')
+    compare_parser.add_argument('-o', '--output', required=True, help='path of the report to write')
+    compare_parser.add_argument('--serial', action='store_true', help='load the route sheets one after another instead of in parallel')
+    compare_parser.add_argument('--pipeline', action='store_true',
+                                help='compare and write operations while the sheets are still being parsed; with --format csv/jsonl memory stays '
+                                     'bounded by the queue depth, an xlsx report still holds its rendered differences until it is saved')
+    
+    macro_parser = commands.add_parser('macro', help='run the Excel macro flow headless on a macro workbook, printing the Home sheet status')
+    macro_parser.add_argument('workbook', help='macro workbook holding the \'' + HOME_SHEET + '\' sheet and the route sheets')
+    macro_parser.add_argument('-o', '--output', required=True, help='path of the .xlsx report to write')
+    
+    batch_parser = commands.add_parser('batch', help='compare every route workbook in a directory')
+    batch_parser.add_argument('input_dir', help='directory of .xlsm/.xlsx workbooks, each holding RTE, SM and optionally MM sheets')
+    batch_parser.add_argument('-o', '--output', required=True, help='directory for the reports and ' + BATCH_SUMMARY_FILE)
+    batch_parser.add_argument('-j', '--workers', type=int, help='number of worker processes, defaults to the number of cores')
+    
+    targets_parser = commands.add_parser('targets', help='compare one RTE route against several SM workbooks or sheets, parsing the RTE once')
+    targets_parser.add_argument('rte', help='workbook holding the \'' + RTE_SHEET + '\' sheet')
+    targets_parser.add_argument('targets', nargs='+', metavar='target',
+                                help='workbook whose \'' + SM_SHEET + '\' sheet to compare, or workbook' + TARGET_SEPARATOR + 'sheet to compare another sheet')
+    targets_parser.add_argument('--mm', help='workbook holding the \'' + MM_SHEET + '\' sheet, differences already in production are neutralized')
+    targets_parser.add_argument('-o', '--output', required=True, help='directory for the reports and ' + TARGETS_SUMMARY_FILE)
+    targets_parser.add_argument('-j', '--workers', type=int, help='number of worker processes, defaults to the number of cores')
+    
+    for command_parser in (compare_parser, batch_parser, targets_parser):
+        command_parser.add_argument('--option', dest='options', action='append', default=[], help='extra verification tab to add to the report, can be repeated')
+        command_parser.add_argument('--cache', help='directory of the parsed route cache, unchanged workbooks load from it instead of being parsed')
+        command_parser.add_argument('--cache-size', type=int, default=ROUTE_CACHE_MB, help='size cap of the route cache in MB (default %(default)s)')
+        command_parser.add_argument('--reader', choices=SHEET_READERS, default=RAW_READER, help='sheet reader, the raw XML reader or openpyxl (default %(default)s)')
+        command_parser.add_argument('--lazy-mm', action='store_true', help='index the MM sheet and only parse the operations needed to neutralize differences')
+        command_parser.add_argument('--format', dest='output_format', choices=REPORT_FORMATS, default=XLSX_FORMAT,
+                                    help='report format: the styled workbook, or one CSV/JSON Lines record per highlighted cell (default %(default)s)')
+        command_parser.add_argument('--spill', action='store_true',
+                                    help='keep the parsed operation rows in temporary files instead of memory, for routes too big to fit (not cached)')
+        command_parser.add_argument('--ignore-column', dest='ignored_columns', action='append', default=[], choices=[header for header in OUTPUT_HEADERS if header != OPERATION_START], metavar='HEADER',
+                                    help='route column to leave out of the compare, e.g. \'Comments\', can be repeated (shown blank in the report)')
+    
+    for command_parser in (compare_parser, macro_parser, batch_parser, targets_parser):
+        command_parser.add_argument('-v', '--verbose', action='count', default=0, help='-v logs progress, -vv every operation compared (slower on big routes)')
+        command_parser.add_argument('--log-file', help='also append the log to this file, written in buffered batches')
+    compare_parser.add_argument('--metrics', help='write the phase timings and counters of the compare to this JSON file')
+    compare_parser.add_argument('--trace', help='write the phase timings as a Chrome trace (chrome://tracing, ui.perfetto.dev) to this file')
+    args = parser.parse_args(argv)
+    if args.command == 'compare' and args.pipeline and (args.serial or args.cache or args.lazy_mm or args.spill):
+        parser.error('--pipeline can\'t be combined with --serial, --cache, --lazy-mm or --spill')
+    
+    configure_logging(VERBOSITY_LEVELS[min(args.verbose, len(VERBOSITY_LEVELS) - 1)], args.log_file)
+    
+    if args.command == 'macro':
+        file_name, sink = run_headless_macro(args.workbook, args.output)
+        for row, (value,) in enumerate(sink.read_block(HOME_STATUS_RANGE)):
+            if has_value(value):
+                print('[+]A' + str(get_bounds(HOME_STATUS_RANGE)[1] + row) + ':', value)
+        return 0 if file_name != None else 1
+    
+    cache = open_route_cache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+    
+    if args.command == 'batch':
+        entries = run_batch(args.input_dir, args.output, workers=args.workers, options=args.options, cache=cache, reader=args.reader, lazy_mm=args.lazy_mm,
+                            output_format=args.output_format, spill=args.spill, ignored_columns=args.ignored_columns)
+        failed = [entry for entry in entries if entry.status != 'OK']
+        print('[+]Compared', len(entries) - len(failed), 'of', len(entries), 'workbooks, summary written to', os.path.join(args.output, BATCH_SUMMARY_FILE))
+        return 1 if failed else 0
+    
+    if args.command == 'targets':
+        entries = compare_targets(args.rte, args.targets, args.output, mm_path=args.mm, workers=args.workers, options=args.options, cache=cache, reader=args.reader,
+                                  lazy_mm=args.lazy_mm, output_format=args.output_format, spill=args.spill, ignored_columns=args.ignored_columns)
+        failed = [entry for entry in entries if entry.status != 'OK']
+        print('[+]Compared', len(entries) - len(failed), 'of', len(entries), 'targets, summary written to', os.path.join(args.output, TARGETS_SUMMARY_FILE))
+        return 1 if failed else 0
+    
+    result = compare_workbooks(args.rte, args.sm, args.output, mm_path=args.mm, options=args.options, parallel=not args.serial, cache=cache, reader=args.reader, lazy_mm=args.lazy_mm,
+                               output_format=args.output_format, pipeline=args.pipeline, spill=args.spill, ignored_columns=args.ignored_columns)
+    print('[+]' + METRICS.get_summary())
+    if args.metrics:
+        METRICS.write_json(args.metrics)
+    if args.trace:
+        METRICS.write_chrome_trace(args.trace)
+    if result.report == None:
+        print('[X]Unable to compare routes.')
+        return 1
+    
+    print('[+]Report written to', args.output)
+    return 0
 
 
-#compare routes
-if any (flag == False for flag in [rte_route, sm_route, mm_route]):
-    homesheet.range('A7').value = 'UNABLE TO COMPARE ROUTES.'
-    homesheet.range('A7').color = RED_RGB
-    homesheet.range('A8').value = 'Please check above cells identify error.'
-else:
-    #prep output
-    output_workbook = init_write_only_output()
-    output_worksheet = output_workbook[OUTPUT_TAB]  
-    homesheet.range('A7').value = 'Now comparing routes...'
-    compare_routes(rte_route, sm_route, mm_route)
-    homesheet.range('A8').value = 'Comparison completed. Now saving report...'
-    print(get_output_options())
-    save_output()
-    #save output
+# 'main' function area
 
-print('Complete.')
-homesheet.range('A12').value = 'Complete.'
\ No newline at end of file
+#Guarded so importing the module (and the loader's worker processes) never runs a compare
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
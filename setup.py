@@ -6,9 +6,13 @@
 # it is included in a zip file.
 #
 # Run the build process by running the command 'python setup.py build'
+# in an environment set up from requirements.txt (openpyxl is pinned to 2.4 there)
 #
 # If everything works well you should find a subdirectory in the build
 # subdirectory that contains the files needed to run the script without Python
+#
+# The workbook macro runs route_compare.exe through RunFrozenPython. The same exe
+# also runs headless compares from the command line, see 'route_compare.exe --help'
 
 from cx_Freeze import setup, Executable
 
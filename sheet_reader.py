@@ -0,0 +1,470 @@
+import hashlib
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from openpyxl.utils import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import from_excel, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+
+'''
+Streaming route sheet reader
+
+Reads a worksheet straight from the workbook's zip: the sheet XML is stream-parsed row by row
+(rows are cleared as soon as they are read), shared strings and styles are read once per workbook.
+No openpyxl cell objects are built, each row comes out as a tuple of values plus a bitmask of its fills,
+the same (values, flags) pair route_compare.OperationRow holds.
+
+Values follow openpyxl's read-only worksheet: formulas read as '=...', numbers as int/float,
+date formatted numbers as datetimes, booleans as bool. Fills follow route_compare.part_of_change:
+any fill colour other than the default '00000000' counts as part of change.
+'''
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+WORKBOOK_PART = 'xl/workbook.xml'
+WORKBOOK_RELS_PART = 'xl/_rels/workbook.xml.rels'
+SHARED_STRINGS_TYPE = '/sharedStrings'
+STYLES_TYPE = '/styles'
+DEFAULT_SHARED_STRINGS_PART = 'xl/sharedStrings.xml'
+DEFAULT_STYLES_PART = 'xl/styles.xml'
+
+ROW_TAG = MAIN_NS + 'row'
+CELL_TAG = MAIN_NS + 'c'
+VALUE_TAG = MAIN_NS + 'v'
+FORMULA_TAG = MAIN_NS + 'f'
+INLINE_TAG = MAIN_NS + 'is'
+TEXT_TAG = MAIN_NS + 't'
+RUN_TAG = MAIN_NS + 'r'
+SHARED_STRING_TAG = MAIN_NS + 'si'
+DIMENSION_TAG = MAIN_NS + 'dimension'
+SHEET_DATA_TAG = MAIN_NS + 'sheetData'
+
+#Bytes fed to the parser at a time when reading row ranges out of the sheet XML
+FEED_SIZE = 4 * 1024
+#Bytes read out of the zip at a time when scanning the sheet XML for row ranges
+SCAN_SIZE = 64 * 1024
+#Read size when hashing a zip member
+HASH_CHUNK_SIZE = 1024 * 1024
+
+NO_FILL_HEX = '00000000'
+RED = 'FFFF0000'
+
+#Row flag layout, shared with route_compare.OperationRow: bit 0 is the red removal fill, bit (n + 1) column n's change fill
+ROW_RED = 1
+
+#Per style flags
+STYLE_CHANGE = 1
+STYLE_RED = 2
+STYLE_DATE = 4
+
+'''
+returns the text of a shared string or inline string element, rich text runs joined together
+'''
+def text_content(element):
+    #Plain strings, by far the most common, are a single <t>
+    if len(element) == 1 and element[0].tag == TEXT_TAG:
+        return element[0].text or ''
+    text = element.findtext(TEXT_TAG) or ''
+    for run in element.iterfind(RUN_TAG):
+        text += run.findtext(TEXT_TAG) or ''
+    return text
+
+'''
+returns the style flags of one <fill> element
+    only pattern fills have a foreground colour; a theme, indexed or auto colour has no rgb value
+    and counts as part of change, same as reading cell.fill.fgColor.rgb through openpyxl
+'''
+def fill_flags(fill):
+    pattern = fill.find(MAIN_NS + 'patternFill')
+    if pattern == None:
+        return 0
+    color = pattern.find(MAIN_NS + 'fgColor')
+    if color == None:
+        return 0
+    if any(attribute in color.attrib for attribute in ('indexed', 'theme', 'auto')):
+        return STYLE_CHANGE
+    rgb = color.get('rgb', NO_FILL_HEX)
+    if rgb == NO_FILL_HEX:
+        return 0
+    if rgb == RED:
+        return STYLE_CHANGE | STYLE_RED
+    return STYLE_CHANGE
+
+class SheetReader():
+
+    '''
+    @path: workbook (.xlsx/.xlsm) to read
+    @sheet_parts: sheet name -> zip member of the sheet's XML, in workbook order
+    @shared_strings: shared string table, read on first use
+    @style_flags: cell style index (the 's' attribute) -> STYLE_* flags, read on first use
+    @dimensions: sheet name -> (max_row, max_column), read on first use
+    @tables_digest: digest of the shared strings, style flags and date system, computed on first use
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path)
+        self.shared_strings = None
+        self.style_flags = None
+        self.dimensions = {}
+        self.tables_digest = None
+        self.base_date = CALENDAR_WINDOWS_1900
+        self.sheet_parts = {}
+
+        relationships = {}
+        self.shared_strings_part = DEFAULT_SHARED_STRINGS_PART
+        self.styles_part = DEFAULT_STYLES_PART
+        for relationship in ET.fromstring(self.archive.read(WORKBOOK_RELS_PART)).iter(PACKAGE_REL_NS + 'Relationship'):
+            target = relationship.get('Target')
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join('xl', target))
+            relationships[relationship.get('Id')] = target
+            if relationship.get('Type').endswith(SHARED_STRINGS_TYPE):
+                self.shared_strings_part = target
+            elif relationship.get('Type').endswith(STYLES_TYPE):
+                self.styles_part = target
+
+        workbook = ET.fromstring(self.archive.read(WORKBOOK_PART))
+        properties = workbook.find(MAIN_NS + 'workbookPr')
+        if properties != None and properties.get('date1904') in ('1', 'true'):
+            self.base_date = CALENDAR_MAC_1904
+        for sheet in workbook.iter(MAIN_NS + 'sheet'):
+            self.sheet_parts[sheet.get('name')] = relationships[sheet.get(REL_NS + 'id')]
+
+    '''
+    returns the workbook's sheet names, in workbook order
+    '''
+    @property
+    def sheetnames(self):
+        return list(self.sheet_parts)
+
+    '''
+    closes the workbook's zip file
+    '''
+    def close(self):
+        self.archive.close()
+
+    '''
+    reads the shared string and style tables if they haven't been read yet
+    '''
+    def load_tables(self):
+        if self.shared_strings == None:
+            self.load_shared_strings()
+        if self.style_flags == None:
+            self.load_styles()
+
+    '''
+    reads the shared string table, one entry per <si> element
+    '''
+    def load_shared_strings(self):
+        self.shared_strings = []
+        if self.shared_strings_part not in self.archive.namelist():
+            return
+        with self.archive.open(self.shared_strings_part) as source:
+            for event, element in ET.iterparse(source):
+                if element.tag == SHARED_STRING_TAG:
+                    self.shared_strings.append(text_content(element).replace('x005F_', ''))
+                    element.clear()
+
+    '''
+    returns a sha256 hex digest of everything the sheet's rows are read from:
+        the sheet XML, the shared string table, the style flags and the date system
+        unlike a hash of the whole file, it stays the same when only other sheets or the workbook's
+        metadata change (as when Excel re-saves the workbook after an edit on another sheet)
+    @param sheetname: sheet to digest, a sheet the workbook doesn't have gets a digest of its own
+    '''
+    def get_sheet_digest(self, sheetname):
+        if self.tables_digest == None:
+            if self.style_flags == None:
+                self.load_styles()
+            tables = hashlib.sha256(repr((self.base_date, self.style_flags)).encode('utf-8'))
+            self.hash_part(tables, self.shared_strings_part)
+            self.tables_digest = tables.digest()
+
+        digest = hashlib.sha256(self.tables_digest)
+        if sheetname in self.sheet_parts:
+            self.hash_part(digest, self.sheet_parts[sheetname])
+        else:
+            digest.update(b'missing sheet')
+        return digest.hexdigest()
+
+    '''
+    feeds a zip member's uncompressed bytes to a hash, a missing member adds nothing
+    '''
+    def hash_part(self, digest, part):
+        if part not in self.archive.namelist():
+            return
+        with self.archive.open(part) as source:
+            for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+    '''
+    reads styles.xml into the style index -> flags table
+        each cellXfs entry gets the flags of its fill, plus STYLE_DATE if its number format is a date format
+    '''
+    def load_styles(self):
+        self.style_flags = []
+        if self.styles_part not in self.archive.namelist():
+            return
+        stylesheet = ET.fromstring(self.archive.read(self.styles_part))
+
+        number_formats = dict(BUILTIN_FORMATS)
+        for number_format in stylesheet.iter(MAIN_NS + 'numFmt'):
+            number_formats[int(number_format.get('numFmtId'))] = number_format.get('formatCode')
+
+        fills = []
+        fills_element = stylesheet.find(MAIN_NS + 'fills')
+        if fills_element != None:
+            fills = [fill_flags(fill) for fill in fills_element]
+
+        cell_xfs = stylesheet.find(MAIN_NS + 'cellXfs')
+        if cell_xfs == None:
+            return
+        for xf in cell_xfs:
+            fill_id = int(xf.get('fillId', 0))
+            flags = fills[fill_id] if fill_id < len(fills) else 0
+            if is_date_format(number_formats.get(int(xf.get('numFmtId', 0)), 'General')):
+                flags |= STYLE_DATE
+            self.style_flags.append(flags)
+
+    '''
+    returns the sheet's size from its <dimension> element, same as openpyxl's max_row/max_column
+        a sheet without one is scanned for its last row and column
+    @param sheetname: sheet to measure
+    @return: (max_row, max_column)
+    '''
+    def get_dimensions(self, sheetname):
+        if sheetname not in self.dimensions:
+            self.dimensions[sheetname] = self.read_dimensions(sheetname)
+        return self.dimensions[sheetname]
+
+    '''
+    reads a sheet's size, see get_dimensions
+    '''
+    def read_dimensions(self, sheetname):
+        with self.archive.open(self.sheet_parts[sheetname]) as source:
+            for event, element in ET.iterparse(source, events=('start',)):
+                if element.tag == DIMENSION_TAG:
+                    min_column, min_row, max_column, max_row = range_boundaries(element.get('ref'))
+                    return max_row, max_column
+                if element.tag == SHEET_DATA_TAG:
+                    break
+
+        #No <dimension>: the last row and each row's last cell give the size, no values are read
+        max_row = max_column = 0
+        for row_number, row in self.iter_sheet(sheetname):
+            cells = list(row)
+            if cells:
+                coordinate = cells[-1].get('r')
+                if coordinate != None:
+                    column = column_index_from_string(coordinate.rstrip('0123456789'))
+                else:
+                    column = len(cells)
+                max_column = max(max_column, column)
+            max_row = row_number
+        return max_row, max_column
+
+    '''
+    returns true if the sheet holds anything beyond an empty A1, same test as route_compare.has_sheet_data
+    '''
+    def has_data(self, sheetname):
+        max_row, max_column = self.get_dimensions(sheetname)
+        return max_row > 1 or max_column > 1
+
+    '''
+    yields every row of the sheet, padded the way openpyxl's read-only sheet.rows pads them:
+        missing rows come out empty and every row holds exactly max_column values
+    @param sheetname: sheet to read
+    @param value_columns: only the first value_columns values are read, later cells just add their fill flags
+    @param wanted: optional set of 0 based row indexes to convert, every other row comes out empty
+    @param skipped: optional set of 0 based columns whose values aren't decoded from row skip_from on,
+        they come out None but their fills still count
+    @param skip_from: 0 based index of the first row skipped applies to
+    @return: generator of (values, flags) pairs
+    '''
+    def iter_rows(self, sheetname, value_columns=None, wanted=None, skipped=None, skip_from=0):
+        max_row, max_column = self.get_dimensions(sheetname)
+        if value_columns == None or value_columns > max_column:
+            value_columns = max_column
+        empty_row = (None,) * value_columns
+        #Column letters repeat on every row, convert each one once
+        columns = {}
+        next_row = 1
+        for row_number, row in self.iter_sheet(sheetname):
+            if row_number > max_row:
+                break
+            for next_row in range(next_row, row_number):
+                yield empty_row, 0
+            if wanted == None or row_number - 1 in wanted:
+                values, flags = self.read_row(row, max_column, columns, value_columns, skipped if row_number > skip_from else None)
+                yield values + empty_row[len(values):], flags
+            else:
+                yield empty_row, 0
+            next_row = row_number + 1
+
+    '''
+    reads only the given row ranges in a single pass over the sheet XML, which is streamed out of the zip
+        and never held whole: the bytes between ranges are scanned for the next range's first <row> but not parsed,
+        and reading stops after the last range, so the cost follows the ranges and how far down the sheet they go
+    @param sheetname: sheet to read
+    @param ranges: sorted list of (first, last) 0 based row indexes, the first row of each range must be stored in the sheet
+    @return: dict of 0 based row index -> (values, flags) for the rows stored in the ranges,
+        or None if a range's first row can't be found by its r attribute (e.g. prefixed tags), iter_rows still reads those sheets
+    '''
+    def read_row_ranges(self, sheetname, ranges):
+        max_row, max_column = self.get_dimensions(sheetname)
+        self.load_tables()
+
+        empty_row = (None,) * max_column
+        columns = {}
+        rows = {}
+        with self.archive.open(self.sheet_parts[sheetname]) as source:
+
+            #Row XML is parsed inside a copy of the root tag, so every namespace the rows use stays declared
+            xml = b''
+            header_end = -1
+            while header_end < 0:
+                chunk = source.read(SCAN_SIZE)
+                if not chunk:
+                    return None
+                xml += chunk
+                root_start = xml.find(b'<worksheet')
+                if root_start >= 0:
+                    header_end = xml.find(b'>', root_start)
+            header = xml[:header_end + 1] + b'<sheetData>'
+            xml = xml[header_end + 1:]
+
+            for first, last in ranges:
+                marker = b'<row r="%d"' % (first + 1)
+                start = xml.find(marker)
+                while start < 0:
+                    #Only the tail the marker could begin in is kept while scanning
+                    xml = xml[max(0, len(xml) - len(marker) + 1):]
+                    chunk = source.read(SCAN_SIZE)
+                    if not chunk:
+                        return None
+                    xml += chunk
+                    start = xml.find(marker)
+
+                parser = ET.XMLPullParser(events=('end',))
+                parser.feed(header)
+                offset = start
+                reading = True
+                while reading:
+                    if offset == len(xml):
+                        chunk = source.read(SCAN_SIZE)
+                        if not chunk:
+                            break
+                        xml += chunk
+                    end = min(offset + FEED_SIZE, len(xml))
+                    parser.feed(xml[offset:end])
+                    offset = end
+                    for event, element in parser.read_events():
+                        if element.tag != ROW_TAG:
+                            continue
+                        if element.get('r') == None:
+                            return None
+                        row_number = int(element.get('r'))
+                        if row_number > last + 1 or row_number > max_row:
+                            reading = False
+                            break
+                        values, flags = self.read_row(element, max_column, columns)
+                        rows[row_number - 1] = (values + empty_row[len(values):], flags)
+                        element.clear()
+
+                #The next range starts after this one's first row, the bytes parsed since are scanned again
+                xml = xml[start + len(marker):]
+        return rows
+
+    '''
+    stream-parses the sheet XML, yielding each stored <row> element as soon as it is read
+        the element is cleared once the caller moves on to the next row
+    @param sheetname: sheet to read
+    @return: generator of (1 based row number, <row> element)
+    '''
+    def iter_sheet(self, sheetname):
+        self.load_tables()
+
+        row_counter = 0
+        sheet_data = None
+        with self.archive.open(self.sheet_parts[sheetname]) as source:
+            for event, element in ET.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+                if element.tag != ROW_TAG:
+                    continue
+
+                row_counter = int(element.get('r', row_counter + 1))
+                yield row_counter, element
+
+                #Drop the parsed row so memory stays flat however long the sheet is
+                element.clear()
+                if sheet_data != None:
+                    sheet_data.clear()
+
+    '''
+    converts one <row> element to its values and fill flags
+    @param row: <row> element
+    @param max_column: cells past this column are skipped, None reads them all
+    @param columns: column letters -> 0 based index memo
+    @param value_columns: cells past this column only add their fill flags, None reads every value
+    @param skipped: optional set of 0 based columns that only add their fill flags, their values come out None
+    @return: (values tuple, flags)
+    '''
+    def read_row(self, row, max_column, columns, value_columns=None, skipped=None):
+        shared_strings = self.shared_strings
+        style_flags = self.style_flags
+        values = []
+        flags = 0
+        column = -1
+        for cell in row.iter(CELL_TAG):
+            coordinate = cell.get('r')
+            if coordinate != None:
+                letters = coordinate.rstrip('0123456789')
+                column = columns.get(letters)
+                if column == None:
+                    column = columns[letters] = column_index_from_string(letters) - 1
+            else:
+                column += 1
+            if max_column != None and column >= max_column:
+                break
+
+            style = int(cell.get('s', 0))
+            style = style_flags[style] if style < len(style_flags) else 0
+            if style & STYLE_CHANGE:
+                flags |= 1 << (column + 1)
+                if style & STYLE_RED:
+                    flags |= ROW_RED
+            if value_columns != None and column >= value_columns:
+                continue
+            if skipped != None and column in skipped:
+                continue
+            if column > len(values):
+                values.extend([None] * (column - len(values)))
+
+            data_type = cell.get('t', 'n')
+            formula = cell.find(FORMULA_TAG)
+            if formula != None:
+                value = '=' + (formula.text or '')
+            elif data_type == 'inlineStr':
+                inline = cell.find(INLINE_TAG)
+                value = text_content(inline) if inline != None else None
+            else:
+                value = cell.findtext(VALUE_TAG) or None
+                if value == None:
+                    pass
+                elif data_type == 'n':
+                    value = float(value) if '.' in value or 'E' in value or 'e' in value else int(value)
+                    if style & STYLE_DATE:
+                        value = from_excel(value, self.base_date)
+                elif data_type == 's':
+                    value = shared_strings[int(value)]
+                elif data_type == 'b':
+                    value = value == '1'
+            values.append(value)
+        return tuple(values), flags
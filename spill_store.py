@@ -0,0 +1,125 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+from collections import OrderedDict
+
+'''
+On-disk store of operation rows
+
+Routes loaded in spill mode keep only an index of their operations in memory; the rows of each
+operation are pickled into a sqlite file of their own and read back when the operation is
+compared or rendered. The last few operations read are kept, so rendering one operation doesn't
+read it back more than once. A store pickles as its file path alone, so a route spilled by a
+loader process can be handed to the parent, which reopens the file.
+'''
+
+SPILL_PREFIX = 'route_spill_'
+SPILL_EXTENSION = '.sqlite'
+#Operations written per transaction while a route is built
+SPILL_BATCH_OPERATIONS = 500
+#Operations kept in memory after being read back
+SPILL_CACHE_OPERATIONS = 16
+
+class OperationStore():
+
+    '''
+    @path: sqlite file holding the rows, one record per operation
+    @connection: sqlite connection, opened on first use (and again after unpickling)
+    @pending: (record id, pickled rows) added but not written yet
+    @recent: record id -> rows of the last operations read, least recently used first
+    @count: number of records added, the next record id
+    '''
+    def __init__(self, directory=None):
+        handle, self.path = tempfile.mkstemp(prefix=SPILL_PREFIX, suffix=SPILL_EXTENSION, dir=directory)
+        os.close(handle)
+        self.connection = None
+        self.pending = []
+        self.recent = OrderedDict()
+        self.count = 0
+        with self.connect() as connection:
+            connection.execute('CREATE TABLE operations (id INTEGER PRIMARY KEY, rows BLOB)')
+
+    '''
+    returns the sqlite connection, opening it if needed
+        the file is scratch space, so writes aren't synced to disk
+    '''
+    def connect(self):
+        if self.connection == None:
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute('PRAGMA synchronous = OFF')
+        return self.connection
+
+    '''
+    adds the rows of an operation, they're written in batches of SPILL_BATCH_OPERATIONS
+    @param rows: picklable rows, normally a list of OperationRows
+    @return: int record id to read them back with
+    '''
+    def add(self, rows):
+        record_id = self.count
+        self.count += 1
+        self.pending.append((record_id, pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL)))
+        if len(self.pending) >= SPILL_BATCH_OPERATIONS:
+            self.flush()
+        return record_id
+
+    '''
+    writes the pending records in one transaction
+    '''
+    def flush(self):
+        if self.pending:
+            with self.connect() as connection:
+                connection.executemany('INSERT INTO operations VALUES (?, ?)', self.pending)
+            self.pending = []
+
+    '''
+    returns the rows of a record, from the recently read ones if possible
+    @param record_id: id returned by add
+    '''
+    def get(self, record_id):
+        rows = self.recent.get(record_id)
+        if rows != None:
+            self.recent.move_to_end(record_id)
+            return rows
+
+        self.flush()
+        blob, = self.connect().execute('SELECT rows FROM operations WHERE id = ?', (record_id,)).fetchone()
+        rows = pickle.loads(blob)
+        self.recent[record_id] = rows
+        if len(self.recent) > SPILL_CACHE_OPERATIONS:
+            self.recent.popitem(last=False)
+        return rows
+
+    '''
+    closes the connection, the store reopens it on the next get
+    '''
+    def close(self):
+        if self.connection != None:
+            self.connection.close()
+            self.connection = None
+
+    '''
+    closes the store and deletes its file, the store can't be used afterwards
+    '''
+    def remove(self):
+        self.close()
+        self.pending = []
+        self.recent = OrderedDict()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    '''
+    pickles as the file path, pending records are written first
+    '''
+    def __getstate__(self):
+        self.flush()
+        return {'path': self.path, 'count': self.count}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.count = state['count']
+        self.connection = None
+        self.pending = []
+        self.recent = OrderedDict()
@@ -0,0 +1,259 @@
+import time
+from openpyxl.utils import range_boundaries, get_column_letter
+from sheet_reader import SheetReader
+
+'''
+Home sheet status sinks
+
+The macro reports progress in a block of status cells on the Home sheet and reads its inputs
+(check boxes, labels) from the same sheet. Every single-cell read or write through xlwings is a
+COM round trip, so sinks keep a shadow copy of the status area: updates only change the shadow and
+flush() writes the whole area back as one 2D range write (plus one write per run of same-coloured
+cells). Inputs are read once as a single 2D block. progress() updates are throttled to one flush
+per PROGRESS_INTERVAL.
+
+XlwingsSink writes to the calling workbook, MemorySink keeps everything in memory so the macro flow
+runs (and can be timed) headless.
+'''
+
+#Seconds between two flushes caused by progress()
+PROGRESS_INTERVAL = 0.5
+
+'''
+returns (min_col, min_row, max_col, max_row) of a cell or range address, e.g. 'A3' or 'A3:A12'
+'''
+def get_bounds(address):
+    return range_boundaries(address if ':' in address else address + ':' + address)
+
+class StatusSink():
+
+    '''
+    base sink, subclasses implement read_block, write_values, write_color and open_report
+    @status_range: block of status cells, e.g. 'A3:A14', every write goes to a cell inside it
+    @input_range: block the inputs are read from, read once on the first read()
+    @values/@colors: shadow of the status area, one list per row
+    @dirty: the shadow changed since the last flush
+    @colors_dirty: a colour changed since the last flush, colours are only rewritten then
+    @inputs: the input range's values as a list of rows, None until the first read
+    @last_flush: perf_counter time of the last flush, None before the first one
+    @flushes: number of flushes that wrote to the sheet
+    '''
+    def __init__(self, status_range, input_range, interval=PROGRESS_INTERVAL):
+        self.status_range = status_range
+        self.input_range = input_range
+        self.interval = interval
+        self.bounds = get_bounds(status_range)
+        min_col, min_row, max_col, max_row = self.bounds
+        self.values = [[None] * (max_col - min_col + 1) for row in range(min_row, max_row + 1)]
+        self.colors = [[None] * (max_col - min_col + 1) for row in range(min_row, max_row + 1)]
+        self.dirty = False
+        self.colors_dirty = False
+        self.inputs = None
+        self.last_flush = None
+        self.flushes = 0
+
+    '''
+    yields the (row, column) shadow positions of every cell of an address inside the status area
+    '''
+    def locate(self, address):
+        min_col, min_row, max_col, max_row = get_bounds(address)
+        area_col, area_row, area_max_col, area_max_row = self.bounds
+        if min_col < area_col or min_row < area_row or max_col > area_max_col or max_row > area_max_row:
+            raise ValueError(address + ' is outside the status area ' + self.status_range)
+        for row in range(min_row, max_row + 1):
+            for column in range(min_col, max_col + 1):
+                yield row - area_row, column - area_col
+
+    '''
+    sets the value of a status cell (or every cell of a status range), written on the next flush
+    '''
+    def set_value(self, address, value):
+        for row, column in self.locate(address):
+            self.values[row][column] = value
+        self.dirty = True
+
+    '''
+    sets the fill colour of a status cell (or range) as an (r, g, b) tuple, written on the next flush
+    '''
+    def set_color(self, address, color):
+        for row, column in self.locate(address):
+            self.colors[row][column] = color
+        self.dirty = True
+        self.colors_dirty = True
+
+    '''
+    sets a status value and flushes only if the last flush is older than the progress interval
+        meant for updates that can come many times a second, e.g. an operation counter
+    '''
+    def progress(self, address, value):
+        self.set_value(address, value)
+        if self.last_flush == None or time.perf_counter() - self.last_flush >= self.interval:
+            self.flush()
+
+    '''
+    writes the status area to the sheet if anything changed since the last flush
+        values go out as one 2D range write, colours as one write per run of same-coloured cells
+    '''
+    def flush(self):
+        if not self.dirty:
+            return
+        self.write_values(self.status_range, [list(row) for row in self.values])
+        if self.colors_dirty:
+            #Cells never coloured keep whatever fill the sheet gives them
+            for address, color in self.get_color_runs():
+                if color != None:
+                    self.write_color(address, color)
+        self.dirty = False
+        self.colors_dirty = False
+        self.last_flush = time.perf_counter()
+        self.flushes += 1
+
+    '''
+    splits the status area's colours into column runs of the same colour
+    @return: list of (range address, color)
+    '''
+    def get_color_runs(self):
+        area_col, area_row = self.bounds[0], self.bounds[1]
+        runs = []
+        for column in range(len(self.colors[0])):
+            letter = get_column_letter(area_col + column)
+            start = 0
+            for row in range(1, len(self.colors) + 1):
+                if row == len(self.colors) or self.colors[row][column] != self.colors[start][column]:
+                    runs.append(('%s%d:%s%d' % (letter, area_row + start, letter, area_row + row - 1), self.colors[start][column]))
+                    start = row
+        return runs
+
+    '''
+    reads an input cell or range, served from a single read of the whole input block
+    @param address: cell ('I1') or range ('H2:H9') inside the input range
+    @return: the value for a cell, a list for a single row or column, a list of rows otherwise
+    '''
+    def read(self, address):
+        if self.inputs == None:
+            self.inputs = self.read_block(self.input_range)
+        input_col, input_row = get_bounds(self.input_range)[:2]
+        min_col, min_row, max_col, max_row = get_bounds(address)
+        rows = [row[min_col - input_col:max_col - input_col + 1] for row in self.inputs[min_row - input_row:max_row - input_row + 1]]
+        if min_col == max_col and min_row == max_row:
+            return rows[0][0]
+        elif min_col == max_col:
+            return [row[0] for row in rows]
+        elif min_row == max_row:
+            return rows[0]
+        return rows
+
+    '''
+    returns the values of a range as a list of rows
+    '''
+    def read_block(self, address):
+        raise NotImplementedError
+
+    '''
+    writes a list of rows to a range
+    '''
+    def write_values(self, address, rows):
+        raise NotImplementedError
+
+    '''
+    fills a range with an (r, g, b) colour
+    '''
+    def write_color(self, address, color):
+        raise NotImplementedError
+
+    '''
+    shows the finished report to the user
+    @param path: report file
+    '''
+    def open_report(self, path):
+        raise NotImplementedError
+
+class XlwingsSink(StatusSink):
+
+    '''
+    sink writing to a sheet of an open workbook through xlwings
+    @sheet: xlwings Sheet, normally the calling workbook's Home sheet
+    @book_class: xlwings Book, used to open the report
+    '''
+    def __init__(self, sheet, book_class, status_range, input_range, interval=PROGRESS_INTERVAL):
+        super(XlwingsSink, self).__init__(status_range, input_range, interval)
+        self.sheet = sheet
+        self.book_class = book_class
+
+    def read_block(self, address):
+        return self.sheet.range(address).options(ndim=2).value
+
+    def write_values(self, address, rows):
+        self.sheet.range(address).value = rows
+
+    def write_color(self, address, color):
+        self.sheet.range(address).color = color
+
+    def open_report(self, path):
+        self.book_class(path)
+
+class MemorySink(StatusSink):
+
+    '''
+    sink keeping the sheet in memory, for running the macro flow headless
+    @cells: address -> value of every cell written or given as an input
+    @cell_colors: address -> colour of every cell coloured
+    @writes: number of range writes that would have been COM round trips
+    @opened: reports passed to open_report
+    '''
+    def __init__(self, status_range, input_range, cells=None, interval=PROGRESS_INTERVAL):
+        super(MemorySink, self).__init__(status_range, input_range, interval)
+        self.cells = dict(cells) if cells != None else {}
+        self.cell_colors = {}
+        self.writes = 0
+        self.opened = []
+
+    '''
+    builds a sink whose inputs are the values of a sheet of a workbook on disk
+    @param path: workbook, e.g. the macro workbook
+    @param sheetname: sheet holding the inputs
+    '''
+    @classmethod
+    def from_workbook(cls, path, sheetname, status_range, input_range, interval=PROGRESS_INTERVAL):
+        min_col, min_row, max_col, max_row = get_bounds(input_range)
+        cells = {}
+        reader = SheetReader(path)
+        try:
+            for index, (values, flags) in enumerate(reader.iter_rows(sheetname, value_columns=max_col)):
+                if index + 1 > max_row:
+                    break
+                for column, value in enumerate(values):
+                    if value != None:
+                        cells[get_column_letter(column + 1) + str(index + 1)] = value
+        finally:
+            reader.close()
+        return cls(status_range, input_range, cells, interval)
+
+    '''
+    yields (address, row offset, column offset) for each cell of a range
+    '''
+    def iter_cells(self, address):
+        min_col, min_row, max_col, max_row = get_bounds(address)
+        for row in range(min_row, max_row + 1):
+            for column in range(min_col, max_col + 1):
+                yield get_column_letter(column) + str(row), row - min_row, column - min_col
+
+    def read_block(self, address):
+        min_col, min_row, max_col, max_row = get_bounds(address)
+        rows = [[None] * (max_col - min_col + 1) for row in range(min_row, max_row + 1)]
+        for cell, row, column in self.iter_cells(address):
+            rows[row][column] = self.cells.get(cell)
+        return rows
+
+    def write_values(self, address, rows):
+        self.writes += 1
+        for cell, row, column in self.iter_cells(address):
+            self.cells[cell] = rows[row][column]
+
+    def write_color(self, address, color):
+        self.writes += 1
+        for cell, row, column in self.iter_cells(address):
+            self.cell_colors[cell] = color
+
+    def open_report(self, path):
+        self.opened.append(path)
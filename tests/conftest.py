@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+
+#The modules live at the top of the repository, not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from openpyxl import Workbook
+import generate_routes as gen
+import route_compare as rc
+
+#Small enough to compare in well under a second, big enough for every kind of difference
+TEST_SETTINGS = gen.DEFAULT_SETTINGS._replace(operations=300, diff_density=0.1, inserted=0.02, removed=0.02, red_removals=0.02)
+
+'''
+returns a function writing a generated workbook to the test's tmp_path
+    make_workbook(settings=TEST_SETTINGS, edit=None, name='routes.xlsx') -> path
+    edit(rte, sm, mm) can change the generated routes before they are written, see gen.build_routes
+'''
+@pytest.fixture
+def make_workbook(tmp_path):
+    def make(settings=TEST_SETTINGS, edit=None, name='routes.xlsx'):
+        rte, sm, mm = gen.build_routes(settings)
+        if edit != None:
+            edit(rte, sm, mm)
+        workbook = Workbook(write_only=True)
+        home = workbook.create_sheet(rc.HOME_SHEET)
+        home.append(['Synthetic route workbook'])
+        sizes = {rc.HOME_SHEET: (1, 1)}
+        for sheetname, label, operations in [(rc.RTE_SHEET, rc.RTE_VALIDATION, rte), (rc.SM_SHEET, rc.SM_VALIDATION, sm), (rc.MM_SHEET, rc.MM_VALIDATION, mm)]:
+            sizes[sheetname] = (gen.write_route_sheet(workbook, sheetname, label, operations), rc.NUM_OUTPUT_COLS)
+        path = str(tmp_path / name)
+        workbook.save(path)
+        gen.add_dimensions(path, sizes)
+        return path
+    return make
+
+'''
+path of a generated workbook with the default test settings
+'''
+@pytest.fixture
+def workbook_path(make_workbook):
+    return make_workbook()
+
+'''
+returns a route's operations as plain data, (operation number, [(values, flags) per row]) in sheet order,
+    the same for Routes, LazyRoutes and SpilledRoutes holding the same rows
+'''
+def route_rows(route):
+    operations = route.get_operations() if isinstance(route, rc.LazyRoute) else route.operations
+    return [(operation_no, [(row.values, row.flags) for row in operation.rows]) for operation_no, operation in operations.items()]
+
+'''
+returns the cells of a saved .xlsx report's compare sheet as (value, fill color) rows
+'''
+def read_report(path):
+    sheet = rc.oxl.load_workbook(path)[rc.OUTPUT_TAB]
+    return [[(cell.value, cell.fill.fgColor.rgb) for cell in row] for row in sheet.iter_rows()]
+
+'''
+compares a workbook's routes against themselves and writes the report
+@param options: compare_workbooks options, the compare is serial unless they set parallel
+@return: path of the report, named after name
+'''
+def run_compare(path, tmp_path, output_format, name, **options):
+    output_path = str(tmp_path / (name + rc.REPORT_EXTENSIONS[output_format]))
+    options.setdefault('parallel', False)
+    result = rc.compare_workbooks(path, path, output_path, mm_path=path, output_format=output_format, **options)
+    assert result.report != None
+    return output_path
+
+'''
+checks a compare run with options writes the same CSV report as the plain serial compare
+'''
+def assert_same_csv(path, tmp_path, **options):
+    expected = run_compare(path, tmp_path, rc.CSV_FORMAT, 'serial')
+    actual = run_compare(path, tmp_path, rc.CSV_FORMAT, 'actual', **options)
+    with open(expected) as expected_file, open(actual) as actual_file:
+        expected_records = expected_file.read()
+        assert expected_records.count('\n') > 1
+        assert actual_file.read() == expected_records
+
+'''
+checks a compare run with options writes the same .xlsx report as the plain serial compare
+'''
+def assert_same_xlsx(path, tmp_path, **options):
+    expected = run_compare(path, tmp_path, rc.XLSX_FORMAT, 'serial')
+    actual = run_compare(path, tmp_path, rc.XLSX_FORMAT, 'actual', **options)
+    assert read_report(actual) == read_report(expected)
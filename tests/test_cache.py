@@ -0,0 +1,36 @@
+import route_compare as rc
+from conftest import TEST_SETTINGS
+from metrics import METRICS, BLOCKS_REUSED
+from route_cache import RouteCache
+
+
+def compare(rte_path, sm_path, output_path, cache):
+    rc.compare_workbooks(rte_path, sm_path, output_path, parallel=False, cache=cache)
+    return METRICS.counters.get(BLOCKS_REUSED, 0)
+
+
+def test_diff_blocks_are_kept_per_target(make_workbook, tmp_path):
+    path = make_workbook()
+    other_path = make_workbook(TEST_SETTINGS._replace(seed=2), name='other.xlsx')
+    cache = RouteCache(str(tmp_path / 'cache'))
+    output_path = str(tmp_path / 'report.xlsx')
+
+    assert compare(path, path, output_path, cache) == 0
+    reused = compare(path, path, output_path, cache)
+    assert reused > 0
+    #Comparing the same RTE route against another SM sheet doesn't replace the first target's blocks
+    compare(path, other_path, output_path, cache)
+    assert compare(path, path, output_path, cache) == reused
+
+
+def test_targets_keep_their_own_diff_blocks(make_workbook, tmp_path):
+    path = make_workbook()
+    other_path = make_workbook(TEST_SETTINGS._replace(seed=2), name='other.xlsx')
+    cache = RouteCache(str(tmp_path / 'cache'))
+    entries = rc.compare_targets(path, [path, other_path], str(tmp_path / 'reports'), mm_path=path, workers=1, cache=cache)
+    assert [entry.status for entry in entries] == ['OK', 'OK']
+
+    rte_route = rc.load_route_from_file(path, rc.RTE_SHEET)
+    for target_path in (path, other_path):
+        target = rc.get_blocks_target((target_path, rc.SM_SHEET), (path, rc.MM_SHEET))
+        assert rc.DiffBlocks.from_cache(cache, rte_route, target).previous
@@ -0,0 +1,67 @@
+import os
+import stat
+import pickle
+import tempfile
+
+import pytest
+
+import route_compare as rc
+from route_cache import RouteCache, get_user_cache_dir, is_private_directory
+
+
+def plant_entry(cache, key, value):
+    with open(cache.get_path(key), 'wb') as entry:
+        pickle.dump(value, entry)
+
+
+def test_new_cache_directory_is_private(tmp_path):
+    cache = RouteCache(str(tmp_path / 'cache'))
+    assert cache.trusted
+    assert os.stat(cache.directory).st_mode & 0o077 == 0
+    cache.put('key', 'value')
+    assert cache.get('key') == 'value'
+
+
+@pytest.mark.parametrize('mode', [0o770, 0o757, 0o777])
+def test_directory_writable_by_others_is_not_trusted(tmp_path, mode):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    os.chmod(str(directory), mode)
+    cache = RouteCache(str(directory))
+    plant_entry(cache, 'key', 'planted')
+    assert not cache.trusted
+    assert cache.get('key') == None
+    cache.put('other', 'value')
+    assert not os.path.exists(cache.get_path('other'))
+
+
+@pytest.mark.skipif(not hasattr(os, 'geteuid') or os.geteuid() != 0, reason='changing a directory\'s owner needs root')
+def test_directory_owned_by_someone_else_is_not_trusted(tmp_path):
+    directory = tmp_path / 'theirs'
+    directory.mkdir(mode=0o700)
+    os.chown(str(directory), 12345, 12345)
+    assert not RouteCache(str(directory)).trusted
+
+
+def test_symlinked_directory_is_not_trusted(tmp_path):
+    target = tmp_path / 'target'
+    target.mkdir(mode=0o700)
+    link = tmp_path / 'link'
+    link.symlink_to(target)
+    assert not is_private_directory(str(link))
+
+
+def test_macro_cache_is_per_user(monkeypatch, tmp_path):
+    assert not rc.MACRO_CACHE_DIR.startswith(tempfile.gettempdir())
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    if os.name != 'nt':
+        assert get_user_cache_dir('route_compare') == str(tmp_path / 'route_compare')
+
+
+def test_untrusted_cache_is_reported(tmp_path, caplog):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    os.chmod(str(directory), 0o777)
+    cache = rc.open_route_cache(str(directory), 1024)
+    assert not cache.trusted
+    assert 'not used' in caplog.text
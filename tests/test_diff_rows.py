@@ -0,0 +1,67 @@
+import random
+import difflib
+
+import pytest
+
+from route_compare import diff_rows
+
+
+'''
+length of the longest common subsequence, the number of rows a shortest edit script keeps
+'''
+def lcs_length(first, second):
+    previous = [0] * (len(second) + 1)
+    for item in first:
+        current = [0]
+        for index, other in enumerate(second):
+            current.append(previous[index] + 1 if item == other else max(previous[index + 1], current[index]))
+        previous = current
+    return previous[-1]
+
+
+'''
+checks the steps walk both sequences in order, once each, and that equal steps pair equal items
+@return: number of equal steps
+'''
+def check_script(steps, first, second):
+    rte_indexes = [rte_index for tag, rte_index, sm_index in steps if rte_index != None]
+    sm_indexes = [sm_index for tag, rte_index, sm_index in steps if sm_index != None]
+    assert rte_indexes == list(range(len(first)))
+    assert sm_indexes == list(range(len(second)))
+    equal = 0
+    for tag, rte_index, sm_index in steps:
+        if tag == 'equal':
+            assert first[rte_index] == second[sm_index]
+            equal += 1
+        elif tag == 'delete':
+            assert sm_index == None
+        else:
+            assert tag == 'insert' and rte_index == None
+    return equal
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_diff_rows_is_a_shortest_edit_script(seed):
+    rng = random.Random(seed)
+    alphabet = 'abcdef'[:rng.randint(1, 6)]
+    first = [rng.choice(alphabet) for _ in range(rng.randint(0, 25))]
+    if rng.random() < 0.5:
+        #Mostly equal sequences, like the rows of a changed operation
+        second = [item if rng.random() < 0.8 else rng.choice(alphabet) for item in first]
+        second[rng.randint(0, len(second)):0] = [rng.choice(alphabet) for _ in range(rng.randint(0, 3))]
+    else:
+        second = [rng.choice(alphabet) for _ in range(rng.randint(0, 25))]
+
+    equal = check_script(diff_rows(first, second), first, second)
+    assert equal == lcs_length(first, second)
+    #difflib's matching blocks are a valid alignment too, never a longer one
+    matcher = difflib.SequenceMatcher(None, first, second, autojunk=False)
+    assert equal >= sum(block.size for block in matcher.get_matching_blocks())
+
+
+def test_diff_rows_matches_difflib_on_single_edits():
+    first = [('row', index) for index in range(40)]
+    for second in (first[:10] + [('new', 0)] + first[10:], first[:10] + first[11:], first[:10] + [('new', 0)] + first[11:]):
+        steps = diff_rows(first, second)
+        opcodes = difflib.SequenceMatcher(None, first, second, autojunk=False).get_opcodes()
+        assert check_script(steps, first, second) == sum(i2 - i1 for tag, i1, i2, j1, j2 in opcodes if tag == 'equal')
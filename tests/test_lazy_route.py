@@ -0,0 +1,127 @@
+import zipfile
+
+import pytest
+import openpyxl as oxl
+from openpyxl.styles.fills import PatternFill
+
+import route_compare as rc
+from conftest import route_rows, assert_same_csv, assert_same_xlsx
+import sheet_reader
+from sheet_reader import SheetReader
+
+RED_FILL = PatternFill(patternType='solid', fgColor=rc.RED)
+
+
+'''
+writes a workbook whose MM sheet has red rows only a full read can tell apart:
+    a blank red row (ignored by Operation.add_row) and a red user data set row whose values
+    are all past the operation number column (flags its operation)
+@return: (path, operation number of the blank red row, operation number of the red user data set row)
+'''
+def make_red_row_workbook(make_workbook):
+    picked = {}
+    def edit(rte, sm, mm):
+        plain = [(operation_no, operation) for operation_no, operation in mm if len(operation.rows) > 1 and not operation.red]
+        picked['blank'], operation = plain[3]
+        operation.rows.append([None] * rc.NUM_OUTPUT_COLS)
+        picked['uds'] = plain[7][0]
+    path = make_workbook(edit=edit)
+
+    workbook = oxl.load_workbook(path)
+    sheet = workbook[rc.MM_SHEET]
+    starts = {sheet.cell(row=row, column=2).value: row for row in range(1, sheet.max_row + 1)}
+    #Last row of the operation with the blank row, and the first user data set row of the other one
+    blank_row = min(row for number, row in starts.items() if row > starts[picked['blank']]) - 1
+    uds_row = starts[picked['uds']] + 1
+    for row in (blank_row, uds_row):
+        for column in (1, 2, 3):
+            sheet.cell(row=row, column=column).fill = RED_FILL
+    workbook.save(path)
+    return path, picked['blank'], picked['uds']
+
+
+def test_lazy_index_skips_blank_red_rows(make_workbook):
+    path, blank_operation, uds_operation = make_red_row_workbook(make_workbook)
+
+    eager = rc.load_route_from_file(path, rc.MM_SHEET)
+    lazy = rc.load_route_from_file(path, rc.MM_SHEET, lazy=True)
+    assert isinstance(lazy, rc.LazyRoute)
+    assert blank_operation in eager.get_operation_nums()
+    assert uds_operation not in eager.get_operation_nums()
+    assert lazy.get_operation_nums() == eager.get_operation_nums()
+
+
+def test_lazy_and_eager_mm_reports_match(make_workbook, tmp_path):
+    path = make_red_row_workbook(make_workbook)[0]
+
+    reports = []
+    for lazy_mm in (False, True):
+        output_path = str(tmp_path / ('report_%s.csv' % lazy_mm))
+        rc.compare_workbooks(path, path, output_path, mm_path=path, parallel=False, lazy_mm=lazy_mm, output_format=rc.CSV_FORMAT)
+        with open(output_path) as report:
+            reports.append(report.read())
+    assert reports[0] == reports[1]
+
+
+@pytest.mark.parametrize('sheetname', [rc.RTE_SHEET, rc.MM_SHEET])
+def test_lazy_route_holds_the_parsed_rows(workbook_path, sheetname):
+    eager = rc.load_route_from_file(workbook_path, sheetname)
+    lazy = rc.load_route_from_file(workbook_path, sheetname, lazy=True)
+    assert route_rows(lazy) == route_rows(eager)
+
+
+def test_lazy_mm_compare_writes_the_same_reports(workbook_path, tmp_path):
+    assert_same_csv(workbook_path, tmp_path, lazy_mm=True)
+    assert_same_xlsx(workbook_path, tmp_path, lazy_mm=True)
+
+
+def read_ranges(path, ranges):
+    reader = SheetReader(path)
+    try:
+        return reader.read_row_ranges(rc.MM_SHEET, ranges)
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize('scan_size, feed_size', [(sheet_reader.SCAN_SIZE, sheet_reader.FEED_SIZE), (7, 5), (1, 3)])
+def test_row_ranges_match_iter_rows(workbook_path, monkeypatch, scan_size, feed_size):
+    monkeypatch.setattr(sheet_reader, 'SCAN_SIZE', scan_size)
+    monkeypatch.setattr(sheet_reader, 'FEED_SIZE', feed_size)
+    reader = SheetReader(workbook_path)
+    try:
+        all_rows = list(reader.iter_rows(rc.MM_SHEET))
+    finally:
+        reader.close()
+
+    #Adjacent ranges, a single row range and the sheet's last rows
+    ranges = [(11, 14), (15, 15), (40, 52), (len(all_rows) - 3, len(all_rows) - 1)]
+    rows = read_ranges(workbook_path, ranges)
+    wanted = [index for first, last in ranges for index in range(first, last + 1)]
+    assert sorted(rows) == wanted
+    assert all(rows[index] == all_rows[index] for index in wanted)
+
+
+def test_row_ranges_stop_after_the_last_range(workbook_path, monkeypatch):
+    read_sizes = []
+    open_member = zipfile.ZipFile.open
+    def counting_open(archive, name, *args, **kwargs):
+        member = open_member(archive, name, *args, **kwargs)
+        read_member = member.read
+        def read(size=-1):
+            data = read_member(size)
+            read_sizes.append(len(data))
+            return data
+        member.read = read
+        return member
+
+    reader = SheetReader(workbook_path)
+    try:
+        reader.load_tables()
+        monkeypatch.setattr(sheet_reader, 'SCAN_SIZE', 1024)
+        monkeypatch.setattr(zipfile.ZipFile, 'open', counting_open)
+        rows = reader.read_row_ranges(rc.MM_SHEET, [(11, 12)])
+        sheet_size = reader.archive.getinfo(reader.sheet_parts[rc.MM_SHEET]).file_size
+    finally:
+        reader.close()
+    assert sorted(rows) == [11, 12]
+    assert sum(read_sizes) < sheet_size / 4
@@ -0,0 +1,62 @@
+import datetime
+
+import pytest
+
+from route_compare import Operation, OperationRow
+
+
+def make_operation(*rows):
+    operation = Operation()
+    for values in rows:
+        operation.add_row(OperationRow(tuple(values), 0))
+    return operation
+
+
+'''
+the equality Operation had before digests: every cell compared with ==, None as '' and the comment cell ignored
+'''
+def cell_equal(operation, other):
+    def clean(operation):
+        return [['' if (row_count == 0 and cell_count == 0) or value == None else value for cell_count, value in enumerate(row.values)]
+                for row_count, row in enumerate(operation.rows)]
+    return clean(operation) == clean(other)
+
+
+@pytest.mark.parametrize('value, other_value', [
+    (True, 1),
+    (False, 0),
+    (1, 1.0),
+    (True, 1.0),
+    (-0.0, 0),
+    (10 ** 20, 1e20),
+    (None, ''),
+    ('1', 1),
+    ('True', True),
+    (1.5, '1.5'),
+    (2 ** 53 + 1, float(2 ** 53)),
+    (datetime.datetime(2020, 1, 1), datetime.datetime(2020, 1, 1)),
+    (datetime.datetime(2020, 1, 1), '2020-01-01 00:00:00'),
+])
+def test_equality_matches_cell_comparison(value, other_value):
+    operation = make_operation(['a', '1000.0000', value], [None, None, 'UDS', value])
+    other = make_operation(['b', '1000.0000', other_value], [None, None, 'UDS', other_value])
+    assert (operation == other) == cell_equal(operation, other)
+    assert (other == operation) == cell_equal(operation, other)
+
+
+def test_comment_cell_is_ignored():
+    assert make_operation(['comment', '1000.0000', 'x']) == make_operation([None, '1000.0000', 'x'])
+
+
+def test_row_count_matters():
+    assert make_operation(['', '1000.0000', 'x']) != make_operation(['', '1000.0000', 'x'], ['', '', 'y'])
+
+
+def test_equal_digests_are_confirmed_row_by_row():
+    operation = make_operation(['', '1000.0000', 'x'])
+    other = make_operation(['', '1000.0000', 'y'])
+    #A digest collision between different operations
+    other.digest = operation.get_digest()
+    assert operation != other
+    assert other != operation
+    assert operation == make_operation(['comment', '1000.0000', 'x'])
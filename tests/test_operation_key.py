@@ -0,0 +1,108 @@
+import csv
+from types import SimpleNamespace
+
+import pytest
+
+import route_compare as rc
+from route_compare import Operation, operation_key, keys_sorted, RouteCursor, RouteOrderError, merge_join, dict_join
+
+
+@pytest.mark.parametrize('operation_no, key', [
+    ('1234.5', 12345000),
+    ('1234.5000', 12345000),
+    (1234.5, 12345000),
+    ('0010.0000', 100000),
+    ('1000.0999999999', 10001000),
+    ('-1.5', -15000),
+    ('-1.0000', -10000),
+    ('1e3', 10000000),
+    (Operation.fix_operation_no('1e3'), 10000000),
+])
+def test_numeric_keys(operation_no, key):
+    assert operation_key(operation_no) == key
+
+
+@pytest.mark.parametrize('operation_no', ['10A', '10A.0000', '1.00005', '', '.0000', 'None.0000', 'nan', 'inf'])
+def test_non_numeric_keys_fall_back_to_text(operation_no):
+    assert operation_key(operation_no) == operation_no
+
+
+def test_five_decimals_keep_apart_from_four():
+    assert operation_key('1.00005') != operation_key('1.0000')
+
+
+def test_negative_keys_sort_numerically():
+    numbers = ['-2.0000', '-1.5000', '-1.0000', '-0.5000', '0.0000', '0.5000', '1.0000']
+    keys = [operation_key(operation_no) for operation_no in numbers]
+    assert keys == sorted(keys)
+
+
+def test_text_keys_are_never_sorted():
+    assert keys_sorted([(operation_key(number), number) for number in ['10.0000', '20.0000']])
+    assert not keys_sorted([(operation_key(number), number) for number in ['10.0000', '10A.0000', '20.0000']])
+
+
+def test_route_cursor_rejects_text_keys():
+    with pytest.raises(RouteOrderError):
+        RouteCursor(['10.0000', '10A.0000'], 'RTE').drain()
+
+
+def rename_operation(routes, operation_no, new_operation_no):
+    for route in routes:
+        for index, (number, operation) in enumerate(route):
+            if number == operation_no:
+                operation.rows[0][rc.COL_B] = new_operation_no
+                route[index] = (new_operation_no, operation)
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_compare_with_text_operation_numbers(make_workbook, tmp_path, pipeline):
+    def edit(rte, sm, mm):
+        operation_no, operation = rte[10]
+        rename_operation((rte, sm, mm), operation_no, '1000A')
+        operation.rows[0][8] = 'Changed description'
+        operation.changed.add((0, 8))
+    path = make_workbook(edit=edit)
+
+    output_path = str(tmp_path / 'report.csv')
+    result = rc.compare_workbooks(path, path, output_path, mm_path=path, parallel=False, output_format=rc.CSV_FORMAT, pipeline=pipeline)
+    assert result.report != None
+    with open(output_path, newline='') as report:
+        records = list(csv.reader(report))
+    assert ['1000A.0000', '1', rc.OUTPUT_HEADERS[8], 'Changed description'] in [record[:4] for record in records]
+
+
+def fake_route(numbers):
+    route = SimpleNamespace(operations={number: number for number in numbers})
+    return route, [(operation_key(number), number) for number in numbers]
+
+
+def joined(join, rte_numbers, sm_numbers):
+    rte_route, rte_keys = fake_route(rte_numbers)
+    sm_route, sm_keys = fake_route(sm_numbers)
+    return [(pair.kind, pair.rte, pair.sm) for pair in join(rte_route, rte_keys, sm_route, sm_keys)]
+
+
+@pytest.mark.parametrize('join', [merge_join, dict_join])
+def test_duplicate_keys_pair_in_order(join):
+    #'20.5', '20.5000' and '20.50' are different operation numbers with the same key
+    assert joined(join, ['10.0000', '20.5', '20.5000'], ['10.0000', '20.5', '20.50', '20.5000', '30.0000']) == [
+        (rc.MATCHED, '10.0000', '10.0000'),
+        (rc.MATCHED, '20.5', '20.5'),
+        (rc.MATCHED, '20.5000', '20.50'),
+        (rc.SM_ONLY, None, '20.5000'),
+        (rc.SM_ONLY, None, '30.0000'),
+    ]
+    assert joined(join, ['20.5', '20.50', '20.5000'], ['20.5']) == [
+        (rc.MATCHED, '20.5', '20.5'),
+        (rc.RTE_ONLY, '20.50', None),
+        (rc.RTE_ONLY, '20.5000', None),
+    ]
+
+
+def test_dict_join_keeps_extra_sm_duplicates_out_of_order():
+    assert joined(dict_join, ['30.0000', '20.5'], ['20.5', '20.50', '30.0000']) == [
+        (rc.SM_ONLY, None, '20.50'),
+        (rc.MATCHED, '30.0000', '30.0000'),
+        (rc.MATCHED, '20.5', '20.5'),
+    ]
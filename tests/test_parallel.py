@@ -0,0 +1,14 @@
+import route_compare as rc
+from conftest import route_rows, assert_same_csv
+
+
+def test_parallel_and_serial_loads_agree(workbook_path):
+    sheetnames = [rc.RTE_SHEET, rc.SM_SHEET, rc.MM_SHEET]
+    parallel = rc.load_routes_parallel([(workbook_path, sheetname) for sheetname in sheetnames])
+    serial = rc.load_routes_from_file(workbook_path, sheetnames)
+    assert [route_rows(route) for route in parallel] == [route_rows(route) for route in serial]
+    assert [route.get_route_id() for route in parallel] == [route.get_route_id() for route in serial]
+
+
+def test_parallel_compare_writes_the_same_csv(workbook_path, tmp_path):
+    assert_same_csv(workbook_path, tmp_path, parallel=True)
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+import route_compare as rc
+from conftest import assert_same_csv, assert_same_xlsx
+
+
+def swap_last_operations(rte, sm, mm):
+    rte[-1], rte[-2] = rte[-2], rte[-1]
+
+
+def sources(path):
+    return [(path, rc.RTE_SHEET), (path, rc.SM_SHEET), (path, rc.MM_SHEET)]
+
+
+def test_pipelined_compare_writes_the_same_reports(workbook_path, tmp_path):
+    assert_same_csv(workbook_path, tmp_path, pipeline=True)
+    assert_same_xlsx(workbook_path, tmp_path, pipeline=True)
+
+
+@pytest.mark.parametrize('output_format', [rc.CSV_FORMAT, rc.JSONL_FORMAT])
+def test_out_of_order_route_leaves_no_partial_report(make_workbook, tmp_path, output_format):
+    path = make_workbook(edit=swap_last_operations)
+    output_dir = tmp_path / 'reports'
+    output_dir.mkdir()
+    output_path = str(output_dir / ('report' + rc.REPORT_EXTENSIONS[output_format]))
+    with pytest.raises(rc.RouteOrderError):
+        rc.compare_workbooks_pipelined(sources(path), output_path, output_format=output_format)
+    assert os.listdir(str(output_dir)) == []
+
+
+def test_out_of_order_route_falls_back_to_the_full_compare(make_workbook, tmp_path):
+    path = make_workbook(edit=swap_last_operations)
+    expected_path = str(tmp_path / 'expected.csv')
+    output_path = str(tmp_path / 'report.csv')
+    rc.compare_workbooks(path, path, expected_path, mm_path=path, parallel=False, output_format=rc.CSV_FORMAT)
+    result = rc.compare_workbooks(path, path, output_path, mm_path=path, parallel=False, output_format=rc.CSV_FORMAT, pipeline=True)
+    assert result.report.path == output_path
+    with open(expected_path) as expected, open(output_path) as report:
+        assert report.read() == expected.read()
+    assert sorted(os.listdir(str(tmp_path))) == ['expected.csv', 'report.csv', 'routes.xlsx']
+
+
+def test_pipelined_report_is_renamed_into_place(workbook_path, tmp_path):
+    output_path = str(tmp_path / 'report.csv')
+    result = rc.compare_workbooks_pipelined(sources(workbook_path), output_path, output_format=rc.CSV_FORMAT)
+    assert result.report.path == output_path
+    assert sorted(os.listdir(str(tmp_path))) == ['report.csv', 'routes.xlsx']
@@ -0,0 +1,43 @@
+import route_compare as rc
+from route_compare import Operation, OperationDiff, OperationRow, prepare_diffs
+
+
+def make_operation(operation_no, value):
+    operation = Operation()
+    operation.add_row(OperationRow((None, operation_no, value), 0))
+    return operation
+
+
+def test_equal_records_pass_straight_through():
+    produced = []
+    def diffs():
+        for index in range(rc.DIFF_BATCH_OPERATIONS * 2):
+            produced.append(index)
+            yield OperationDiff(rc.EQUAL, index, None, None)
+    prepared = prepare_diffs(diffs())
+    assert next(prepared).key == 0
+    assert len(produced) == 1
+
+
+def test_differences_are_batched_in_order():
+    records = []
+    for index in range(rc.DIFF_BATCH_OPERATIONS + 10):
+        operation_no = '%d.0000' % (1000 + index)
+        if index % 3:
+            records.append(OperationDiff(rc.CHANGED, index, make_operation(operation_no, 'a'), make_operation(operation_no, 'b')))
+        else:
+            records.append(OperationDiff(rc.EQUAL, index, None, None))
+    prepared = list(prepare_diffs(iter(records)))
+    assert sorted(diff.key for diff in prepared) == [diff.key for diff in records]
+    differences = [diff for diff in prepared if diff.is_difference()]
+    assert [diff.key for diff in differences] == [diff.key for diff in records if diff.is_difference()]
+    assert all(diff.rows != None and diff.rows[0].changed == 1 << 2 for diff in differences)
+
+
+def test_pipelined_compare_does_not_batch(workbook_path, tmp_path, monkeypatch):
+    def no_batches(diffs):
+        raise AssertionError('the pipelined compare batched its differences')
+    monkeypatch.setattr(rc, 'prepare_diffs', no_batches)
+    result = rc.compare_workbooks(workbook_path, workbook_path, str(tmp_path / 'report.csv'), mm_path=workbook_path, parallel=False,
+                                  output_format=rc.CSV_FORMAT, pipeline=True)
+    assert result.report != None
@@ -0,0 +1,31 @@
+import openpyxl as oxl
+import pytest
+from openpyxl.utils import get_column_letter
+
+import route_compare as rc
+
+
+'''
+the merges ReportWorksheet.summary_rows asks for: every output column's RTE/SM pair, on each summary row
+'''
+def expected_merges():
+    return set('%s%d:%s%d' % (get_column_letter(index * 2 + 1), row, get_column_letter(index * 2 + 2), row)
+               for index in range(len(rc.OUTPUT_HEADERS)) for row in range(1, rc.HEADER_BUFFER + 1))
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_saved_report_has_merged_summary_rows(workbook_path, tmp_path, pipeline):
+    output_path = str(tmp_path / 'report.xlsx')
+    result = rc.compare_workbooks(workbook_path, workbook_path, output_path, mm_path=workbook_path, parallel=False, pipeline=pipeline,
+                                  options=['Verification'])
+    assert result.report != None
+
+    workbook = oxl.load_workbook(output_path)
+    assert workbook.sheetnames == [rc.OUTPUT_TAB, 'Verification']
+    sheet = workbook[rc.OUTPUT_TAB]
+    assert set(sheet.merged_cell_ranges) == expected_merges()
+    assert [sheet.cell(row=1, column=index * 2 + 1).value for index in range(len(rc.OUTPUT_HEADERS))] == rc.OUTPUT_HEADERS
+    assert sheet.cell(row=2, column=1).value.startswith('Orange: ')
+    assert sheet.cell(row=3, column=1).value.startswith('Blue: ')
+    #The merges don't push the body out of the sheet
+    assert sheet.max_row > rc.HEADER_BUFFER + 1
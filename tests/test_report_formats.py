@@ -0,0 +1,32 @@
+import csv
+import json
+
+import route_compare as rc
+from conftest import run_compare
+
+
+def test_csv_and_jsonl_hold_the_same_records(workbook_path, tmp_path):
+    csv_path = run_compare(workbook_path, tmp_path, rc.CSV_FORMAT, 'report')
+    jsonl_path = run_compare(workbook_path, tmp_path, rc.JSONL_FORMAT, 'report')
+    with open(csv_path, newline='') as report:
+        rows = list(csv.reader(report))
+    with open(jsonl_path) as report:
+        records = [json.loads(line) for line in report]
+
+    assert rows[0] == list(rc.DIFF_RECORD_HEADER)
+    assert len(rows) - 1 == len(records) > 0
+    for row, record in zip(rows[1:], records):
+        assert list(record) == list(rc.DiffRecord._fields)
+        assert row == ['' if value == None else str(value) for value in record.values()]
+        assert record['diff'] in (rc.ORANGE, rc.BLUE)
+
+
+def test_text_reports_count_the_same_cells_as_the_xlsx_report(workbook_path, tmp_path):
+    counts = []
+    for output_format in rc.REPORT_FORMATS:
+        output_path = str(tmp_path / ('report' + rc.REPORT_EXTENSIONS[output_format]))
+        report = rc.compare_workbooks(workbook_path, workbook_path, output_path, mm_path=workbook_path, parallel=False,
+                                      output_format=output_format).report
+        counts.append((report.orange_counts, report.blue_counts))
+    assert counts[0] == counts[1] == counts[2]
+    assert sum(counts[0][0]) + sum(counts[0][1]) > 0
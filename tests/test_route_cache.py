@@ -0,0 +1,69 @@
+import os
+
+import route_compare as rc
+from conftest import route_rows
+from metrics import METRICS
+from route_cache import RouteCache
+
+
+'''
+loads a route sheet through the cache
+@return: (route, True if it was parsed rather than read from the cache)
+'''
+def load(path, sheetname, cache, **options):
+    METRICS.reset()
+    route = rc.load_route_from_file(path, sheetname, cache, **options)
+    return route, 'load_route' in METRICS.get_phase_times()
+
+
+def test_unchanged_sheet_is_read_from_the_cache(workbook_path, tmp_path):
+    cache = RouteCache(str(tmp_path / 'cache'))
+    route, parsed = load(workbook_path, rc.RTE_SHEET, cache)
+    assert parsed
+    cached, parsed = load(workbook_path, rc.RTE_SHEET, cache)
+    assert not parsed
+    assert route_rows(cached) == route_rows(route)
+    assert cached.get_route_id() == route.get_route_id()
+
+
+def test_edited_sheet_is_parsed_again(make_workbook, tmp_path):
+    cache = RouteCache(str(tmp_path / 'cache'))
+    path = make_workbook()
+    route = load(path, rc.RTE_SHEET, cache)[0]
+    load(path, rc.SM_SHEET, cache)
+
+    #A number is stored in the sheet itself, the shared string table every sheet's key covers stays the same
+    def edit(rte, sm, mm):
+        rte[0][1].rows[0][27] = 12345.5
+    make_workbook(edit=edit)
+    edited, parsed = load(path, rc.RTE_SHEET, cache)
+    assert parsed
+    assert route_rows(edited) != route_rows(route)
+    assert next(iter(edited.operations.values())).rows[0].values[27] == 12345.5
+    #The other sheets of the workbook didn't change, they still come from the cache
+    assert not load(path, rc.SM_SHEET, cache)[1]
+
+
+def test_loader_options_and_parser_version_key_the_cache(workbook_path, tmp_path, monkeypatch):
+    cache = RouteCache(str(tmp_path / 'cache'))
+    load(workbook_path, rc.RTE_SHEET, cache)
+    assert load(workbook_path, rc.RTE_SHEET, cache, ignored_columns=('Comments',))[1]
+    assert not load(workbook_path, rc.RTE_SHEET, cache, ignored_columns=('Comments',))[1]
+    monkeypatch.setattr(rc, 'PARSER_VERSION', rc.PARSER_VERSION + 1)
+    assert load(workbook_path, rc.RTE_SHEET, cache)[1]
+
+
+def test_unreadable_entry_counts_as_a_miss(workbook_path, tmp_path):
+    cache = RouteCache(str(tmp_path / 'cache'))
+    load(workbook_path, rc.RTE_SHEET, cache)
+    for name in os.listdir(cache.directory):
+        with open(os.path.join(cache.directory, name), 'wb') as entry:
+            entry.write(b'not a pickle')
+    route, parsed = load(workbook_path, rc.RTE_SHEET, cache)
+    assert parsed and route.get_num_operations() > 0
+
+
+def test_cache_evicts_past_its_size_cap(workbook_path, tmp_path):
+    cache = RouteCache(str(tmp_path / 'cache'), max_bytes=1)
+    load(workbook_path, rc.RTE_SHEET, cache)
+    assert os.listdir(cache.directory) == []
@@ -0,0 +1,17 @@
+import pytest
+
+import route_compare as rc
+from conftest import route_rows, assert_same_csv
+
+
+@pytest.mark.parametrize('sheetname', [rc.RTE_SHEET, rc.SM_SHEET, rc.MM_SHEET])
+def test_raw_and_openpyxl_readers_agree(workbook_path, sheetname):
+    raw = rc.load_route_from_file(workbook_path, sheetname, reader=rc.RAW_READER)
+    openpyxl = rc.load_route_from_file(workbook_path, sheetname, reader=rc.OPENPYXL_READER)
+    assert raw.get_route_id() == openpyxl.get_route_id()
+    assert raw.get_product_id() == openpyxl.get_product_id()
+    assert route_rows(raw) == route_rows(openpyxl)
+
+
+def test_openpyxl_compare_writes_the_same_csv(workbook_path, tmp_path):
+    assert_same_csv(workbook_path, tmp_path, reader=rc.OPENPYXL_READER)
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+import route_compare as rc
+from conftest import route_rows, assert_same_csv, assert_same_xlsx
+
+
+@pytest.mark.parametrize('sheetname', [rc.RTE_SHEET, rc.MM_SHEET])
+def test_spilled_route_holds_the_parsed_rows(workbook_path, sheetname):
+    eager = rc.load_route_from_file(workbook_path, sheetname)
+    spilled = rc.load_route_from_file(workbook_path, sheetname, spill=True)
+    try:
+        assert route_rows(spilled) == route_rows(eager)
+    finally:
+        spilled.close()
+
+
+def test_spilled_compare_writes_the_same_reports(workbook_path, tmp_path):
+    assert_same_csv(workbook_path, tmp_path, spill=True)
+    assert_same_xlsx(workbook_path, tmp_path, spill=True)
+
+
+def test_closing_a_spilled_route_removes_its_store(workbook_path):
+    spilled = rc.load_route_from_file(workbook_path, rc.RTE_SHEET, spill=True)
+    assert os.path.exists(spilled.store.path)
+    spilled.close()
+    assert not os.path.exists(spilled.store.path)
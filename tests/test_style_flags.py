@@ -0,0 +1,56 @@
+import os
+
+import openpyxl as oxl
+import pytest
+from openpyxl.cell.read_only import ReadOnlyCell
+
+import route_compare as rc
+from conftest import ROOT, route_rows
+from sheet_reader import SheetReader, STYLE_CHANGE, STYLE_RED
+
+TEST_BOOK = os.path.join(ROOT, 'test-book.xlsm')
+
+
+@pytest.fixture
+def test_book():
+    workbook = oxl.load_workbook(TEST_BOOK, read_only=True)
+    yield workbook
+    workbook.close()
+
+
+def test_flag_table_matches_cell_fills(test_book):
+    style_flags = rc.get_style_flags(test_book)
+    assert len(style_flags) > 1
+    sheet = test_book[rc.HOME_SHEET]
+    for style_id, flags in enumerate(style_flags):
+        cell = ReadOnlyCell(sheet, 1, 1, None, 'n', style_id)
+        assert flags == rc.get_fill_flags(cell.fill), style_id
+
+
+def test_raw_reader_flags_match_openpyxl(test_book):
+    reader = SheetReader(TEST_BOOK)
+    try:
+        reader.load_styles()
+        assert [flags & (STYLE_CHANGE | STYLE_RED) for flags in reader.style_flags] == rc.get_style_flags(test_book)
+    finally:
+        reader.close()
+
+
+def test_rows_read_the_same_without_the_flag_table(test_book):
+    style_flags = rc.get_style_flags(test_book)
+    for row in test_book[rc.HOME_SHEET].rows:
+        with_table = rc.OperationRow.from_cells(row, style_flags)
+        without_table = rc.OperationRow.from_cells(row, None)
+        assert (with_table.values, with_table.flags) == (without_table.values, without_table.flags)
+
+
+def test_openpyxl_without_style_internals_falls_back_to_cell_fills(workbook_path, monkeypatch):
+    expected = rc.load_route_from_file(workbook_path, rc.RTE_SHEET, reader=rc.OPENPYXL_READER)
+    monkeypatch.delattr(ReadOnlyCell, '_style_id', raising=False)
+    assert rc.get_style_flags(oxl.Workbook()) == None
+    monkeypatch.undo()
+
+    monkeypatch.setattr(rc, 'get_style_flags', lambda workbook: None)
+    fallback = rc.load_route_from_file(workbook_path, rc.RTE_SHEET, reader=rc.OPENPYXL_READER)
+    assert route_rows(fallback) == route_rows(expected)
+    assert any(flags for operation_no, rows in route_rows(fallback) for values, flags in rows)